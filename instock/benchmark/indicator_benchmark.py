@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 在项目运行时，临时将项目路径添加到环境变量
+import os.path
+import sys
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
+
+import argparse
+import importlib
+import json
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import instock.core.indicator.registry as ireg
+import instock.core.indicator.calculate_indicator as idr
+from instock.core.indicator.incremental_indicator import (IndicatorEngine, INDICATOR_COLUMNS, finalize, panel_index,
+                                                          to_panel)
+from instock.core.indicator.cross_section import calculate_panel
+from instock.lib.frame_split import key_offsets, split_by_key
+from instock.benchmark.synthetic import generate_ohlcv
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 指标计算基准：在合成行情上离线计时各实现，报告吞吐（代码/秒）、峰值内存，
+# 并与参考结果（注册表逐代码计算，inf/NaN 填 0，即各作业 calculate_indicators 的口径）比较数值差异。
+# 可作为回归门禁：差异超过 --max-diff，或吞吐比 --baseline 下降超过 --max-slowdown 时退出码为 1。
+#
+#   python instock/benchmark/indicator_benchmark.py --codes 500 --days 250 --save bench.json
+#   python instock/benchmark/indicator_benchmark.py --baseline bench.json --max-slowdown 0.3
+
+# 各作业中的 calculate_indicators：前三个基于注册表，应与参考一致；realtime_indicators 用 ta 库，只计时
+JOB_MODULES = (
+    ('instock.job.indicators_data_daily', True),
+    ('instock.job.indicators_data_weekly', True),
+    ('instock.job.industry_data', True),
+    ('instock.job.realtime_indicators', False),
+)
+
+
+class Market:
+    """一份合成行情及其各种预处理形式（逐代码子表、右对齐矩阵），预处理不计入计时"""
+
+    def __init__(self, data):
+        self.data, codes, starts, ends = key_offsets(data, 'code_int')
+        self.n_codes = len(codes)
+        self.frames = split_by_key(self.data, 'code_int')
+        self.rows, self.cols, self.width = panel_index(starts, ends)
+        self.panels = [to_panel(self.data[col].to_numpy(dtype=np.float64), self.rows, self.cols,
+                                self.n_codes, self.width)
+                       for col in ('open', 'high', 'low', 'close', 'volume')]
+
+    def from_panel(self, values):
+        """(代码数, 天数) 的指标矩阵取回长表行顺序，inf/NaN 填 0"""
+        return pd.DataFrame({name: finalize(values[name][self.rows, self.cols]) for name in INDICATOR_COLUMNS},
+                            index=self.data.index)
+
+
+def reference(market):
+    """参考结果：注册表逐代码计算，K线不足 34 条的代码不计算（与 calculate_indicators 一致）"""
+    parts = [ireg.calculate(frame) for frame in market.frames.values() if len(frame) >= 34]
+    result = pd.concat(parts) if parts else pd.DataFrame(columns=list(INDICATOR_COLUMNS))
+    return result.replace([np.inf, -np.inf], np.nan).fillna(0)
+
+
+def run_get_indicators(market):
+    for frame in market.frames.values():
+        idr.get_indicators(frame, threshold=None)
+    return None
+
+
+def run_registry(market):
+    return reference(market)
+
+
+def job_case(calculate_indicators):
+    def run(market):
+        parts = [calculate_indicators(frame) for frame in market.frames.values() if len(frame) >= 34]
+        return pd.concat(parts) if parts else None
+    return run
+
+
+def run_cross_section(market):
+    return market.from_panel(calculate_panel(*market.panels))
+
+
+def run_incremental_replay(market):
+    return market.from_panel(IndicatorEngine(market.n_codes).replay(*market.panels))
+
+
+def incremental_step_case(market):
+    """增量引擎每天的实际开销：状态已回放到前一天，计时只推进最后一天"""
+    engine = IndicatorEngine(market.n_codes)
+    engine.replay(*(panel[:, :-1] for panel in market.panels))
+    last = market.cols == market.width - 1
+
+    def run(market):
+        mask = ~np.isnan(market.panels[3][:, -1])
+        values = engine.select(np.arange(market.n_codes)).step(*(panel[:, -1] for panel in market.panels), mask)
+        return pd.DataFrame({name: finalize(values[name][market.rows[last]]) for name in INDICATOR_COLUMNS},
+                            index=market.data.index[last])
+    return run
+
+
+def build_cases(market):
+    """[(名称, 函数, 是否与参考比较)]；依赖缺失、无法导入的作业跳过并提示"""
+    cases = [
+        ('calculate_indicator.get_indicators', run_get_indicators, False),
+        ('registry.calculate', run_registry, True),
+    ]
+    for module_name, comparable in JOB_MODULES:
+        try:
+            module = importlib.import_module(module_name)
+        except Exception as e:
+            print(f"⚠️ 跳过 {module_name}.calculate_indicators：{e}")
+            continue
+        cases.append((f"{module_name.rsplit('.', 1)[-1]}.calculate_indicators",
+                      job_case(module.calculate_indicators), comparable))
+    cases += [
+        ('cross_section.calculate_panel', run_cross_section, True),
+        ('IndicatorEngine.replay', run_incremental_replay, True),
+        ('IndicatorEngine.step (1 day)', incremental_step_case(market), True),
+    ]
+    return cases
+
+
+def max_diff(result, ref):
+    """共同行、共同指标列上的最大相对误差 |a-b| / max(1, |参考值|)"""
+    columns = [col for col in INDICATOR_COLUMNS if col in result.columns and col in ref.columns]
+    index = result.index.intersection(ref.index)
+    if not columns or index.empty:
+        return None
+    a = result.loc[index, columns].to_numpy(dtype=np.float64)
+    b = ref.loc[index, columns].to_numpy(dtype=np.float64)
+    return float(np.max(np.abs(a - b) / np.maximum(1.0, np.abs(b))))
+
+
+def measure(func, market, repeat):
+    """返回 (最短耗时秒, 峰值内存 MB, 结果)；峰值内存单独跑一次 tracemalloc 测量"""
+    result = None
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(market)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func(market)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak / 1024 ** 2, result
+
+
+def run_benchmark(n_codes=200, n_days=250, seed=0, repeat=3, only=None):
+    """生成行情并运行全部（或名称包含 only 的）用例，返回结果字典列表"""
+    market = Market(generate_ohlcv(n_codes, n_days, seed=seed))
+    print(f"合成行情：{market.n_codes} 个代码 × {n_days} 天，共 {len(market.data)} 条K线")
+    ref = reference(market)
+
+    results = []
+    for name, func, comparable in build_cases(market):
+        if only and only not in name:
+            continue
+        seconds, peak_mb, result = measure(func, market, repeat)
+        diff = max_diff(result, ref) if comparable and result is not None else None
+        results.append({'case': name, 'codes': market.n_codes, 'days': n_days, 'seconds': seconds,
+                        'codes_per_s': market.n_codes / seconds if seconds > 0 else float('inf'),
+                        'peak_mb': peak_mb, 'max_diff': diff})
+    return results
+
+
+def report(results):
+    print(f"{'用例':<44}{'耗时(s)':>10}{'代码/秒':>12}{'峰值(MB)':>11}{'最大误差':>12}")
+    for r in results:
+        diff = '-' if r['max_diff'] is None else f"{r['max_diff']:.2e}"
+        print(f"{r['case']:<44}{r['seconds']:>10.3f}{r['codes_per_s']:>12.0f}{r['peak_mb']:>11.1f}{diff:>12}")
+
+
+def check(results, max_diff_allowed, baseline=None, max_slowdown=None):
+    """回归门禁：返回失败原因列表"""
+    failures = [f"{r['case']} 最大误差 {r['max_diff']:.2e} 超过 {max_diff_allowed:.0e}"
+                for r in results if r['max_diff'] is not None and r['max_diff'] > max_diff_allowed]
+    if baseline and max_slowdown is not None:
+        previous = {r['case']: r for r in baseline}
+        for r in results:
+            base = previous.get(r['case'])
+            if base and r['codes_per_s'] < base['codes_per_s'] * (1 - max_slowdown):
+                failures.append(f"{r['case']} 吞吐 {r['codes_per_s']:.0f} 代码/秒，"
+                                f"低于基线 {base['codes_per_s']:.0f} 的 {1 - max_slowdown:.0%}")
+    return failures
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='指标计算基准（合成行情，离线运行）')
+    parser.add_argument('--codes', type=int, default=200, help='代码数')
+    parser.add_argument('--days', type=int, default=250, help='交易日数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--repeat', type=int, default=3, help='每个用例重复次数（取最短耗时）')
+    parser.add_argument('--only', help='只运行名称包含该字符串的用例')
+    parser.add_argument('--max-diff', type=float, default=1e-6, help='与参考结果允许的最大相对误差')
+    parser.add_argument('--save', help='结果保存为 JSON，可作为后续运行的基线')
+    parser.add_argument('--baseline', help='基线 JSON（--save 的输出）')
+    parser.add_argument('--max-slowdown', type=float, default=0.3, help='相对基线允许的吞吐下降比例')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    results = run_benchmark(args.codes, args.days, seed=args.seed, repeat=args.repeat, only=args.only)
+    report(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    failures = check(results, args.max_diff, baseline, args.max_slowdown)
+    for failure in failures:
+        print(f"❌ {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
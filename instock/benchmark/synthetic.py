@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 可复现的合成日线行情：N 个代码 × M 个交易日，离线生成，不依赖数据库。
+# 除随机游走外专门构造实盘里容易出问题的K线：
+#   停牌：连续若干天没有K线（该代码缺行）；
+#   涨停/跌停：收盘价按 ±10% 封板，部分为一字板（开高低收相同）；
+#   零成交：成交量、成交额为 0，价格持平。
+
+
+def generate_ohlcv(n_codes, n_days, seed=0, start='2020-01-02', suspend_prob=0.002, suspend_days=(1, 20),
+                   limit_prob=0.01, flat_limit_ratio=0.3, zero_volume_prob=0.003, limit_ratio=0.1):
+    """
+    生成长表（按 code_int、date 升序），列为 date, date_int, code, code_int, name, open, close, high, low,
+    volume, amount, p_change，与K线表和 get_indicators 的输入一致。
+    suspend_prob 为每天开始停牌的概率，停牌天数在 suspend_days 区间内均匀抽取；
+    limit_prob 为每天涨停或跌停的概率，其中 flat_limit_ratio 比例为一字板；zero_volume_prob 为零成交的概率。
+    同样的参数和 seed 总是生成同样的数据。
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start=start, periods=n_days)
+    shape = (n_codes, n_days)
+
+    # 收益率：随机游走，叠加涨跌停
+    returns = rng.normal(0.0003, 0.02, shape).clip(-limit_ratio * 0.95, limit_ratio * 0.95)
+    limit = rng.random(shape) < limit_prob
+    limit_up = limit & (rng.random(shape) < 0.5)
+    returns = np.where(limit, np.where(limit_up, limit_ratio, -limit_ratio), returns)
+    zero_volume = (rng.random(shape) < zero_volume_prob) & ~limit
+    returns = np.where(zero_volume, 0.0, returns)
+
+    base = rng.uniform(3, 100, (n_codes, 1))
+    close = np.round(base * np.cumprod(1 + returns, axis=1), 2)
+    prev_close = np.concatenate([np.round(base, 2), close[:, :-1]], axis=1)
+
+    # 开盘价在昨收附近，最高/最低包住开盘与收盘
+    open_ = np.round(prev_close * (1 + rng.normal(0, 0.008, shape)), 2)
+    span = np.abs(rng.normal(0, 0.012, shape)) * prev_close
+    high = np.round(np.maximum(open_, close) + span * rng.random(shape), 2)
+    low = np.round(np.minimum(open_, close) - span * rng.random(shape), 2)
+
+    # 涨停收在最高价、跌停收在最低价；一字板与零成交日开高低收相同
+    high = np.where(limit_up, close, high)
+    low = np.where(limit & ~limit_up, close, low)
+    flat = (limit & (rng.random(shape) < flat_limit_ratio)) | zero_volume
+    open_ = np.where(flat, close, open_)
+    high = np.where(flat, close, np.maximum(high, open_))
+    low = np.where(flat, close, np.minimum(low, open_))
+
+    volume = np.round(rng.lognormal(10, 0.8, shape))
+    volume = np.where(zero_volume, 0.0, np.where(flat, np.round(volume * 0.05), volume))
+    amount = np.round(volume * (high + low + close) / 3 * 100, 2)  # 成交量单位为手
+    p_change = np.round((close / prev_close - 1) * 100, 2)
+
+    # 停牌：从某天起连续若干天没有K线
+    traded = np.ones(shape, dtype=bool)
+    for code, day in zip(*np.nonzero(rng.random(shape) < suspend_prob)):
+        traded[code, day:day + rng.integers(suspend_days[0], suspend_days[1] + 1)] = False
+
+    codes_idx, days_idx = np.nonzero(traded)
+    code_int = codes_idx + 1
+    code = np.char.zfill((code_int).astype(str), 6)
+    return pd.DataFrame({
+        'date': days.date[days_idx],
+        'date_int': days.strftime('%Y%m%d').astype(np.int64)[days_idx],
+        'code': code,
+        'code_int': code_int,
+        'name': np.char.add('合成', code),
+        'open': open_[traded],
+        'close': close[traded],
+        'high': high[traded],
+        'low': low[traded],
+        'volume': volume[traded],
+        'amount': amount[traded],
+        'p_change': p_change[traded],
+    })
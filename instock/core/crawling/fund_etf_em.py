@@ -9,6 +9,7 @@ https://quote.eastmoney.com/sh513500.html
 from functools import lru_cache
 import pandas as pd
 import requests
+import instock.lib.http_session as http_session
 import logging
 
 # 配置日志记录
@@ -40,7 +41,7 @@ def fund_etf_spot_em() -> pd.DataFrame:
     }
     try:
         # 发送第一次请求获取总数据量和 page_size
-        r = requests.get(url, params=params)
+        r = http_session.get(url, params=params)
         r.raise_for_status()
         data_json = r.json()
         total = data_json["data"]["total"]
@@ -52,7 +53,7 @@ def fund_etf_spot_em() -> pd.DataFrame:
         for page in range(1, total_pages + 1):
             params["pn"] = str(page)
             params["pz"] = str(page_size)
-            r = requests.get(url, params=params)
+            r = http_session.get(url, params=params)
             r.raise_for_status()
             data_json = r.json()
             if data_json["data"]["diff"]:
@@ -140,7 +141,7 @@ def _fund_etf_code_id_map_em() -> dict:
     }
     try:
         # 发送第一次请求获取总数据量和 page_size
-        r = requests.get(url, params=params)
+        r = http_session.get(url, params=params)
         r.raise_for_status()
         data_json = r.json()
         total = data_json["data"]["total"]
@@ -152,7 +153,7 @@ def _fund_etf_code_id_map_em() -> dict:
         for page in range(1, total_pages + 1):
             params["pn"] = str(page)
             params["pz"] = str(page_size)
-            r = requests.get(url, params=params)
+            r = http_session.get(url, params=params)
             r.raise_for_status()
             data_json = r.json()
             if data_json["data"]["diff"]:
@@ -215,7 +216,7 @@ def fund_etf_hist_em(
     }
     try:
         # logging.info(f"请求 {symbol} 历史数据，参数：{params}")
-        r = requests.get(url, params=params)
+        r = http_session.get(url, params=params)
         r.raise_for_status()
         data_json = r.json()
         if not (data_json["data"] and data_json["data"]["klines"]):
@@ -281,7 +282,7 @@ def fund_etf_hist_min_em(
         }
         try:
             logging.info(f"请求 {symbol} 1 分钟历史数据，参数：{params}")
-            r = requests.get(url, params=params)
+            r = http_session.get(url, params=params)
             r.raise_for_status()
             data_json = r.json()
             temp_df = pd.DataFrame(
@@ -328,7 +329,7 @@ def fund_etf_hist_min_em(
         }
         try:
             logging.info(f"请求 {symbol} {period} 分钟历史数据，参数：{params}")
-            r = requests.get(url, params=params)
+            r = http_session.get(url, params=params)
             r.raise_for_status()
             data_json = r.json()
             # 检查 data 和 klines 是否存在
@@ -2,7 +2,7 @@
 # !/usr/bin/env python
 
 import pandas as pd
-import requests
+import instock.lib.http_session as http_session
 import instock.core.tablestructure as tbs
 
 __author__ = 'myh '
@@ -26,7 +26,7 @@ def stock_cpbd_em(symbol: str = "688041") -> pd.DataFrame:
         symbol = f"SZ{symbol}"
     params = {"code": symbol}
 
-    r = requests.get(url, params=params)
+    r = http_session.get(url, params=params)
     data_json = r.json()
     zxzb = data_json["zxzb"]  # 主要指标
     if len(zxzb) < 1:
@@ -124,7 +124,7 @@ def stock_zjlx_em(symbol: str = "688041") -> pd.DataFrame:
         "secid": symbol
     }
 
-    r = requests.get(url, params=params)
+    r = http_session.get(url, params=params)
     data_json = r.json()
     klines = data_json["klines"]  # 主要指标
     "日期","主力净流入额","小单净流入额","中单净流入额","大单净流入额","超大单净流入额","主力净流入占比", "小单净流入占比", "中单净流入占比", "大单净流入占比", "超大单净流入占比"
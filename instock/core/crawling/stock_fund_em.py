@@ -10,7 +10,7 @@ import time
 from functools import lru_cache
 
 import pandas as pd
-import requests
+import instock.lib.http_session as http_session
 
 __author__ = 'myh '
 __date__ = '2023/6/12 '
@@ -56,7 +56,7 @@ def stock_individual_fund_flow_rank(indicator: str = "5日") -> pd.DataFrame:
         "fs": "m:0+t:6+f:!2,m:0+t:13+f:!2,m:0+t:80+f:!2,m:1+t:2+f:!2,m:1+t:23+f:!2,m:0+t:7+f:!2,m:1+t:3+f:!2",
         "fields": indicator_map[indicator][1],
     }
-    r = requests.get(url, params=params)
+    r = http_session.get(url, params=params)
     data_json = r.json()
     temp_df = pd.DataFrame(data_json["data"]["diff"])
     temp_df = temp_df[~temp_df["f2"].isin(["-"])]
@@ -271,7 +271,7 @@ def stock_sector_fund_flow_rank(
         "cb": "jQuery18308357908311220152_1589256588824",
         "_": int(time.time() * 1000),
     }
-    r = requests.get(url, params=params, headers=headers)
+    r = http_session.get(url, params=params, headers=headers)
     text_data = r.text
     json_data = json.loads(text_data[text_data.find("{") : -2])
     temp_df = pd.DataFrame(json_data["data"]["diff"])
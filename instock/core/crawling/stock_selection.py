@@ -3,7 +3,7 @@
 
 import math
 import pandas as pd
-import requests
+import instock.lib.http_session as http_session
 import instock.core.tablestructure as tbs
 
 __author__ = 'myh '
@@ -33,7 +33,7 @@ def stock_selection() -> pd.DataFrame:
         "source": "SELECT_SECURITIES",
         "client": "WEB"
     }
-    r = requests.get(url, params=params)
+    r = http_session.get(url, params=params)
     data_json = r.json()
     data = data_json["result"]["data"]
     if not data:
@@ -44,7 +44,7 @@ def stock_selection() -> pd.DataFrame:
     while page_count > 1:
         page_current = page_current + 1
         params["p"] = page_current
-        r = requests.get(url, params=params)
+        r = http_session.get(url, params=params)
         data_json = r.json()
         _data = data_json["result"]["data"]
         data.extend(_data)
@@ -91,7 +91,7 @@ def stock_selection() -> pd.DataFrame:
         "source": "SELECT_SECURITIES",
         "client": "WEB"
     }
-    r = requests.get(url, params=params)
+    r = http_session.get(url, params=params)
     data_json = r.json()
     data = data_json["result"]["data"]
     if not data:
@@ -102,7 +102,7 @@ def stock_selection() -> pd.DataFrame:
     while page_count > 1:
         page_current = page_current + 1
         params["p"] = page_current
-        r = requests.get(url, params=params)
+        r = http_session.get(url, params=params)
         data_json = r.json()
         _data = data_json["result"]["data"]
         data.extend(_data)
@@ -142,7 +142,7 @@ def stock_selection_params():
         "client": "WEB"
     }
 
-    r = requests.get(url, params=params)
+    r = http_session.get(url, params=params)
     data_json = r.json()
     zxzb = data_json["zxzb"]  # 指标
     print(zxzb)
@@ -8,7 +8,7 @@ https://finance.sina.com.cn/realstock/company/klc_td_sh.txt
 """
 import datetime
 import pandas as pd
-import requests
+import instock.lib.http_session as http_session
 from py_mini_racer import MiniRacer
 
 hk_js_decode = """
@@ -310,7 +310,7 @@ def tool_trade_date_hist_sina() -> pd.DataFrame:
     :rtype: pandas.DataFrame
     """
     url = "https://finance.sina.com.cn/realstock/company/klc_td_sh.txt"
-    r = requests.get(url)
+    r = http_session.get(url)
     js_code = MiniRacer()
     js_code.eval(hk_js_decode)
     dict_list = js_code.call(
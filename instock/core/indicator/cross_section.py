@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from instock.core.indicator.incremental_indicator import (INDICATOR_COLUMNS, BOLL_PERIOD, _Ema, _Rsi, _Directional,
+                                                          _Sar, _is_zero, _stddev, _stoch_k, _safe_div)
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 截面指标计算：整批代码的行情排成 (代码数, 天数) 矩阵（每行右对齐，停牌/上市晚的左侧补 NaN），
+# 滑动窗口类指标沿 axis=1 一次算完全部代码，EMA/Wilder/SAR 等递推指标按天循环、每步同时推进全部代码。
+# 结果与 indicators_data_daily.calculate_indicators 逐代码计算一致。
+
+
+def _windows(x, w):
+    """(n, T) → (n, T, w) 的滑动窗口视图，第 t 列为 [t-w+1, t]，不足 w 的部分为 NaN"""
+    padded = np.concatenate([np.full((x.shape[0], w - 1), np.nan), x], axis=1)
+    return sliding_window_view(padded, w, axis=1)
+
+
+def shift(x, k=1):
+    return np.concatenate([np.full((x.shape[0], k), np.nan), x[:, :-k]], axis=1)
+
+
+def rolling_sum(x, w):
+    return _windows(x, w).sum(axis=-1)
+
+
+def rolling_mean(x, w):
+    return _windows(x, w).mean(axis=-1)
+
+
+def rolling_max(x, w):
+    return _windows(x, w).max(axis=-1)
+
+
+def rolling_min(x, w):
+    return _windows(x, w).min(axis=-1)
+
+
+def rolling_std(x, w):
+    return _stddev(_windows(x, w))
+
+
+def _recurse(step, n, days, *inputs):
+    """按天调用 step(第 t 列输入...)，结果排成 (n, days)"""
+    out = np.full((n, days), np.nan)
+    for t in range(days):
+        out[:, t] = step(*(x[:, t] for x in inputs))
+    return out
+
+
+def ema(x, period, skip=0):
+    """TA-Lib EMA，每行从第一个非 NaN 值开始"""
+    state = _Ema(x.shape[0], period, skip)
+    return _recurse(lambda v: state.update(v, ~np.isnan(v)), *x.shape, x)
+
+
+def wilder(x, period):
+    state = _Ema(x.shape[0], period)
+    state.k = 1.0 / period
+    return _recurse(lambda v: state.update(v, ~np.isnan(v)), *x.shape, x)
+
+
+def rsi(close, period):
+    state = _Rsi(close.shape[0], period)
+    diff = close - shift(close)
+    return _recurse(lambda d: state.update(d, ~np.isnan(d)), *close.shape, diff)
+
+
+def calculate_panel(o, h, l, c, v):
+    """
+    输入 (n, T) 的开高低收量矩阵，返回 {列名: (n, T) 数组}，列同 INDICATOR_COLUMNS。
+    未满足窗口的位置为 NaN，补齐位置也为 NaN，写库前由 finalize 统一填 0。
+    """
+    n, days = c.shape
+    valid = ~np.isnan(c)
+    count = np.cumsum(valid, axis=1)
+    pc, ph, pl = shift(c), shift(h), shift(l)
+    diff = c - pc
+    out = {}
+
+    # MACD
+    fast = ema(c, 12, skip=14)
+    slow = ema(c, 26)
+    macd = fast - slow
+    signal = ema(macd, 9)
+    signal_ok = ~np.isnan(signal)
+    out['macd'] = np.where(signal_ok, macd, np.nan)
+    out['macds'] = signal
+    out['macdh'] = macd - signal
+
+    # KDJ
+    fastk = np.where(count >= 9, _stoch_k(c, rolling_max(h, 9), rolling_min(l, 9)), np.nan)
+    slowk = ema(fastk, 5)
+    slowd = ema(slowk, 5)
+    kd_ok = ~np.isnan(slowd)
+    out['kdjk'] = np.where(kd_ok, slowk, np.nan)
+    out['kdjd'] = slowd
+    out['kdjj'] = 3 * out['kdjk'] - 2 * out['kdjd']
+
+    # BOLL
+    boll = rolling_mean(c, BOLL_PERIOD)
+    boll_sd = rolling_std(c, BOLL_PERIOD)
+    out['boll_ub'] = boll + 2 * boll_sd
+    out['boll'] = boll
+    out['boll_lb'] = boll - 2 * boll_sd
+
+    # W&R
+    for period in (6, 10, 14):
+        hh = rolling_max(h, period)
+        ll = rolling_min(l, period)
+        wr_diff = (hh - ll) / -100.0
+        zero = _is_zero(wr_diff)
+        out[f'wr_{period}'] = np.where(np.isnan(wr_diff), np.nan,
+                                       np.where(zero, 0.0, (hh - c) / np.where(zero, 1.0, wr_diff)))
+
+    # CCI
+    tp_windows = _windows((h + l + c) / 3, 14)
+    tp_avg = tp_windows.mean(axis=-1)
+    mean_dev = np.abs(tp_windows - tp_avg[..., None]).mean(axis=-1)
+    tp_diff = tp_windows[..., -1] - tp_avg
+    cci_ok = ~_is_zero(mean_dev) & ~_is_zero(tp_diff)
+    cci = np.where(cci_ok, tp_diff / (0.015 * np.where(cci_ok, mean_dev, 1.0)), 0.0)
+    out['cci'] = np.where(np.isnan(tp_avg), np.nan, cci)
+    out['cci_84'] = rolling_mean(out['cci'], 84)
+
+    # RSI
+    out['rsi_6'] = rsi(c, 6)
+    out['rsi_12'] = rsi(c, 12)
+    out['rsi'] = rsi(c, 14)
+    out['rsi_24'] = rsi(c, 24)
+
+    # VR
+    up_vol = np.where(valid, np.where(diff > 0, v, 0.0), np.nan)
+    down_vol = np.where(valid, np.where(diff < 0, v, 0.0), np.nan)
+    vr = _safe_div(rolling_sum(up_vol, 26), rolling_sum(down_vol, 26)) * 100
+    vr = np.where(np.isfinite(vr), vr, 0.0)
+    out['vr'] = np.where(valid, vr, np.nan)
+    out['vr_6_sma'] = rolling_mean(out['vr'], 6)
+
+    # ROC
+    base = shift(c, 10)
+    out['roc'] = np.where(np.isnan(base), np.nan,
+                          np.where(base != 0, (c / np.where(base != 0, base, 1.0) - 1.0) * 100.0, 0.0))
+
+    # DMI
+    dmi = _Directional(n, 14)
+    dmi_out = {name: np.full((n, days), np.nan) for name in ('pdi', 'mdi', 'dx', 'adx', 'adxr')}
+    has_prev = valid & ~np.isnan(pc)
+    for t in range(days):
+        values = dmi.update(h[:, t], l[:, t], ph[:, t], pl[:, t], pc[:, t], has_prev[:, t])
+        for name, value in zip(('pdi', 'mdi', 'dx', 'adx', 'adxr'), values):
+            dmi_out[name][:, t] = value
+    out.update(dmi_out)
+
+    # TR / ATR
+    tr = np.maximum(h, pc) - np.minimum(l, pc)
+    out['tr'] = tr
+    out['atr'] = wilder(tr, 14)
+
+    # OBV
+    signed = np.where(c > pc, v, np.where(c < pc, -v, 0.0))
+    obv_terms = np.where(count == 1, v, np.where(valid, signed, 0.0))
+    out['obv'] = np.cumsum(obv_terms, axis=1)
+
+    # SAR
+    sar = _Sar(n)
+    out['sar'] = _recurse(lambda hi, lo, phi, plo, cnt, m: sar.update(hi, lo, phi, plo, cnt, m),
+                          n, days, h, l, ph, pl, count, valid)
+
+    # PSY
+    up = np.where(valid, (c > pc).astype(np.float64), np.nan)
+    out['psy'] = np.where(count >= 12, rolling_sum(up, 12) / 12 * 100, np.where(valid, 0.0, np.nan))
+    out['psyma'] = rolling_mean(out['psy'], 6)
+
+    # BRAR（第一根K线的前收盘按 0 处理）
+    pcz = np.where(count == 1, 0.0, pc)
+    br = _safe_div(rolling_sum(np.clip(h - pcz, 0, None), 26), rolling_sum(np.clip(pcz - l, 0, None), 26))
+    ar = _safe_div(rolling_sum(np.clip(h - o, 0, None), 26), rolling_sum(np.clip(o - l, 0, None), 26))
+    out['br'] = np.where(np.isfinite(br), br, 0.0) * 100
+    out['ar'] = np.where(np.isfinite(ar), ar, 0.0) * 100
+
+    # EMV
+    hl = (h + l) / 2
+    prev_hl = np.where(count == 1, 0.0, shift(hl))
+    emv_vol = np.where(v == 0, 1.0, v)
+    out['emv'] = rolling_sum(_safe_div((hl - prev_hl) * (h - l), emv_vol), 14)
+    out['emva'] = rolling_mean(out['emv'], 9)
+
+    # MFI
+    mf_tp = (h + l + c) / 3
+    mf_diff = mf_tp - shift(mf_tp)
+    mf_flow = mf_tp * v
+    mf_flat = _is_zero(mf_diff)  # 典型价仅有浮点误差的变化视为持平
+    pos_mf = rolling_sum(np.where((mf_diff > 0) & ~mf_flat, mf_flow, 0.0), 14)
+    neg_mf = rolling_sum(np.where((mf_diff < 0) & ~mf_flat, mf_flow, 0.0), 14)
+    mf_total = pos_mf + neg_mf
+    mfi = np.where(mf_total < 1.0, 0.0, 100.0 * pos_mf / np.where(mf_total < 1.0, 1.0, mf_total))
+    out['mfi'] = np.where(count >= 15, mfi, np.nan)
+    out['mfisma'] = rolling_mean(out['mfi'], 30)
+
+    # VWMA
+    cum_pv = np.cumsum(np.where(valid, c * v, 0.0), axis=1)
+    cum_v = np.cumsum(np.where(valid, v, 0.0), axis=1)
+    out['vwma'] = np.where(valid, _safe_div(cum_pv, cum_v), np.nan)
+    out['mvwma'] = rolling_mean(out['vwma'], 30)
+
+    # PPO（快线为普通 EMA12）
+    ppo_fast = ema(c, 12)
+    slow_zero = _is_zero(slow)
+    ppo = np.where(slow_zero, 0.0, (ppo_fast - slow) / np.where(slow_zero, 1.0, slow) * 100)
+    out['ppo'] = np.where(np.isnan(slow), np.nan, ppo)
+    out['ppos'] = ema(out['ppo'], 9)
+    out['ppoh'] = out['ppo'] - out['ppos']
+
+    # WT
+    out['wt1'] = _safe_div(c - rolling_mean(c, 10), rolling_std(c, 10))
+    out['wt2'] = _safe_div(c - rolling_mean(c, 20), rolling_std(c, 20))
+
+    # DPO
+    out['dpo'] = c - rolling_mean(c, 20)
+    out['madpo'] = rolling_mean(out['dpo'], 30)
+
+    # VHF
+    vhf = _safe_div(rolling_max(c, 28) - rolling_min(c, 28), rolling_sum(np.abs(diff), 28))
+    out['vhf'] = np.where(np.isnan(vhf), 0.0, vhf)
+
+    # RVI
+    co = c - o
+    hl_range = h - l
+    rvi_x = (co + 2 * shift(co, 1) + 2 * shift(co, 2) + shift(co, 3)) / 6
+    rvi_y = (hl_range + 2 * shift(hl_range, 1) + 2 * shift(hl_range, 2) + shift(hl_range, 3)) / 6
+    rvi = _safe_div(rolling_mean(rvi_x, 10), rolling_mean(rvi_y, 10))
+    rvi = np.where(valid & np.isnan(rvi), 0.0, rvi)
+    out['rvi'] = rvi
+    out['rvis'] = (rvi + 2 * shift(rvi, 1) + 2 * shift(rvi, 2) + shift(rvi, 3)) / 6
+
+    # FI
+    out['fi'] = diff * v
+    out['force_2'] = rolling_mean(out['fi'], 2)
+    out['force_13'] = rolling_mean(out['fi'], 13)
+
+    # ENE
+    ene = ema(c, 25)
+    ene_sd = rolling_std(c, 25)
+    out['ene_ue'] = ene + 2 * ene_sd
+    out['ene'] = ene
+    out['ene_le'] = ene - 2 * ene_sd
+
+    # STOCHRSI(14, 5, 3)
+    rsi_14 = out['rsi']
+    srsi_k = _stoch_k(rsi_14, rolling_max(rsi_14, 5), rolling_min(rsi_14, 5))
+    srsi_k = np.where(np.isnan(rolling_max(rsi_14, 5)), np.nan, srsi_k)
+    srsi_d = rolling_mean(srsi_k, 3)
+    d_ok = ~np.isnan(srsi_d)
+    out['stochrsi_k'] = np.where(d_ok, srsi_k, np.nan)
+    out['stochrsi_d'] = srsi_d
+
+    return {name: np.where(valid, out[name], np.nan) for name in INDICATOR_COLUMNS}
@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 增量指标引擎：与 indicators_data_daily.calculate_indicators 输出相同的指标列，
+# 但把每个代码的递推状态（EMA、Wilder 平均、KDJ 平滑、DMI/ADX、SAR、OBV、VWMA 累计量）
+# 和少量最近K线保存下来，每天只用新的一根K线推进一步，不再重算 200 天窗口。
+# 所有状态都是 (代码数,) 或 (代码数, 窗口) 的数组，一步同时推进全部代码。
+# 从头逐根回放时与 TA-Lib 在同一窗口上的结果一致；OBV、VWMA 为自建立状态起的累计值。
+
+INDICATOR_COLUMNS = (
+    'macd', 'macds', 'macdh', 'kdjk', 'kdjd', 'kdjj', 'boll_ub', 'boll', 'boll_lb',
+    'wr_6', 'wr_10', 'wr_14', 'cci', 'cci_84', 'rsi_6', 'rsi_12', 'rsi', 'rsi_24',
+    'vr', 'vr_6_sma', 'roc', 'pdi', 'mdi', 'dx', 'adx', 'adxr', 'tr', 'atr', 'obv', 'sar',
+    'psy', 'psyma', 'br', 'ar', 'emv', 'emva', 'mfi', 'mfisma', 'vwma', 'mvwma',
+    'ppo', 'ppos', 'ppoh', 'wt1', 'wt2', 'dpo', 'madpo', 'vhf', 'rvi', 'rvis',
+    'fi', 'force_2', 'force_13', 'ene_ue', 'ene', 'ene_le', 'stochrsi_k', 'stochrsi_d',
+)
+
+state_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                         'cache', 'indicator_state')  # 各类代码的状态文件目录
+_state_dir = os.environ.get('indicator_state_dir')
+if _state_dir is not None:
+    state_dir = _state_dir
+
+BAR_WINDOW = 32  # 保存的最近K线根数，需大于用到的最长原始窗口（VHF 28 + 1）
+BOLL_PERIOD = 20  # 与 tl.BBANDS 的默认周期一致（TA-Lib 0.6 起默认 20）
+_EPSILON = 0.00000001  # 与 TA-Lib 的 TA_IS_ZERO 判断一致
+
+
+def _is_zero(x):
+    return (x > -_EPSILON) & (x < _EPSILON)
+
+
+class _Ring:
+    """每个代码一段环形缓冲，count 为已写入个数"""
+
+    def __init__(self, n, size):
+        self.values = np.full((n, size), np.nan)
+        self.count = np.zeros(n, dtype=np.int64)
+
+    def push(self, x, mask):
+        rows = np.flatnonzero(mask)
+        size = self.values.shape[1]
+        self.values[rows, self.count[rows] % size] = x[rows]
+        self.count[rows] += 1
+
+    def tail(self, k):
+        """最近 k 个值（旧→新），不足 k 个时缺失位置为 NaN"""
+        size = self.values.shape[1]
+        pos = self.count[:, None] - k + np.arange(k)
+        out = np.take_along_axis(self.values, pos % size, axis=1)
+        out[pos < 0] = np.nan
+        return out
+
+    def full(self, k):
+        return self.count >= k
+
+    def mean(self, k):
+        return np.where(self.full(k), self.tail(k).mean(axis=1), np.nan)
+
+
+class _Ema:
+    """TA-Lib EMA：跳过前 skip 个输入，用随后 period 个输入的均值作初值，再逐个递推"""
+
+    def __init__(self, n, period, skip=0):
+        self.period = period
+        self.skip = skip
+        self.k = 2.0 / (period + 1)
+        self.seen = np.zeros(n, dtype=np.int64)
+        self.total = np.zeros(n)
+        self.value = np.full(n, np.nan)
+
+    def update(self, x, mask):
+        seen = self.seen + mask
+        seed_end = self.skip + self.period
+        self.total = np.where(mask & (seen > self.skip) & (seen <= seed_end), self.total + x, self.total)
+        value = np.where(mask & (seen > seed_end), self.value + self.k * (x - self.value), self.value)
+        self.value = np.where(mask & (seen == seed_end), self.total / self.period, value)
+        self.seen = seen
+        return self.value
+
+
+class _Rsi:
+    """TA-Lib RSI（Wilder 平滑）"""
+
+    def __init__(self, n, period):
+        self.period = period
+        self.diffs = np.zeros(n, dtype=np.int64)
+        self.gain = np.zeros(n)
+        self.loss = np.zeros(n)
+
+    def update(self, diff, mask):
+        # diff 为本根与上一根收盘价之差，mask 为有上一根K线的代码
+        n = self.period
+        diffs = self.diffs + mask
+        up = np.where(diff > 0, diff, 0.0)
+        down = np.where(diff < 0, -diff, 0.0)
+        seeding = mask & (diffs <= n)
+        gain = np.where(seeding, self.gain + up, self.gain)
+        loss = np.where(seeding, self.loss + down, self.loss)
+        gain = np.where(mask & (diffs == n), gain / n, gain)
+        loss = np.where(mask & (diffs == n), loss / n, loss)
+        running = mask & (diffs > n)
+        gain = np.where(running, (gain * (n - 1) + up) / n, gain)
+        loss = np.where(running, (loss * (n - 1) + down) / n, loss)
+        self.gain, self.loss, self.diffs = gain, loss, diffs
+        total = gain + loss
+        rsi = np.where(_is_zero(total), 0.0, 100.0 * (gain / np.where(_is_zero(total), 1.0, total)))
+        return np.where(diffs >= n, rsi, np.nan)
+
+
+class _Directional:
+    """TA-Lib PLUS_DI / MINUS_DI / DX / ADX / ADXR 共用的 Wilder 累计量"""
+
+    def __init__(self, n, period=14):
+        self.period = period
+        self.diffs = np.zeros(n, dtype=np.int64)
+        self.pdm = np.zeros(n)
+        self.mdm = np.zeros(n)
+        self.tr = np.zeros(n)
+        self.dx = np.zeros(n)
+        self.sum_dx = np.zeros(n)
+        self.adx = np.full(n, np.nan)
+        self.adx_ring = _Ring(n, period)
+
+    def update(self, high, low, prev_high, prev_low, prev_close, mask):
+        p = self.period
+        diffs = self.diffs + mask
+        diff_p = high - prev_high
+        diff_m = prev_low - low
+        plus = np.where((diff_p > 0) & (diff_p > diff_m), diff_p, 0.0)
+        minus = np.where((diff_m > 0) & (diff_p < diff_m), diff_m, 0.0)
+        tr = np.maximum(high, prev_close) - np.minimum(low, prev_close)
+
+        decay = mask & (diffs >= p)
+        accumulate = mask & (diffs < p)
+        pdm = np.where(decay, self.pdm - self.pdm / p, self.pdm)
+        mdm = np.where(decay, self.mdm - self.mdm / p, self.mdm)
+        trs = np.where(decay, self.tr - self.tr / p, self.tr)
+        pdm = np.where(decay | accumulate, pdm + plus, pdm)
+        mdm = np.where(decay | accumulate, mdm + minus, mdm)
+        trs = np.where(decay | accumulate, trs + tr, trs)
+        self.pdm, self.mdm, self.tr, self.diffs = pdm, mdm, trs, diffs
+
+        tr_ok = ~_is_zero(trs)
+        safe_tr = np.where(tr_ok, trs, 1.0)
+        pdi = np.where(tr_ok, 100.0 * pdm / safe_tr, 0.0)
+        mdi = np.where(tr_ok, 100.0 * mdm / safe_tr, 0.0)
+        di_sum = pdi + mdi
+        dx_ok = tr_ok & ~_is_zero(di_sum)
+        dx_new = 100.0 * np.abs(mdi - pdi) / np.where(dx_ok, di_sum, 1.0)
+        # TA-Lib DX 在分母为 0 时沿用上一个值（第一个值为 0）
+        dx = np.where(decay & dx_ok, dx_new, np.where(decay & (diffs == p), 0.0, self.dx))
+        self.dx = dx
+
+        # ADX：第 p..2p-1 个差值的 DX 求和取均值作初值，之后 Wilder 平滑，DX 无法计算时保持不变
+        self.sum_dx = np.where(decay & dx_ok & (diffs < 2 * p), self.sum_dx + dx_new, self.sum_dx)
+        adx = np.where(mask & (diffs == 2 * p - 1), self.sum_dx / p, self.adx)
+        adx = np.where(mask & (diffs >= 2 * p) & dx_ok, (adx * (p - 1) + dx_new) / p, adx)
+        self.adx = adx
+        self.adx_ring.push(adx, mask & (diffs >= 2 * p - 1))
+        adx_tail = self.adx_ring.tail(p)
+        adxr = np.where(self.adx_ring.full(p), (adx_tail[:, -1] + adx_tail[:, 0]) / 2, np.nan)
+
+        valid = diffs >= p
+        return (np.where(valid, pdi, np.nan), np.where(valid, mdi, np.nan), np.where(valid, dx, np.nan),
+                np.where(diffs >= 2 * p - 1, adx, np.nan), adxr)
+
+
+class _Sar:
+    """TA-Lib SAR(0.02, 0.2)"""
+
+    def __init__(self, n, acceleration=0.02, maximum=0.2):
+        self.acceleration = acceleration
+        self.maximum = maximum
+        self.is_long = np.zeros(n, dtype=bool)
+        self.sar = np.full(n, np.nan)
+        self.ep = np.full(n, np.nan)
+        self.af = np.full(n, acceleration)
+
+    def update(self, high, low, prev_high, prev_low, count, mask):
+        acc = self.acceleration
+        # 第二根K线：按 MINUS_DM 判断初始方向，且本根用自身作为"上一根"
+        first = mask & (count == 2)
+        diff_p = high - prev_high
+        diff_m = prev_low - low
+        init_long = ~((diff_m > 0) & (diff_p < diff_m))
+        is_long = np.where(first, init_long, self.is_long)
+        ep = np.where(first, np.where(init_long, high, low), self.ep)
+        sar = np.where(first, np.where(init_long, prev_low, prev_high), self.sar)
+        af = np.where(first, acc, self.af)
+        ph = np.where(first, high, prev_high)
+        pl = np.where(first, low, prev_low)
+
+        active = mask & (count >= 2)
+        # 多头
+        long_rev = is_long & (low <= sar)
+        rev_sar = np.maximum(np.maximum(ep, ph), high)
+        long_out = np.where(long_rev, rev_sar, sar)
+        ep_long = np.where(long_rev, low, np.where(high > ep, high, ep))
+        af_long = np.where(long_rev, acc, np.where(high > ep, np.minimum(af + acc, self.maximum), af))
+        next_long = np.where(long_rev,
+                             np.maximum(np.maximum(rev_sar + acc * (low - rev_sar), ph), high),
+                             np.minimum(np.minimum(sar + af_long * (ep_long - sar), pl), low))
+        # 空头
+        short_rev = ~is_long & (high >= sar)
+        rev_sar_s = np.minimum(np.minimum(ep, pl), low)
+        short_out = np.where(short_rev, rev_sar_s, sar)
+        ep_short = np.where(short_rev, high, np.where(low < ep, low, ep))
+        af_short = np.where(short_rev, acc, np.where(low < ep, np.minimum(af + acc, self.maximum), af))
+        next_short = np.where(short_rev,
+                              np.minimum(np.minimum(rev_sar_s + acc * (high - rev_sar_s), pl), low),
+                              np.maximum(np.maximum(sar + af_short * (ep_short - sar), ph), high))
+
+        out = np.where(is_long, long_out, short_out)
+        self.sar = np.where(active, np.where(is_long, next_long, next_short), self.sar)
+        self.ep = np.where(active, np.where(is_long, ep_long, ep_short), self.ep)
+        self.af = np.where(active, np.where(is_long, af_long, af_short), self.af)
+        self.is_long = np.where(active, np.where(is_long, ~long_rev, short_rev), self.is_long)
+        return np.where(count >= 2, out, np.nan)
+
+
+def _stddev(window):
+    """TA-Lib STDDEV：E[x²]-E[x]²，不大于 1e-8 时取 0"""
+    mean = window.mean(axis=-1)
+    var = (window * window).mean(axis=-1) - mean * mean
+    return np.where(var < _EPSILON, 0.0, np.sqrt(np.where(var < _EPSILON, 0.0, var)))
+
+
+def _stoch_k(x, highest, lowest):
+    diff = (highest - lowest) / 100.0
+    zero = _is_zero(diff)
+    return np.where(zero, 0.0, (x - lowest) / np.where(zero, 1.0, diff))
+
+
+def _safe_div(a, b):
+    """pandas 语义的除法：0/0 为 NaN，x/0 为 inf"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return a / b
+
+
+class IndicatorEngine:
+    """n 个代码的指标递推状态，step() 推进一根K线，replay() 从头回放一段K线"""
+
+    def __init__(self, n):
+        self.n = n
+        self.open = _Ring(n, BAR_WINDOW)
+        self.high = _Ring(n, BAR_WINDOW)
+        self.low = _Ring(n, BAR_WINDOW)
+        self.close = _Ring(n, BAR_WINDOW)
+        self.volume = _Ring(n, BAR_WINDOW)
+
+        self.ema_fast = _Ema(n, 12, skip=14)  # TA-Lib MACD 的快线从第 15 根开始取初值
+        self.ema_slow = _Ema(n, 26)
+        self.ppo_fast = _Ema(n, 12)
+        self.macd_signal = _Ema(n, 9)
+        self.ppo_signal = _Ema(n, 9)
+        self.slowk = _Ema(n, 5)
+        self.slowd = _Ema(n, 5)
+        self.ema_25 = _Ema(n, 25)
+        self.rsi_6 = _Rsi(n, 6)
+        self.rsi_12 = _Rsi(n, 12)
+        self.rsi_14 = _Rsi(n, 14)
+        self.rsi_24 = _Rsi(n, 24)
+        self.dmi = _Directional(n, 14)
+        self.sar = _Sar(n)
+        self.atr = _Ema(n, 14)
+        self.atr.k = 1.0 / 14  # Wilder 平滑
+        self.obv = np.full(n, np.nan)
+        self.cum_pv = np.zeros(n)
+        self.cum_v = np.zeros(n)
+
+        self.cci_ring = _Ring(n, 84)
+        self.vr_ring = _Ring(n, 6)
+        self.psy_ring = _Ring(n, 6)
+        self.emv_ring = _Ring(n, 9)
+        self.mfi_ring = _Ring(n, 30)
+        self.vwma_ring = _Ring(n, 30)
+        self.dpo_ring = _Ring(n, 30)
+        self.fi_ring = _Ring(n, 13)
+        self.rvi_ring = _Ring(n, 4)
+        self.rsi_ring = _Ring(n, 5)
+        self.fastk_ring = _Ring(n, 3)
+
+    # ---- 状态存取 ----
+    def _components(self):
+        for name, comp in vars(self).items():
+            if isinstance(comp, (_Ring, _Ema, _Rsi, _Directional, _Sar)):
+                yield name, comp
+
+    def arrays(self):
+        """全部状态数组，键为 '组件.属性'"""
+        result = {name: value for name, value in vars(self).items() if isinstance(value, np.ndarray)}
+        for name, comp in self._components():
+            for attr, value in vars(comp).items():
+                if isinstance(value, np.ndarray):
+                    result[f'{name}.{attr}'] = value
+                elif isinstance(value, _Ring):
+                    result[f'{name}.{attr}.values'] = value.values
+                    result[f'{name}.{attr}.count'] = value.count
+        return result
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        n = len(arrays['obv'])
+        engine = cls(n)
+        for key, value in arrays.items():
+            target = engine
+            *path, attr = key.split('.')
+            for part in path:
+                target = getattr(target, part)
+            setattr(target, attr, np.array(value))
+        return engine
+
+    def select(self, rows):
+        return IndicatorEngine.from_arrays({k: v[rows] for k, v in self.arrays().items()})
+
+    @staticmethod
+    def concat(engines):
+        engines = [e for e in engines if e is not None and e.n]
+        if not engines:
+            return IndicatorEngine(0)
+        keys = engines[0].arrays().keys()
+        parts = [e.arrays() for e in engines]
+        return IndicatorEngine.from_arrays({k: np.concatenate([p[k] for p in parts]) for k in keys})
+
+    # ---- 计算 ----
+    def step(self, o, h, l, c, v, mask):
+        """
+        推进一根K线：mask 为本步有新K线的代码。返回 {列名: (n,) 数组}，
+        未满足窗口的位置为 NaN（与 TA-Lib/pandas 一致，写库前由 finalize 统一填 0）。
+        """
+        prev_close = self.close.tail(1)[:, 0]
+        prev_high = self.high.tail(1)[:, 0]
+        prev_low = self.low.tail(1)[:, 0]
+        for ring, x in ((self.open, o), (self.high, h), (self.low, l), (self.close, c), (self.volume, v)):
+            ring.push(x, mask)
+        count = self.close.count
+        has_prev = mask & (count >= 2)
+        out = {}
+
+        closes = self.close.tail(29)
+        highs = self.high.tail(27)
+        lows = self.low.tail(27)
+        opens = self.open.tail(26)
+        volumes = self.volume.tail(26)
+
+        # MACD / PPO
+        fast = self.ema_fast.update(c, mask)
+        slow = self.ema_slow.update(c, mask)
+        macd = fast - slow
+        slow_ok = self.ema_slow.seen >= 26
+        signal = self.macd_signal.update(macd, mask & slow_ok)
+        signal_ok = self.macd_signal.seen >= 9
+        out['macd'] = np.where(signal_ok, macd, np.nan)
+        out['macds'] = np.where(signal_ok, signal, np.nan)
+        out['macdh'] = np.where(signal_ok, macd - signal, np.nan)
+
+        # KDJ
+        fastk = _stoch_k(c, highs[:, -9:].max(axis=1), lows[:, -9:].min(axis=1))
+        slowk = self.slowk.update(fastk, mask & (count >= 9))
+        slowd = self.slowd.update(slowk, mask & (self.slowk.seen >= 5))
+        kd_ok = self.slowd.seen >= 5
+        out['kdjk'] = np.where(kd_ok, slowk, np.nan)
+        out['kdjd'] = np.where(kd_ok, slowd, np.nan)
+        out['kdjj'] = 3 * out['kdjk'] - 2 * out['kdjd']
+
+        # BOLL
+        boll = closes[:, -BOLL_PERIOD:].mean(axis=1)
+        boll_sd = _stddev(closes[:, -BOLL_PERIOD:])
+        boll_ok = count >= BOLL_PERIOD
+        out['boll_ub'] = np.where(boll_ok, boll + 2 * boll_sd, np.nan)
+        out['boll'] = np.where(boll_ok, boll, np.nan)
+        out['boll_lb'] = np.where(boll_ok, boll - 2 * boll_sd, np.nan)
+
+        # W&R
+        for period in (6, 10, 14):
+            hh = highs[:, -period:].max(axis=1)
+            ll = lows[:, -period:].min(axis=1)
+            diff = (hh - ll) / -100.0
+            zero = _is_zero(diff)
+            wr = np.where(zero, 0.0, (hh - c) / np.where(zero, 1.0, diff))
+            out[f'wr_{period}'] = np.where(count >= period, wr, np.nan)
+
+        # CCI
+        tp = (highs[:, -14:] + lows[:, -14:] + closes[:, -14:]) / 3
+        tp_avg = tp.mean(axis=1)
+        mean_dev = np.abs(tp - tp_avg[:, None]).mean(axis=1)
+        tp_diff = tp[:, -1] - tp_avg
+        cci_ok = ~_is_zero(mean_dev) & ~_is_zero(tp_diff)
+        cci = np.where(count >= 14, np.where(cci_ok, tp_diff / (0.015 * np.where(cci_ok, mean_dev, 1.0)), 0.0), np.nan)
+        out['cci'] = cci
+        self.cci_ring.push(cci, mask & (count >= 14))
+        out['cci_84'] = self.cci_ring.mean(84)
+
+        # RSI
+        diff = c - prev_close
+        out['rsi_6'] = self.rsi_6.update(diff, has_prev)
+        out['rsi_12'] = self.rsi_12.update(diff, has_prev)
+        out['rsi'] = self.rsi_14.update(diff, has_prev)
+        out['rsi_24'] = self.rsi_24.update(diff, has_prev)
+
+        # VR
+        up_down = closes[:, -26:] - closes[:, -27:-1]
+        up_vol = np.nansum(np.where(up_down > 0, volumes, 0.0), axis=1)
+        down_vol = np.nansum(np.where(up_down < 0, volumes, 0.0), axis=1)
+        vr = np.where(count >= 26, _safe_div(up_vol, down_vol) * 100, np.nan)
+        vr = np.where(np.isfinite(vr), vr, 0.0)
+        out['vr'] = vr
+        self.vr_ring.push(vr, mask)
+        out['vr_6_sma'] = self.vr_ring.mean(6)
+
+        # ROC
+        base = closes[:, -11]
+        roc = np.where(base != 0, (c / np.where(base != 0, base, 1.0) - 1.0) * 100.0, 0.0)
+        out['roc'] = np.where(count >= 11, roc, np.nan)
+
+        # DMI
+        out['pdi'], out['mdi'], out['dx'], out['adx'], out['adxr'] = self.dmi.update(
+            h, l, prev_high, prev_low, prev_close, has_prev)
+
+        # TR / ATR
+        tr = np.maximum(h, prev_close) - np.minimum(l, prev_close)
+        out['tr'] = np.where(count >= 2, tr, np.nan)
+        atr = self.atr.update(tr, has_prev)
+        out['atr'] = np.where(self.atr.seen >= 14, atr, np.nan)
+
+        # OBV
+        obv = np.where(c > prev_close, self.obv + v, np.where(c < prev_close, self.obv - v, self.obv))
+        obv = np.where(mask & (count == 1), v, obv)
+        self.obv = np.where(mask, obv, self.obv)
+        out['obv'] = self.obv
+
+        # SAR
+        out['sar'] = self.sar.update(h, l, prev_high, prev_low, count, mask)
+
+        # PSY
+        psy_up = (closes[:, -12:] > closes[:, -13:-1]).sum(axis=1)
+        psy = np.where(count >= 12, psy_up / 12 * 100, 0.0)
+        out['psy'] = psy
+        self.psy_ring.push(psy, mask)
+        out['psyma'] = self.psy_ring.mean(6)
+
+        # BRAR（第一根K线的前收盘按 0 处理）
+        pc = np.nan_to_num(closes[:, -27:-1], nan=0.0)
+        br_up = np.clip(highs[:, -26:] - pc, 0, None).sum(axis=1)
+        br_down = np.clip(pc - lows[:, -26:], 0, None).sum(axis=1)
+        ar_up = np.clip(highs[:, -26:] - opens, 0, None).sum(axis=1)
+        ar_down = np.clip(opens - lows[:, -26:], 0, None).sum(axis=1)
+        for name, up, down in (('br', br_up, br_down), ('ar', ar_up, ar_down)):
+            ratio = _safe_div(up, down)
+            out[name] = np.where(np.isfinite(ratio), ratio, 0.0) * 100
+
+        # EMV
+        hl = (highs[:, -15:] + lows[:, -15:]) / 2
+        emv_vol = self.volume.tail(14)
+        emv_vol = np.where(emv_vol == 0, 1.0, emv_vol)
+        prev_hl = np.nan_to_num(hl[:, :-1], nan=0.0)  # 第一根K线的前值按 0 处理
+        emv_terms = _safe_div((hl[:, 1:] - prev_hl) * (highs[:, -14:] - lows[:, -14:]), emv_vol)
+        emv = emv_terms.sum(axis=1)
+        out['emv'] = emv
+        self.emv_ring.push(emv, mask)
+        out['emva'] = self.emv_ring.mean(9)
+
+        # MFI
+        mf_tp = (highs[:, -15:] + lows[:, -15:] + closes[:, -15:]) / 3
+        mf_flow = mf_tp[:, 1:] * self.volume.tail(14)
+        mf_diff = mf_tp[:, 1:] - mf_tp[:, :-1]
+        mf_flat = _is_zero(mf_diff)  # 典型价仅有浮点误差的变化视为持平，与 TA-Lib 一致
+        pos_mf = np.where((mf_diff > 0) & ~mf_flat, mf_flow, 0.0).sum(axis=1)
+        neg_mf = np.where((mf_diff < 0) & ~mf_flat, mf_flow, 0.0).sum(axis=1)
+        mf_total = pos_mf + neg_mf
+        mfi = np.where(mf_total < 1.0, 0.0, 100.0 * pos_mf / np.where(mf_total < 1.0, 1.0, mf_total))
+        mfi = np.where(count >= 15, mfi, np.nan)
+        out['mfi'] = mfi
+        self.mfi_ring.push(mfi, mask & (count >= 15))
+        out['mfisma'] = self.mfi_ring.mean(30)
+
+        # VWMA（自建立状态起的累计量）
+        self.cum_pv = np.where(mask, self.cum_pv + c * v, self.cum_pv)
+        self.cum_v = np.where(mask, self.cum_v + v, self.cum_v)
+        vwma = _safe_div(self.cum_pv, self.cum_v)
+        out['vwma'] = vwma
+        self.vwma_ring.push(vwma, mask & ((self.vwma_ring.count > 0) | ~np.isnan(vwma)))
+        out['mvwma'] = self.vwma_ring.mean(30)
+
+        # PPO（快线为普通 EMA12，与 MACD 的快线初值不同）
+        ppo_fast = self.ppo_fast.update(c, mask)
+        ppo = np.where(_is_zero(slow), 0.0, (ppo_fast - slow) / np.where(_is_zero(slow), 1.0, slow) * 100)
+        ppo = np.where(slow_ok, ppo, np.nan)
+        ppos = self.ppo_signal.update(ppo, mask & slow_ok)
+        ppos = np.where(self.ppo_signal.seen >= 9, ppos, np.nan)
+        out['ppo'] = ppo
+        out['ppos'] = ppos
+        out['ppoh'] = ppo - ppos
+
+        # WT
+        for name, period in (('wt1', 10), ('wt2', 20)):
+            window = closes[:, -period:]
+            wt = _safe_div(c - window.mean(axis=1), _stddev(window))
+            out[name] = np.where(count >= period, wt, np.nan)
+
+        # DPO
+        dpo = np.where(count >= 20, c - closes[:, -20:].mean(axis=1), np.nan)
+        out['dpo'] = dpo
+        self.dpo_ring.push(dpo, mask & (count >= 20))
+        out['madpo'] = self.dpo_ring.mean(30)
+
+        # VHF
+        vhf_close = closes[:, -28:]
+        vhf = _safe_div(vhf_close.max(axis=1) - vhf_close.min(axis=1),
+                        np.abs(closes[:, 1:] - closes[:, :-1]).sum(axis=1))
+        out['vhf'] = np.where(np.isnan(vhf), 0.0, vhf)
+
+        # RVI
+        co = closes[:, -13:] - self.open.tail(13)
+        hl_range = highs[:, -13:] - lows[:, -13:]
+        rvi_x = (co[:, 3:] + 2 * co[:, 2:-1] + 2 * co[:, 1:-2] + co[:, :-3]) / 6
+        rvi_y = (hl_range[:, 3:] + 2 * hl_range[:, 2:-1] + 2 * hl_range[:, 1:-2] + hl_range[:, :-3]) / 6
+        rvi = _safe_div(rvi_x.mean(axis=1), rvi_y.mean(axis=1))
+        rvi = np.where(np.isnan(rvi), 0.0, rvi)
+        out['rvi'] = rvi
+        self.rvi_ring.push(rvi, mask)
+        rvi_tail = self.rvi_ring.tail(4)
+        out['rvis'] = (rvi_tail[:, 3] + 2 * rvi_tail[:, 2] + 2 * rvi_tail[:, 1] + rvi_tail[:, 0]) / 6
+
+        # FI
+        fi = diff * v
+        out['fi'] = np.where(count >= 2, fi, np.nan)
+        self.fi_ring.push(fi, has_prev)
+        out['force_2'] = self.fi_ring.mean(2)
+        out['force_13'] = self.fi_ring.mean(13)
+
+        # ENE
+        ene = self.ema_25.update(c, mask)
+        ene_sd = _stddev(closes[:, -25:])
+        ene_ok = count >= 25
+        out['ene_ue'] = np.where(ene_ok, ene + 2 * ene_sd, np.nan)
+        out['ene'] = np.where(ene_ok, ene, np.nan)
+        out['ene_le'] = np.where(ene_ok, ene - 2 * ene_sd, np.nan)
+
+        # STOCHRSI(14, 5, 3)
+        rsi_ok = ~np.isnan(out['rsi'])
+        self.rsi_ring.push(out['rsi'], mask & rsi_ok)
+        rsi_window = self.rsi_ring.tail(5)
+        srsi_k = _stoch_k(out['rsi'], rsi_window.max(axis=1), rsi_window.min(axis=1))
+        k_ok = self.rsi_ring.full(5)
+        self.fastk_ring.push(srsi_k, mask & k_ok)
+        srsi_d = self.fastk_ring.mean(3)
+        d_ok = self.fastk_ring.full(3)
+        out['stochrsi_k'] = np.where(d_ok, srsi_k, np.nan)
+        out['stochrsi_d'] = np.where(d_ok, srsi_d, np.nan)
+
+        return out
+
+    def replay(self, o, h, l, c, v):
+        """
+        逐列回放 (n, T) 的K线矩阵（每行右对齐，左侧用 NaN 补齐），
+        返回 {列名: (n, T) 数组}，没有K线的位置为 NaN。
+        """
+        n, days = c.shape
+        result = {name: np.full((n, days), np.nan) for name in INDICATOR_COLUMNS}
+        for t in range(days):
+            mask = ~np.isnan(c[:, t])
+            if not mask.any():
+                continue
+            values = self.step(o[:, t], h[:, t], l[:, t], c[:, t], v[:, t], mask)
+            for name in INDICATOR_COLUMNS:
+                result[name][mask, t] = values[name][mask]
+        return result
+
+
+def panel_index(starts, ends):
+    """
+    按代码连续存放的长表（第 i 个代码占 [starts[i], ends[i]) 行，区间首尾相接）每一行
+    在右对齐矩阵中的 (行, 列) 下标，以及矩阵宽度
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(ends, dtype=np.int64) - starts
+    width = int(lengths.max()) if len(lengths) else 0
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    cols = width - np.repeat(lengths, lengths) + within
+    return rows, cols, width
+
+
+def to_panel(values, rows, cols, n, width):
+    """长表的一列转为 (n, width) 的右对齐矩阵，左侧补 NaN"""
+    panel = np.full((n, width), np.nan)
+    panel[rows, cols] = values
+    return panel
+
+
+def finalize(values):
+    """与 calculate_indicators 一致：inf 与 NaN 统一写 0"""
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isfinite(values), values, 0.0)
+
+
+def state_path(name):
+    return os.path.join(state_dir, f'{name}.npz')
+
+
+def save_state(path, codes, last_date, last_close, engine):
+    """状态写入压缩 npz：代码、最后K线日期与收盘价、引擎全部数组"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, _codes=np.asarray(codes), _last_date=np.asarray(last_date),
+                        _last_close=np.asarray(last_close, dtype=np.float64), **engine.arrays())
+    os.replace(tmp_path, path)
+
+
+def load_state(path):
+    """读取 save_state 写入的状态，不存在或损坏时返回 None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            arrays = {k: data[k] for k in data.files}
+    except Exception:
+        return None
+    codes = arrays.pop('_codes')
+    last_date = arrays.pop('_last_date')
+    last_close = arrays.pop('_last_close')
+    return codes, last_date, last_close, IndicatorEngine.from_arrays(arrays)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 逐根K线递推的指标内核：只在 numpy 数组上循环，不经过 DataFrame 的 .iloc。
+# 安装了 numba 时编译为机器码，否则以纯 Python 循环执行，结果相同。
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _jit(func):
+    return njit(cache=True, nogil=True)(func) if njit is not None else func
+
+
+@_jit
+def supertrend(close, band_ub, band_lb):
+    """
+    Supertrend：band_ub/band_lb 为 (最高+最低)/2 ± 3 倍 ATR 的基础上下轨，
+    返回 (上轨, 下轨, supertrend)。上一根的 supertrend 既不等于上轨也不等于下轨时（输入含 NaN）结果为 NaN。
+    """
+    size = close.shape[0]
+    ub = np.empty(size, dtype=np.float64)
+    lb = np.empty(size, dtype=np.float64)
+    st = np.full(size, np.nan)
+    if size == 0:
+        return ub, lb, st
+
+    ub[0] = band_ub[0]
+    lb[0] = band_lb[0]
+    st[0] = ub[0] if close[0] <= ub[0] else lb[0]
+    for i in range(1, size):
+        last_close = close[i - 1]
+        last_ub = ub[i - 1]
+        last_lb = lb[i - 1]
+
+        # 上轨
+        if band_ub[i] < last_ub or last_close > last_ub:
+            ub[i] = band_ub[i]
+        else:
+            ub[i] = last_ub
+
+        # 下轨
+        if band_lb[i] > last_lb or last_close < last_lb:
+            lb[i] = band_lb[i]
+        else:
+            lb[i] = last_lb
+
+        # supertrend
+        if st[i - 1] == last_ub:
+            st[i] = ub[i] if close[i] <= ub[i] else lb[i]
+        elif st[i - 1] == last_lb:
+            st[i] = lb[i] if close[i] > lb[i] else ub[i]
+    return ub, lb, st
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import talib as tl
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 指标注册表：每个指标声明输出列、所需行情列、参数、预热K线数和依赖的其它指标，
+# calculate(data, columns) 只计算请求的列及其依赖，按依赖顺序执行。
+# 各作业的 calculate_indicators 都基于这里计算，列与原先逐个实现的结果一致。
+
+INDICATORS = {}  # 名称 → {'columns', 'inputs', 'params', 'warmup', 'depends', 'func'}
+_COLUMN_OWNER = {}  # 输出列 → 指标名称
+
+
+def indicator(name, columns, inputs=('close',), warmup=0, depends=(), **params):
+    """
+    注册指标。columns 为输出列，inputs 为所需行情列，warmup 为出现第一个有效值前需要的K线数
+    （含依赖指标的预热），depends 为依赖的其它指标名称，params 作为关键字参数传给计算函数。
+    计算函数签名为 func(data, out, **params)，out 为已算出的列，返回与 columns 一一对应的值。
+    """
+    def register(func):
+        INDICATORS[name] = {'columns': tuple(columns), 'inputs': tuple(inputs), 'params': params,
+                            'warmup': warmup, 'depends': tuple(depends), 'func': func}
+        for col in columns:
+            _COLUMN_OWNER[col] = name
+        return func
+    return register
+
+
+@indicator('macd', ('macd', 'macds', 'macdh'), warmup=33, fastperiod=12, slowperiod=26, signalperiod=9)
+def _macd(data, out, fastperiod, slowperiod, signalperiod):
+    return tl.MACD(data['close'], fastperiod=fastperiod, slowperiod=slowperiod, signalperiod=signalperiod)
+
+
+@indicator('kdj', ('kdjk', 'kdjd', 'kdjj'), inputs=('high', 'low', 'close'), warmup=16,
+           fastk_period=9, slowk_period=5, slowd_period=5)
+def _kdj(data, out, fastk_period, slowk_period, slowd_period):
+    kdjk, kdjd = tl.STOCH(data['high'], data['low'], data['close'], fastk_period=fastk_period,
+                          slowk_period=slowk_period, slowk_matype=1, slowd_period=slowd_period, slowd_matype=1)
+    return kdjk, kdjd, 3 * kdjk - 2 * kdjd
+
+
+@indicator('boll', ('boll_ub', 'boll', 'boll_lb'), warmup=19)
+def _boll(data, out):
+    # 使用 tl.BBANDS 的默认参数（与原实现一致）
+    return tl.BBANDS(data['close'])
+
+
+@indicator('wr', ('wr_6', 'wr_10', 'wr_14'), inputs=('high', 'low', 'close'), warmup=13, periods=(6, 10, 14))
+def _wr(data, out, periods):
+    return tuple(tl.WILLR(data['high'], data['low'], data['close'], timeperiod=p) for p in periods)
+
+
+@indicator('cci', ('cci',), inputs=('high', 'low', 'close'), warmup=13)
+def _cci(data, out):
+    return tl.CCI(data['high'], data['low'], data['close']),
+
+
+@indicator('cci_84', ('cci_84',), inputs=('high', 'low', 'close'), warmup=96, depends=('cci',), timeperiod=84)
+def _cci_84(data, out, timeperiod):
+    return tl.SMA(out['cci'], timeperiod=timeperiod),
+
+
+@indicator('rsi', ('rsi_6', 'rsi_12', 'rsi', 'rsi_24'), warmup=24, periods=(6, 12, 14, 24))
+def _rsi(data, out, periods):
+    return tuple(tl.RSI(data['close'], timeperiod=p) for p in periods)
+
+
+@indicator('vr', ('vr',), inputs=('close', 'volume'), warmup=25, timeperiod=26)
+def _vr(data, out, timeperiod):
+    close_diff = data['close'].diff()
+    up_volume = data['volume'] * (close_diff > 0).astype(int)
+    down_volume = data['volume'] * (close_diff < 0).astype(int)
+    vr = up_volume.rolling(window=timeperiod).sum() / down_volume.rolling(window=timeperiod).sum() * 100
+    return vr.fillna(0.0).replace([np.inf, -np.inf], 0.0),
+
+
+@indicator('vr_6_sma', ('vr_6_sma',), inputs=('close', 'volume'), warmup=30, depends=('vr',), timeperiod=6)
+def _vr_6_sma(data, out, timeperiod):
+    return tl.SMA(out['vr'], timeperiod=timeperiod),
+
+
+@indicator('roc', ('roc',), warmup=10)
+def _roc(data, out):
+    return tl.ROC(data['close']),
+
+
+@indicator('dmi', ('pdi', 'mdi', 'dx', 'adx', 'adxr'), inputs=('high', 'low', 'close'), warmup=40, timeperiod=14)
+def _dmi(data, out, timeperiod):
+    high, low, close = data['high'], data['low'], data['close']
+    return (tl.PLUS_DI(high, low, close, timeperiod=timeperiod),
+            tl.MINUS_DI(high, low, close, timeperiod=timeperiod),
+            tl.DX(high, low, close, timeperiod=timeperiod),
+            tl.ADX(high, low, close, timeperiod=timeperiod),
+            tl.ADXR(high, low, close, timeperiod=timeperiod))
+
+
+@indicator('atr', ('tr', 'atr'), inputs=('high', 'low', 'close'), warmup=14)
+def _atr(data, out):
+    return tl.TRANGE(data['high'], data['low'], data['close']), tl.ATR(data['high'], data['low'], data['close'])
+
+
+@indicator('obv', ('obv',), inputs=('close', 'volume'))
+def _obv(data, out):
+    return tl.OBV(data['close'], data['volume']),
+
+
+@indicator('sar', ('sar',), inputs=('high', 'low'), warmup=1)
+def _sar(data, out):
+    return tl.SAR(data['high'], data['low']),
+
+
+@indicator('psy', ('psy',), warmup=11, timeperiod=12)
+def _psy(data, out, timeperiod):
+    price_up = (data['close'] > data['close'].shift(1)).astype(int)
+    return (price_up.rolling(timeperiod).sum() / timeperiod * 100).fillna(0),
+
+
+@indicator('psyma', ('psyma',), warmup=16, depends=('psy',), timeperiod=6)
+def _psyma(data, out, timeperiod):
+    return out['psy'].rolling(timeperiod).mean(),
+
+
+@indicator('brar', ('br', 'ar'), inputs=('open', 'high', 'low', 'close'), warmup=25, timeperiod=26)
+def _brar(data, out, timeperiod):
+    prev_close = data['close'].shift(1, fill_value=0)
+    br_up = (data['high'] - prev_close).clip(lower=0)
+    br_down = (prev_close - data['low']).clip(lower=0)
+    br = (br_up.rolling(timeperiod).sum() / br_down.rolling(timeperiod).sum()).fillna(0).replace([np.inf, -np.inf], 0) * 100
+
+    ar_up = (data['high'] - data['open']).clip(lower=0)
+    ar_down = (data['open'] - data['low']).clip(lower=0)
+    ar = (ar_up.rolling(timeperiod).sum() / ar_down.rolling(timeperiod).sum()).fillna(0).replace([np.inf, -np.inf], 0) * 100
+    return br, ar
+
+
+@indicator('emv', ('emv',), inputs=('high', 'low', 'volume'), warmup=13, timeperiod=14)
+def _emv(data, out, timeperiod):
+    hl_avg = (data['high'] + data['low']) / 2
+    prev_hl_avg = hl_avg.shift(1, fill_value=0)
+    volume = data['volume'].replace(0, 1)  # 避免除零
+    return ((hl_avg - prev_hl_avg) * (data['high'] - data['low']) / volume).rolling(timeperiod).sum(),
+
+
+@indicator('emva', ('emva',), inputs=('high', 'low', 'volume'), warmup=21, depends=('emv',), timeperiod=9)
+def _emva(data, out, timeperiod):
+    return out['emv'].rolling(timeperiod).mean(),
+
+
+@indicator('mfi', ('mfi',), inputs=('high', 'low', 'close', 'volume'), warmup=14)
+def _mfi(data, out):
+    return tl.MFI(data['high'], data['low'], data['close'], data['volume']),
+
+
+@indicator('mfisma', ('mfisma',), inputs=('high', 'low', 'close', 'volume'), warmup=43, depends=('mfi',))
+def _mfisma(data, out):
+    return tl.SMA(out['mfi']),
+
+
+@indicator('vwma', ('vwma',), inputs=('close', 'volume'))
+def _vwma(data, out):
+    return (data['close'] * data['volume']).cumsum() / data['volume'].cumsum(),
+
+
+@indicator('mvwma', ('mvwma',), inputs=('close', 'volume'), warmup=29, depends=('vwma',))
+def _mvwma(data, out):
+    return tl.SMA(out['vwma']),
+
+
+@indicator('ppo', ('ppo', 'ppos', 'ppoh'), warmup=33, fastperiod=12, slowperiod=26, signalperiod=9)
+def _ppo(data, out, fastperiod, slowperiod, signalperiod):
+    ppo = tl.PPO(data['close'], fastperiod=fastperiod, slowperiod=slowperiod, matype=1)
+    ppos = tl.EMA(ppo, timeperiod=signalperiod)
+    ppoh = ppo - ppos
+    return ppo.fillna(0), ppos.fillna(0), ppoh.fillna(0)
+
+
+@indicator('wt', ('wt1', 'wt2'), warmup=19, periods=(10, 20))
+def _wt(data, out, periods):
+    return tuple((data['close'] - tl.SMA(data['close'], timeperiod=p)) / tl.STDDEV(data['close'], timeperiod=p)
+                 for p in periods)
+
+
+@indicator('dpo', ('dpo',), warmup=19, timeperiod=20)
+def _dpo(data, out, timeperiod):
+    return data['close'] - tl.SMA(data['close'], timeperiod=timeperiod),
+
+
+@indicator('madpo', ('madpo',), warmup=48, depends=('dpo',))
+def _madpo(data, out):
+    return tl.SMA(out['dpo']),
+
+
+@indicator('vhf', ('vhf',), warmup=28, timeperiod=28)
+def _vhf(data, out, timeperiod):
+    high_close = data['close'].rolling(timeperiod).max()
+    low_close = data['close'].rolling(timeperiod).min()
+    sum_diff = abs(data['close'] - data['close'].shift(1)).rolling(timeperiod).sum()
+    return ((high_close - low_close) / sum_diff).fillna(0),
+
+
+@indicator('rvi', ('rvi',), inputs=('open', 'high', 'low', 'close'), warmup=12, timeperiod=10)
+def _rvi(data, out, timeperiod):
+    rvi_x = (
+        (data['close'] - data['open']) +
+        2 * (data['close'].shift(1) - data['open'].shift(1)) +
+        2 * (data['close'].shift(2) - data['open'].shift(2)) +
+        (data['close'].shift(3) - data['open'].shift(3))
+    ) / 6
+
+    rvi_y = (
+        (data['high'] - data['low']) +
+        2 * (data['high'].shift(1) - data['low'].shift(1)) +
+        2 * (data['high'].shift(2) - data['low'].shift(2)) +
+        (data['high'].shift(3) - data['low'].shift(3))
+    ) / 6
+    return (rvi_x.rolling(timeperiod).mean() / rvi_y.rolling(timeperiod).mean()).fillna(0),
+
+
+@indicator('rvis', ('rvis',), inputs=('open', 'high', 'low', 'close'), warmup=15, depends=('rvi',))
+def _rvis(data, out):
+    rvi = out['rvi']
+    return (rvi + 2 * rvi.shift(1) + 2 * rvi.shift(2) + rvi.shift(3)) / 6,
+
+
+@indicator('fi', ('fi',), inputs=('close', 'volume'), warmup=1)
+def _fi(data, out):
+    return (data['close'] - data['close'].shift(1)) * data['volume'],
+
+
+@indicator('force', ('force_2', 'force_13'), inputs=('close', 'volume'), warmup=13, depends=('fi',), periods=(2, 13))
+def _force(data, out, periods):
+    return tuple(tl.SMA(out['fi'], timeperiod=p) for p in periods)
+
+
+@indicator('ene', ('ene_ue', 'ene', 'ene_le'), warmup=24, timeperiod=25)
+def _ene(data, out, timeperiod):
+    ene = tl.EMA(data['close'], timeperiod=timeperiod)
+    std = tl.STDDEV(data['close'], timeperiod=timeperiod)
+    return ene + 2 * std, ene, ene - 2 * std
+
+
+@indicator('stochrsi', ('stochrsi_k', 'stochrsi_d'), warmup=20)
+def _stochrsi(data, out):
+    return tl.STOCHRSI(data['close'])
+
+
+ALL_COLUMNS = tuple(col for spec in INDICATORS.values() for col in spec['columns'])
+
+
+def resolve(columns=None):
+    """请求的列 → 需要计算的指标名称（依赖在前）"""
+    if columns is None:
+        names = list(INDICATORS)
+    else:
+        unknown = [col for col in columns if col not in _COLUMN_OWNER]
+        if unknown:
+            raise KeyError(f"未注册的指标列：{unknown}")
+        names = list(dict.fromkeys(_COLUMN_OWNER[col] for col in columns))
+
+    ordered = []
+
+    def visit(name):
+        if name in ordered:
+            return
+        for dep in INDICATORS[name]['depends']:
+            visit(dep)
+        ordered.append(name)
+
+    for name in names:
+        visit(name)
+    return ordered
+
+
+def warmup(columns=None):
+    """计算这些列时出现第一个有效值前需要的K线数"""
+    return max((INDICATORS[name]['warmup'] for name in resolve(columns)), default=0)
+
+
+def required_inputs(columns=None):
+    """计算这些列需要的行情列"""
+    return tuple(dict.fromkeys(col for name in resolve(columns) for col in INDICATORS[name]['inputs']))
+
+
+def calculate(data, columns=None):
+    """
+    计算 data（已按日期升序）上的指标，返回与 data 同索引的 DataFrame，只含请求的列（默认全部），
+    列顺序同 ALL_COLUMNS。未满足预热的位置为 NaN，由调用方统一处理。
+    """
+    out = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name in resolve(columns):
+            spec = INDICATORS[name]
+            values = spec['func'](data, out, **spec['params'])
+            for col, value in zip(spec['columns'], values):
+                out[col] = value
+    wanted = ALL_COLUMNS if columns is None else [col for col in ALL_COLUMNS if col in set(columns)]
+    return pd.DataFrame({col: np.asarray(out[col], dtype=np.float64) for col in wanted}, index=data.index)
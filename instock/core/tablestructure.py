@@ -773,6 +773,27 @@ TABLE_CN_INDEX_INDICATORS = {'name': 'cn_index_indicators', 'cn': '指数指标
                              'columns': TABLE_CN_INDEX_FOREIGN_KEY['columns'].copy()}
 TABLE_CN_INDEX_INDICATORS['columns'].update(STOCK_STATS_DATA['columns'])
 
+
+def create_indicators_data(table: dict, freq: str, cn_desc: str) -> dict:
+    """由日线指标表配置派生周线/月线指标表配置（字段相同）
+    freq: weekly/monthly
+    cn_desc: 中文周期描述
+    """
+    return {
+        'name': f"{table['name']}_{freq}",
+        'cn': f"{table['cn']}（{cn_desc}线）",
+        'columns': table['columns']
+    }
+
+
+# 周线/月线指标（由日线合成后计算）
+TABLE_CN_STOCK_INDICATORS_WEEKLY = create_indicators_data(TABLE_CN_STOCK_INDICATORS, 'weekly', '周')
+TABLE_CN_STOCK_INDICATORS_MONTHLY = create_indicators_data(TABLE_CN_STOCK_INDICATORS, 'monthly', '月')
+TABLE_CN_ETF_INDICATORS_WEEKLY = create_indicators_data(TABLE_CN_ETF_INDICATORS, 'weekly', '周')
+TABLE_CN_ETF_INDICATORS_MONTHLY = create_indicators_data(TABLE_CN_ETF_INDICATORS, 'monthly', '月')
+TABLE_CN_INDEX_INDICATORS_WEEKLY = create_indicators_data(TABLE_CN_INDEX_INDICATORS, 'weekly', '周')
+TABLE_CN_INDEX_INDICATORS_MONTHLY = create_indicators_data(TABLE_CN_INDEX_INDICATORS, 'monthly', '月')
+
 ___tmp_columns = TABLE_CN_INDEX_FOREIGN_KEY['columns'].copy()
 ___tmp_columns.update(TABLE_CN_INDEX_BACKTEST_DATA['columns'])
 
@@ -1236,16 +1257,22 @@ TABLE_REGISTRY = {
     # 指标与回测表
     # ----------------------
     'cn_stock_indicators': TABLE_CN_STOCK_INDICATORS,
+    'cn_stock_indicators_weekly': TABLE_CN_STOCK_INDICATORS_WEEKLY,
+    'cn_stock_indicators_monthly': TABLE_CN_STOCK_INDICATORS_MONTHLY,
     'cn_stock_indicators_buy': TABLE_CN_STOCK_INDICATORS_BUY,
     'cn_stock_indicators_sell': TABLE_CN_STOCK_INDICATORS_SELL,
     'cn_stock_backtest_data': TABLE_CN_STOCK_BACKTEST_DATA,
 
     'cn_etf_indicators': TABLE_CN_ETF_INDICATORS,
+    'cn_etf_indicators_weekly': TABLE_CN_ETF_INDICATORS_WEEKLY,
+    'cn_etf_indicators_monthly': TABLE_CN_ETF_INDICATORS_MONTHLY,
     'cn_etf_indicators_buy': TABLE_CN_ETF_INDICATORS_BUY,
     'cn_etf_indicators_sell': TABLE_CN_ETF_INDICATORS_SELL,
     'cn_etf_backtest_data': TABLE_CN_ETF_BACKTEST_DATA,
 
     'cn_index_indicators': TABLE_CN_INDEX_INDICATORS,
+    'cn_index_indicators_weekly': TABLE_CN_INDEX_INDICATORS_WEEKLY,
+    'cn_index_indicators_monthly': TABLE_CN_INDEX_INDICATORS_MONTHLY,
     'cn_index_indicators_buy': TABLE_CN_INDEX_INDICATORS_BUY,
     'cn_index_indicators_sell': TABLE_CN_INDEX_INDICATORS_SELL,
     'cn_index_backtest_data': TABLE_CN_INDEX_BACKTEST_DATA,
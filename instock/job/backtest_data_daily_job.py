@@ -16,10 +16,9 @@ import numpy as np
 import os.path
 import sys
 import datetime
-import mysql.connector
-from sqlalchemy import create_engine, DATE, FLOAT, VARCHAR, INT
+from sqlalchemy import DATE, FLOAT, VARCHAR, INT
 from mysql.connector import Error
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
+from instock.lib.database import db_host, db_user, db_password, db_database, DBManager, get_engine, update_db_from_df
 
 # 数据库配置
 db_config = {
@@ -124,7 +123,7 @@ backtest_columns = [
 
 class StockHistData:
     def __init__(self):
-        self.engine = create_engine(
+        self.engine = get_engine(
             f"mysql+mysqlconnector://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
         )
 
@@ -193,7 +192,7 @@ def process_table(table, hist_data):
     table_name = table['name']
 
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = DBManager.get_new_connection()
         cursor = conn.cursor()
         cursor.execute(f"""
             SELECT date, date_int, code , code_int, name, strategy, close, kdjj, turnover, jingliuru_cn, industry, up_sentiment, down_sentiment, industry_kdjj, industry_kdjj_day1, industry_kdj, industry_wr, industry_cci, industry_sentiment
@@ -279,31 +278,16 @@ def process_table(table, hist_data):
                 # print(f"示例数据：{update_row[:8]}...{update_row[-3:]}")
                 update_data.append(tuple(update_row))
 
-            # 添加SQL调试信息
-            print(f"\n生成的UPDATE语句结构：")
-            set_clause = ', '.join([f'{col}=%s' for col in backtest_columns[2:]])
-            # print(f"SET字段数：{set_clause}")
-            print(f"SET子句字段数：{len(backtest_columns[2:])} 实际：{set_clause.count('%s')}")
-            print(f"WHERE条件参数数：2")
-            print(f"总占位符数：{set_clause.count('%s') + 2}")
-
-            update_query = f"""
-                UPDATE {table_name}
-                SET {set_clause}
-                WHERE date_int=%s AND code_int=%s
-            """
-            print(f"update_query{update_query}")
-            try:
-                print(f"开始执行批量更新，记录数：{len(update_data)}")
-                cursor.executemany(update_query, update_data)
-                conn.commit()
-                print(f"成功更新{len(update_data)}条记录")
-            except Error as e:
-                print(f"更新失败: {str(e)}")
+            # 整批写入临时表后按 (date_int, code_int) 一次性回写，替代逐行 UPDATE
+            update_df = pd.DataFrame(update_data, columns=backtest_columns[2:] + ['date_int', 'code_int'])
+            print(f"开始执行批量更新，记录数：{len(update_df)}")
+            if update_db_from_df(update_df, table_name, ('date_int', 'code_int')):
+                print(f"成功更新{len(update_df)}条记录")
+            else:
+                print(f"更新失败: {table_name}")
                 # 打印第一条失败记录的参数
-                if update_data:
-                    print(f"示例参数：{update_data[0]}")
-                    print(f"参数数量：{len(update_data[0])}")
+                print(f"示例参数：{update_data[0]}")
+                print(f"参数数量：{len(update_data[0])}")
 
 
     except Error as e:
@@ -363,7 +347,7 @@ def calculate_rates(stock, stock_data):
 def check_table_exists(table_name):
     """检查表是否存在"""
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = DBManager.get_new_connection()
         cursor = conn.cursor()
         cursor.execute(f"SHOW TABLES LIKE '{table_name}'")
         return cursor.fetchone() is not None
@@ -377,7 +361,7 @@ def check_table_exists(table_name):
 def create_table(table):
     """创建表结构"""
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = DBManager.get_new_connection()
         cursor = conn.cursor()
 
         columns = []
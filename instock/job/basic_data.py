@@ -18,7 +18,6 @@ import numpy as np
 import pandas as pd
 import time
 import datetime 
-import mysql.connector
 import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
 import pandas_market_calendars as mcal
@@ -27,7 +26,8 @@ from typing import List, Dict
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset, db_port
+from instock.lib.database import DBManager, get_table_columns, add_missing_columns
+import instock.lib.http_session as http_session
 from concurrent.futures import ThreadPoolExecutor
 
 
@@ -177,7 +177,7 @@ def fetch_selection_data(
      # 1. 获取第一页数据并计算总页数
      first_page_params = {**params, page_param_name: start_page}
      try:
-         r = requests.get(url, params=first_page_params)
+         r = http_session.get(url, params=first_page_params)
          r.raise_for_status()
          data_json = r.json()
          data_count = data_json["result"]["count"]
@@ -192,7 +192,7 @@ def fetch_selection_data(
      def fetch_page(page: int) -> List[Dict]:
          page_params = {**params, page_param_name: page}
          try:
-             r = requests.get(url, params=page_params, headers=HEADERS)
+             r = http_session.get(url, params=page_params, headers=HEADERS)
              r.raise_for_status()
              return r.json()["result"]["data"]
          except Exception:
@@ -456,7 +456,7 @@ def fetch_zh_a_spot_data(
         page_param_name: start_page  # 起始页码
     }
     try:
-        r = requests.get(url, params=first_page_params)
+        r = http_session.get(url, params=first_page_params)
         r.raise_for_status()
         data_json = r.json()
         data_count = data_json["data"]["total"]
@@ -476,7 +476,7 @@ def fetch_zh_a_spot_data(
             page_param_name: page   # 正确设置页码参数
         }
         try:
-            r = requests.get(url, params=page_params, headers=HEADERS)
+            r = http_session.get(url, params=page_params, headers=HEADERS)
             r.raise_for_status()
             return r.json()["data"]["diff"]
         except Exception as e:
@@ -758,7 +758,7 @@ def etf_spot_data(
         page_param_name: start_page  # 起始页码
     }
     try:
-        r = requests.get(url, params=first_page_params)
+        r = http_session.get(url, params=first_page_params)
         r.raise_for_status()
         data_json = r.json()
         data_count = data_json["data"]["total"]
@@ -778,7 +778,7 @@ def etf_spot_data(
             page_param_name: page   # 正确设置页码参数
         }
         try:
-            r = requests.get(url, params=page_params, headers=HEADERS)
+            r = http_session.get(url, params=page_params, headers=HEADERS)
             r.raise_for_status()
             return r.json()["data"]["diff"]
         except Exception as e:
@@ -1064,7 +1064,7 @@ def index_spot_data(
         page_param_name: start_page  # 起始页码
     }
     try:
-        r = requests.get(url, params=first_page_params)
+        r = http_session.get(url, params=first_page_params)
         r.raise_for_status()
         data_json = r.json()
         data_count = data_json["data"]["total"]
@@ -1084,7 +1084,7 @@ def index_spot_data(
             page_param_name: page   # 正确设置页码参数
         }
         try:
-            r = requests.get(url, params=page_params, headers=HEADERS)
+            r = http_session.get(url, params=page_params, headers=HEADERS)
             r.raise_for_status()
             return r.json()["data"]["diff"]
         except Exception as e:
@@ -1357,42 +1357,6 @@ def fetch_and_format_stock_info(sql):
             conn.close()
 
 
-
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                port=db_port,
-                password=db_password,
-                database=db_database,
-                charset=db_charset
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
-
-
 def create_table_if_not_exists(table_name):
     # 创建表（不含索引）
     create_table_sql = f"""
@@ -1476,60 +1440,29 @@ def create_table_if_not_exists(table_name):
 
 
 def 同步表结构(conn, table_name, data_columns):
-    """动态添加缺失字段，附带调试日志和错误处理"""
+    """动态添加缺失字段：字段集合进程内缓存，缺失字段一条 ALTER TABLE 一次性添加"""
     try:
-        cursor = conn.cursor(buffered=True)
-        
-        # 调试：打印基本信息
-        # print(f"\n[DEBUG] 开始同步表结构：{table_name}")
-        # print(f"[DEBUG] 数据列要求字段：{data_columns}")
-
-        # 获取现有字段
-        cursor.execute(f"DESCRIBE `{table_name}`;")
-        existing_columns = [row[0] for row in cursor.fetchall()]
-        # print(f"[DEBUG] 数据库现有字段：{existing_columns}")
+        existing_columns = get_table_columns(table_name, conn)
 
         # 获取配置表字段
         table_config = tbs.TABLE_REGISTRY.get(table_name, {})
-        all_required_columns = list(table_config.get('columns', {}).keys())
-        # print(f"[DEBUG] 配置表要求字段：{all_required_columns}")
+        config_columns = table_config.get('columns', {})
 
-        # 遍历处理字段
+        missing_columns = {}
         for col in data_columns:
-            try:
-                # print(f"\n[DEBUG] 正在检查字段：{col}")
-                
-                if col not in existing_columns:
-                    if col in all_required_columns:
-                        # 从配置获取字段类型
-                        col_info = table_config['columns'][col]
-                        sql_type = tbs._get_sql_type(col_info['type'])
-                        
-                        # 执行添加字段
-                        alter_sql = f"ALTER TABLE `{table_name}` ADD COLUMN `{col}` {sql_type};"
-                        print(f"[EXECUTE] 执行SQL：{alter_sql}")
-                        
-                        cursor.execute(alter_sql)
-                        # print(f"[SUCCESS] 字段 {col} 添加成功")
-                    else:
-                        print(f"[WARNING] 字段 {col} 不在配置表中，已跳过")
-                else:
-                    pass
-                    # print(f"[INFO] 字段 {col} 已存在，无需添加")
-            except Exception as col_error:
-                print(f"[ERROR] 处理字段 {col} 时发生错误：{str(col_error)}")
-                conn.rollback()  # 回滚当前字段操作
+            if col in existing_columns:
+                continue
+            if col in config_columns:
+                missing_columns[col] = tbs._get_sql_type(config_columns[col]['type'])
+            else:
+                print(f"[WARNING] 字段 {col} 不在配置表中，已跳过")
 
-        conn.commit()
-        print(f"[SUCCESS] 表 {table_name} 结构同步完成")
+        if missing_columns and add_missing_columns(table_name, missing_columns, conn) is None:
+            print(f"[CRITICAL] 同步表结构失败：{table_name}")
 
     except Exception as main_error:
         print(f"[CRITICAL] 同步表结构主流程失败：{str(main_error)}")
         conn.rollback()
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            print("[INFO] 数据库游标已关闭")
 
 
 def sql语句生成器(table_name, data, batch_size=500):
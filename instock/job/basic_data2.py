@@ -1,4 +1,11 @@
-import requests
+# 在项目运行时，临时将项目路径添加到环境变量
+import os.path
+import sys
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
+
+import instock.lib.http_session as http_session
 import pandas as pd
 import pandas_market_calendars as mcal
 from tqdm import tqdm  # 进度条工具，可选
@@ -16,7 +23,7 @@ def fetch_tencent_stock_data(offset=0, count=200):
         "count": count
     }
     try:
-        response = requests.get(url, params=params)
+        response = http_session.get(url, params=params)
         if response.status_code == 200:
             data = response.json()
             if data['code'] == 0:
@@ -10,12 +10,10 @@ sys.path.append(cpath)
 
 import json
 import math
-import requests
 import numpy as np
 import pandas as pd
 import time
 import datetime
-import mysql.connector
 import instock.lib.database as mdb
 import pandas_market_calendars as mcal
 import pytz
@@ -24,7 +22,12 @@ from typing import List, Dict
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
+from instock.lib.database import DBManager, load_data_upsert, executemany_upsert, get_table_columns, add_missing_columns
+from instock.lib.rate_control import get_controller
+import instock.lib.http_session as http_session
+from instock.lib.kline_parse import kline_columns, parse_klines
+from instock.lib.hist_increment import (FULL_HISTORY_BEG, get_last_bars, incremental_beg, is_up_to_date,
+                                        trim_overlap)
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
@@ -33,6 +36,9 @@ HEADERS = {
     "Connection": "keep-alive"
 }
 
+# 无参数运行（当天）时按库中各代码最后一根K线增量抓取，补齐漏跑的交易日；指定日期/区间时按给定区间抓取
+INCREMENTAL_FETCH = True
+
 def is_a_stock(code):
     """判断是否属于需要采集的A股"""
     # 处理带市场前缀的情况（如sh600000）
@@ -158,8 +164,8 @@ def _get_sql_type(py_type):
 
 ########################################
 #获取沪市A股+深市A股历史数据并写入数据库
-def fetch_all_stock_hist(beg: str = None, end: str = None):
-    """获取全量股票历史数据（支持日期区间）"""
+def fetch_all_stock_hist(beg: str = None, end: str = None, incremental: bool = False):
+    """获取全量股票历史数据（支持日期区间）；incremental 时各代码从库中最后一根K线起增量抓取"""
     # 处理日期参数
     today = datetime.datetime.now().strftime("%Y%m%d")
     beg = beg or today
@@ -182,6 +188,9 @@ def fetch_all_stock_hist(beg: str = None, end: str = None):
     stock_df = stock_df[stock_df['code'].apply(is_a_stock)]
     print(f"待采集股票数量：{len(stock_df)}")
 
+    # 增量模式：一次查询取出各代码库中最后一根K线
+    last_bars = get_last_bars(CN_STOCK_HIST_DAILY_DATA['name']) if incremental else {}
+
     # 准备数据容器
     daily_data = pd.DataFrame()
 
@@ -192,7 +201,10 @@ def fetch_all_stock_hist(beg: str = None, end: str = None):
         name = row['name']
         period = "daily"
 
-        data = fetch_single_hist(code, market_id, period, name, "stock", beg, end)
+        last = last_bars.get(code)
+        if is_up_to_date(last, end):
+            continue
+        data = fetch_single_hist(code, market_id, period, name, "stock", beg, end, last=last)
         if data is None:
             continue
 
@@ -200,17 +212,14 @@ def fetch_all_stock_hist(beg: str = None, end: str = None):
         if data['period'] == 'daily':
             daily_data = pd.concat([daily_data, df], ignore_index=True)
 
-        # 添加延时
-        time.sleep(0.5)  # 每次请求后延时0.5秒
-
     sync_and_write(CN_STOCK_HIST_DAILY_DATA['name'], daily_data)
     print(f"[Success] 股票历史数据写入完成（日：{len(daily_data)}）")
 
 
 ########################################
 #获取ETF基金历史数据并写入数据库
-def fetch_all_etf_hist(beg: str = None, end: str = None):
-    """获取全量股票历史数据（支持日期区间）"""
+def fetch_all_etf_hist(beg: str = None, end: str = None, incremental: bool = False):
+    """获取全量股票历史数据（支持日期区间）；incremental 时各代码从库中最后一根K线起增量抓取"""
     # 处理日期参数
     today = datetime.datetime.now().strftime("%Y%m%d")
     beg = beg or today
@@ -229,6 +238,9 @@ def fetch_all_etf_hist(beg: str = None, end: str = None):
     stock_df = pd.read_sql("SELECT code, market_id, name FROM cn_etf_info WHERE date = (SELECT MAX(date) FROM cn_etf_info WHERE  code_int = 159001) AND market_id IS NOT NULL", conn)
     conn.close()
 
+    # 增量模式：一次查询取出各代码库中最后一根K线
+    last_bars = get_last_bars(CN_ETF_HIST_DAILY_DATA['name']) if incremental else {}
+
     # 准备数据容器
     daily_data = pd.DataFrame()
 
@@ -239,7 +251,10 @@ def fetch_all_etf_hist(beg: str = None, end: str = None):
         name = row['name']
         period = "daily"
 
-        data = fetch_single_hist(code, market_id, period, name, "etf", beg, end)
+        last = last_bars.get(code)
+        if is_up_to_date(last, end):
+            continue
+        data = fetch_single_hist(code, market_id, period, name, "etf", beg, end, last=last)
         if data is None:
             continue
 
@@ -247,16 +262,13 @@ def fetch_all_etf_hist(beg: str = None, end: str = None):
         if data['period'] == 'daily':
             daily_data = pd.concat([daily_data, df], ignore_index=True)
 
-        # 添加延时
-        time.sleep(0.5)
-
     sync_and_write(CN_ETF_HIST_DAILY_DATA['name'], daily_data)
     print(f"[Success] 基金历史数据写入完成（日：{len(daily_data)}）")
 
 ########################################
 #获取指数历史数据并写入数据库
-def fetch_all_index_hist(beg: str = None, end: str = None):
-    """获取全量股票历史数据（支持日期区间）"""
+def fetch_all_index_hist(beg: str = None, end: str = None, incremental: bool = False):
+    """获取全量股票历史数据（支持日期区间）；incremental 时各代码从库中最后一根K线起增量抓取"""
     # 处理日期参数
     today = datetime.datetime.now().strftime("%Y%m%d")
     beg = beg or today
@@ -275,6 +287,9 @@ def fetch_all_index_hist(beg: str = None, end: str = None):
     stock_df = pd.read_sql("SELECT code, market_id, name FROM cn_index_info WHERE date = (SELECT MAX(date) FROM cn_index_info WHERE code_int = 1) AND market_id IS NOT NULL", conn)
     conn.close()
 
+    # 增量模式：一次查询取出各代码库中最后一根K线
+    last_bars = get_last_bars(CN_INDEX_HIST_DAILY_DATA['name']) if incremental else {}
+
     # 准备数据容器
     daily_data = pd.DataFrame()
 
@@ -285,7 +300,10 @@ def fetch_all_index_hist(beg: str = None, end: str = None):
         name = row['name']
         period = "daily"
 
-        data = fetch_single_hist(code, market_id, period, name, "index", beg, end)
+        last = last_bars.get(code)
+        if is_up_to_date(last, end):
+            continue
+        data = fetch_single_hist(code, market_id, period, name, "index", beg, end, last=last)
         if data is None:
             continue
 
@@ -293,9 +311,6 @@ def fetch_all_index_hist(beg: str = None, end: str = None):
         if data['period'] == 'daily':
             daily_data = pd.concat([daily_data, df], ignore_index=True)
 
-        # 添加延时
-        time.sleep(0.5)
-
     sync_and_write(CN_INDEX_HIST_DAILY_DATA['name'], daily_data)
     print(f"[Success] 指数历史数据写入完成（日：{len(daily_data)}）")
 
@@ -314,8 +329,13 @@ lmt=1000000&
 _=1748611807385
 '''
 
-def fetch_single_hist(code: str, market_id: str, period: str, name: str, data_type: str, beg: str, end: str):
-    """通用函数：获取单个代码的历史数据（股票/ETF/指数）"""
+def fetch_single_hist(code: str, market_id: str, period: str, name: str, data_type: str, beg: str, end: str,
+                      last: tuple = None):
+    """
+    通用函数：获取单个代码的历史数据（股票/ETF/指数）。
+    last 为库中该代码最后一根K线 (date_int, 收盘价) 时增量请求，只返回其后的新K线；
+    收盘价与接口对不上时从该日起返回（覆盖库中的K线），该日在接口中已不存在时全量重抓。
+    """
     try:
         url = "http://push2his.eastmoney.com/api/qt/stock/kline/get"
 
@@ -337,37 +357,36 @@ def fetch_single_hist(code: str, market_id: str, period: str, name: str, data_ty
             "secid": f"{market_id}.{code}",
             # "beg": "20200101",
             # "end": datetime.datetime.now().strftime("%Y%m%d"),
-            "beg": beg,  # 使用传入的beg
+            "beg": incremental_beg(last, beg),  # 增量时从库中最后一根K线起
             "end": end,  # 使用传入的end
             "lmt": "1000000",
             "_": int(time.time()*1000)
         }
 
-        # 发送请求与数据处理（与原逻辑一致）
-        r = requests.get(url, params=params, headers=HEADERS, timeout=10)
-        data_json = r.json()
+        # 发送请求（请求间隔由 rate_control 按站点自适应调整）
+        with get_controller(url).pace():
+            r = http_session.get(url, params=params, headers=HEADERS, timeout=10)
+            r.raise_for_status()
+            data_json = r.json()
         if not data_json.get("data"):
             return None
 
-        # 数据处理与字段映射
-        df = pd.DataFrame([item.split(",") for item in data_json["data"]["klines"]])
-        en_name = {
-            table_config['columns'][k]['map']: table_config['columns'][k]['en']
-            for k in table_config['columns']
-            if 'map' in table_config['columns'][k]
-        }
-
-        # 格式转换与字段添加
-        numeric_cols = [1,2,3,4,5,6,7,8,9,10]
-        df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce')
-        df.rename(columns=en_name, inplace=True)
-        df['date'] = pd.to_datetime(df['date'])
-        df['date_int'] = df['date'].astype(str).str.replace('-', '')
+        # 数据处理与字段映射：klines 一次解析为数值列，date_int 由日期算出
+        df = parse_klines(data_json["data"]["klines"], kline_columns(table_config['columns']))
         df['code'] = code
         df['code_int'] = code
         df['period'] = period
         df['name'] = name
 
+        # 增量：去掉用于比对的重叠K线；收盘价对不上时从该日起覆盖，该日已不存在时全量重抓
+        if last is not None:
+            df, refetch = trim_overlap(df, last)
+            if refetch:
+                print(f"[Warning] {code} 库中最后一根K线在接口中已不存在，全量重抓")
+                return fetch_single_hist(code, market_id, period, name, data_type, FULL_HISTORY_BEG, end)
+            if df.empty:
+                return None
+
         return {'period': period, 'df': df, 'df_columns': df.columns}
     except Exception as e:
         print(f"获取{code} {period}数据失败: {str(e)}")
@@ -379,8 +398,7 @@ def fetch_single_hist(code: str, market_id: str, period: str, name: str, data_ty
 sync_and_write(table_name: str, data: pd.DataFrame):同步表结构并写入数据
 create_table_if_not_exists(table_name)：检查数据表是否存在，如果不存在，则创建数据库并添加索引
 同步表结构(conn, table_name, data_columns)： 动态检查并自动添加表中缺失的字段
-sql语句生成器(table_name,data)：带入参数数据表名和数据，生成数据插入语句
-execute_raw_sql(sql,params)：执行插入数据表
+load_data_upsert / executemany_upsert：instock.lib.database 中的批量写入（LOAD DATA 优先，参数化写入兜底）
 convert_date_format(input_date: str)：将 yyyy-mm-dd 格式转换为 yyyymmdd 格式
 """
 
@@ -418,14 +436,12 @@ def sync_and_write(table_name: str, data: pd.DataFrame):
         # 原有逻辑：同步表结构
         同步表结构(conn, table_name, data.columns)
 
-        # 原有逻辑：生成SQL
-        sql_txt = sql语句生成器(table_name, data)
-
-        # ============== 修改位置 ==============
-        # 替换原有的 execute_raw_sql 调用
-        # 原代码：if not execute_raw_sql(sql_txt)
-        if not execute_raw_sql(sql_txt, conn):  # 传入连接对象
-            raise Exception(f"{table_name} 写入失败")
+        # LOAD DATA 批量写入，失败时回退到参数化批量写入
+        if 'code' in data.columns:
+            data['code_int'] = data['code'].astype(int)
+        if not load_data_upsert(table_name, data, unique_keys=['date', 'code'], conn=conn):
+            if not executemany_upsert(table_name, data, unique_keys=['date', 'code'], conn=conn):
+                raise Exception(f"{table_name} 写入失败")
 
         # ============== 新增代码开始 ==============
         # 2. 启用索引（独立事务提交）
@@ -447,39 +463,6 @@ def sync_and_write(table_name: str, data: pd.DataFrame):
             cursor.close()
             conn.close()
 
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
-
 
 def create_table_if_not_exists(table_name):
     # 创建表（不含索引）
@@ -565,134 +548,30 @@ def create_table_if_not_exists(table_name):
 
 
 def 同步表结构(conn, table_name, data_columns):
-    """动态添加缺失字段，附带调试日志和错误处理"""
+    """动态添加缺失字段：字段集合进程内缓存，缺失字段一条 ALTER TABLE 一次性添加"""
     try:
-        cursor = conn.cursor(buffered=True)
-
-        # 调试：打印基本信息
-        # print(f"\n[DEBUG] 开始同步表结构：{table_name}")
-        # print(f"[DEBUG] 数据列要求字段：{data_columns}")
-
-        # 获取现有字段
-        cursor.execute(f"DESCRIBE `{table_name}`;")
-        existing_columns = [row[0] for row in cursor.fetchall()]
-        # print(f"[DEBUG] 数据库现有字段：{existing_columns}")
+        existing_columns = get_table_columns(table_name, conn)
 
         # 获取配置表字段
         table_config = TABLE_REGISTRY.get(table_name, {})
-        all_required_columns = list(table_config.get('columns', {}).keys())
-        # print(f"[DEBUG] 配置表要求字段：{all_required_columns}")
+        config_columns = table_config.get('columns', {})
 
-        # 遍历处理字段
+        missing_columns = {}
         for col in data_columns:
-            try:
-                # print(f"\n[DEBUG] 正在检查字段：{col}")
-
-                if col not in existing_columns:
-                    if col in all_required_columns:
-                        # 从配置获取字段类型
-                        col_info = table_config['columns'][col]
-                        sql_type = _get_sql_type(col_info['type'])
-
-                        # 执行添加字段
-                        alter_sql = f"ALTER TABLE `{table_name}` ADD COLUMN `{col}` {sql_type};"
-                        print(f"[EXECUTE] 执行SQL：{alter_sql}")
-
-                        cursor.execute(alter_sql)
-                        # print(f"[SUCCESS] 字段 {col} 添加成功")
-                    else:
-                        print(f"[WARNING] 字段 {col} 不在配置表中，已跳过")
-                else:
-                    pass
-                    # print(f"[INFO] 字段 {col} 已存在，无需添加")
-            except Exception as col_error:
-                print(f"[ERROR] 处理字段 {col} 时发生错误：{str(col_error)}")
-                conn.rollback()  # 回滚当前字段操作
+            if col in existing_columns:
+                continue
+            if col in config_columns:
+                missing_columns[col] = _get_sql_type(config_columns[col]['type'])
+            else:
+                print(f"[WARNING] 字段 {col} 不在配置表中，已跳过")
 
-        conn.commit()
-        print(f"[SUCCESS] 表 {table_name} 结构同步完成")
+        if missing_columns and add_missing_columns(table_name, missing_columns, conn) is None:
+            print(f"[CRITICAL] 同步表结构失败：{table_name}")
 
     except Exception as main_error:
         print(f"[CRITICAL] 同步表结构主流程失败：{str(main_error)}")
         conn.rollback()
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            print("[INFO] 数据库游标已关闭")
-
-
-def sql语句生成器(table_name, data, batch_size=5000):
-    if 'code' in data.columns:
-        data['code_int'] = data['code'].astype(int)
-
-    columns = ', '.join([f"`{col}`" for col in data.columns])
-    unique_keys = ['date', 'code']
-    update_clause = ', '.join([f"`{col}`=VALUES(`{col}`)" for col in data.columns if col not in unique_keys])
-
-    # 分批次处理数据
-    sql_batches = []
-    for i in range(0, len(data), batch_size):
-        batch = data.iloc[i:i+batch_size]
-        value_rows = []
-        for row in batch.itertuples(index=False):
-            values = []
-            for item in row:
-                if pd.isna(item):
-                    values.append("NULL")
-                elif isinstance(item, (datetime.date, datetime.datetime)):
-                    values.append(f"'{item.strftime('%Y-%m-%d')}'")
-                elif isinstance(item, (int, float)):
-                    values.append(str(item))
-                else:
-                    cleaned = str(item).replace("'", "''")
-                    values.append(f"'{cleaned}'")
-            value_rows.append(f"({', '.join(values)})")
-
-        values_str = ',\n'.join(value_rows)
-        sql = f"""
-            INSERT INTO `{table_name}` ({columns})
-            VALUES {values_str}
-            ON DUPLICATE KEY UPDATE {update_clause};
-        """
-        sql_batches.append(sql)
-
-    return '\n'.join(sql_batches)
-
-
-def execute_raw_sql(sql, conn=None):
-    """执行原始SQL（新增连接复用）"""
-    # ============== 修改开始 ==============
-    # 允许外部传入连接
-    if not conn:
-        conn = DBManager.get_new_connection()
-    if not conn:
-        return False
-    # ============== 修改结束 ==============
 
-    try:
-        cursor = conn.cursor(buffered=True)
-        statements = [s.strip() for s in sql.split(';') if s.strip()]
-
-        for statement in statements:
-            try:
-                cursor.execute(statement)
-                if cursor.with_rows:
-                    cursor.fetchall()  # 消费结果集
-            except Exception as e:
-                print(f"执行失败: {statement[:100]}... | 错误: {e}")
-                return False
-        return True
-    except Error as e:
-        print(f"数据库错误: {e}")
-        return False
-    finally:
-        # ============== 修改开始 ==============
-        # 仅关闭外部创建的连接
-        if not conn:  # 只有当conn是本地创建时才关闭
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
-        # ============== 修改结束 ==============
 
 # def execute_raw_sql(sql, params=None, max_query_size=1024*1024, batch_size=5000):
 #     """改进后的SQL执行函数，解决Commands out of sync问题"""
@@ -784,9 +663,9 @@ def main():
             print(f"[{now.strftime('%Y-%m-%d %H:%M')}] 非交易时段，终止执行")
             return
         today = now.strftime("%Y%m%d")
-        fetch_all_stock_hist(today, today)
-        fetch_all_etf_hist(today, today)
-        fetch_all_index_hist(today, today)
+        fetch_all_stock_hist(today, today, incremental=INCREMENTAL_FETCH)
+        fetch_all_etf_hist(today, today, incremental=INCREMENTAL_FETCH)
+        fetch_all_index_hist(today, today, incremental=INCREMENTAL_FETCH)
 
     # 场景2: 单日期模式
     elif len(sys.argv) == 2:
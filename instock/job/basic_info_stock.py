@@ -17,12 +17,11 @@ import numpy as np
 import pandas as pd
 import time
 import datetime
-import mysql.connector
 import pandas_market_calendars as mcal
 from mysql.connector import Error
 from typing import List, Dict
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
+from instock.lib.database import DBManager
 
 
 
@@ -81,55 +80,6 @@ def get_stock_basic_info():
     return df
 
 ########################################################################
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset,
-                use_pure=True  # 强制使用纯Python实现
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
-
-    @staticmethod
-    def query_sql(sql: str, params=None):
-        """执行查询SQL并返回DataFrame"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                return pd.read_sql(sql, connection)
-            except Error as e:
-                print(f"Error while querying SQL: {e}")
-                return pd.DataFrame()
-            finally:
-                if connection.is_connected():
-                    connection.close()
-        else:
-            return pd.DataFrame()
 
 
 def sql_batch_generator(table_name, data, batch_size=500):
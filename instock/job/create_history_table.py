@@ -1,58 +1,17 @@
 #!/usr/local/bin/python3
 # -*- coding: utf-8 -*-
 
-# import os.path
-# import sys
+import os.path
+import sys
 
-# cpath_current = os.path.dirname(os.path.dirname(__file__))
-# cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
-# sys.path.append(cpath)
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
 
-import mysql.connector
-from mysql.connector import Error
+from instock.lib.database import DBManager
 # from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
 
 
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                # host=db_host,
-                # user=db_user,
-                # password=db_password,
-                # database=db_database,
-                # charset=db_charset
-                host="rm-uf6kkirh7qc88ug36fo.mysql.rds.aliyuncs.com",
-                user="aheng",
-                password="Admin888dashabi",
-                database="instockdb",
-                charset="utf8mb4",
-                use_pure=True  # 强制使用纯Python实现
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
-
-
 def create_tables():
     """创建实时股票数据表"""
     # 腾讯实时股票表
@@ -10,19 +10,21 @@ sys.path.append(cpath)
 
 import json
 import math
-import requests
 import numpy as np
 import pandas as pd
 import time
 import datetime
-import mysql.connector
 import pandas_market_calendars as mcal
 import pytz
 from mysql.connector import Error
 from typing import List, Dict
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
 from tqdm import tqdm
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
+from instock.lib.database import DBManager, load_data_upsert, executemany_upsert, get_table_columns, add_missing_columns
+import instock.lib.http_session as http_session
+from instock.lib.kline_parse import kline_columns, parse_klines
+from instock.lib.hist_increment import (FULL_HISTORY_BEG, get_last_bars, incremental_beg, is_up_to_date,
+                                        trim_overlap)
 
 # 设置请求头
 HEADERS = {
@@ -32,6 +34,9 @@ HEADERS = {
     "Connection": "keep-alive"
 }
 
+# 无参数运行（当天）时按库中各代码最后一根K线增量抓取，补齐漏跑的交易日；指定日期/区间时按给定区间抓取
+INCREMENTAL_FETCH = True
+
 def is_a_stock(code):
     """判断是否属于需要采集的A股"""
     # 处理带市场前缀的情况（如sh600000）
@@ -102,39 +107,6 @@ TABLE_REGISTRY = {
     'cn_index_hist_monthly': CN_INDEX_HIST_MONTHLY_DATA,
 }
 
-class DBManager:
-    """数据库连接管理类"""
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
 
 def _get_sql_type(py_type):
     """将 SQLAlchemy 类型转换为数据库原生类型字符串"""
@@ -243,112 +215,30 @@ def create_table_if_not_exists(table_name):
     create_index("idx_date_int", ["date_int"])
 
 def 同步表结构(conn, table_name, data_columns):
-    """动态添加缺失字段"""
+    """动态添加缺失字段：字段集合进程内缓存，缺失字段一条 ALTER TABLE 一次性添加"""
     try:
-        cursor = conn.cursor(buffered=True)
-
-        # 获取现有字段
-        cursor.execute(f"DESCRIBE `{table_name}`;")
-        existing_columns = [row[0] for row in cursor.fetchall()]
+        existing_columns = get_table_columns(table_name, conn)
 
         # 获取配置表字段
         table_config = TABLE_REGISTRY.get(table_name, {})
-        all_required_columns = list(table_config.get('columns', {}).keys())
+        config_columns = table_config.get('columns', {})
 
-        # 遍历处理字段
+        missing_columns = {}
         for col in data_columns:
-            try:
-                if col not in existing_columns:
-                    if col in all_required_columns:
-                        # 从配置获取字段类型
-                        col_info = table_config['columns'][col]
-                        sql_type = _get_sql_type(col_info['type'])
-
-                        # 执行添加字段
-                        alter_sql = f"ALTER TABLE `{table_name}` ADD COLUMN `{col}` {sql_type};"
-                        cursor.execute(alter_sql)
-                    else:
-                        print(f"[WARNING] 字段 {col} 不在配置表中，已跳过")
-            except Exception as col_error:
-                print(f"[ERROR] 处理字段 {col} 时发生错误：{str(col_error)}")
-                conn.rollback()  # 回滚当前字段操作
+            if col in existing_columns:
+                continue
+            if col in config_columns:
+                missing_columns[col] = _get_sql_type(config_columns[col]['type'])
+            else:
+                print(f"[WARNING] 字段 {col} 不在配置表中，已跳过")
+
+        if missing_columns and add_missing_columns(table_name, missing_columns, conn) is None:
+            print(f"[CRITICAL] 同步表结构失败：{table_name}")
 
-        conn.commit()
     except Exception as main_error:
         print(f"[CRITICAL] 同步表结构主流程失败：{str(main_error)}")
         conn.rollback()
-    finally:
-        if conn.is_connected():
-            cursor.close()
 
-def sql语句生成器(table_name, data, batch_size=5000):
-    """生成插入数据的SQL语句"""
-    if 'code' in data.columns:
-        data['code_int'] = data['code'].astype(int)
-
-    columns = ', '.join([f"`{col}`" for col in data.columns])
-    unique_keys = ['date', 'code']
-    update_clause = ', '.join([f"`{col}`=VALUES(`{col}`)" for col in data.columns if col not in unique_keys])
-
-    # 分批次处理数据
-    sql_batches = []
-    for i in range(0, len(data), batch_size):
-        batch = data.iloc[i:i+batch_size]
-        value_rows = []
-        for row in batch.itertuples(index=False):
-            values = []
-            for item in row:
-                if pd.isna(item):
-                    values.append("NULL")
-                elif isinstance(item, (datetime.date, datetime.datetime)):
-                    values.append(f"'{item.strftime('%Y-%m-%d')}'")
-                elif isinstance(item, (int, float)):
-                    values.append(str(item))
-                else:
-                    cleaned = str(item).replace("'", "''")
-                    values.append(f"'{cleaned}'")
-            value_rows.append(f"({', '.join(values)})")
-
-        values_str = ',\n'.join(value_rows)
-        sql = f"""
-            INSERT INTO `{table_name}` ({columns})
-            VALUES {values_str}
-            ON DUPLICATE KEY UPDATE {update_clause};
-        """
-        sql_batches.append(sql)
-
-    return '\n'.join(sql_batches)
-
-def execute_raw_sql(sql, conn=None):
-    """执行原始SQL"""
-    # 允许外部传入连接
-    if not conn:
-        conn = DBManager.get_new_connection()
-    if not conn:
-        return False
-
-    try:
-        cursor = conn.cursor(buffered=True)
-        statements = [s.strip() for s in sql.split(';') if s.strip()]
-
-        for statement in statements:
-            try:
-                cursor.execute(statement)
-                if cursor.with_rows:
-                    cursor.fetchall()  # 消费结果集
-            except Exception as e:
-                print(f"执行失败: {statement[:100]}... | 错误: {e}")
-                return False
-        return True
-    except Error as e:
-        print(f"数据库错误: {e}")
-        return False
-    finally:
-        # 仅关闭外部创建的连接
-        if not conn:  # 只有当conn是本地创建时才关闭
-            if conn and conn.is_connected():
-                cursor.close()
-                conn.close()
 
 def convert_date_format(input_date: str) -> str:
     """将 yyyy-mm-dd 格式转换为 yyyymmdd 格式"""
@@ -383,12 +273,12 @@ def sync_and_write(table_name: str, data: pd.DataFrame):
         # 同步表结构
         同步表结构(conn, table_name, data.columns)
 
-        # 生成SQL
-        sql_txt = sql语句生成器(table_name, data)
-
-        # 执行SQL
-        if not execute_raw_sql(sql_txt, conn):  # 传入连接对象
-            raise Exception(f"{table_name} 写入失败")
+        # LOAD DATA 批量写入，失败时回退到参数化批量写入
+        if 'code' in data.columns:
+            data['code_int'] = data['code'].astype(int)
+        if not load_data_upsert(table_name, data, unique_keys=['date', 'code'], conn=conn):
+            if not executemany_upsert(table_name, data, unique_keys=['date', 'code'], conn=conn):
+                raise Exception(f"{table_name} 写入失败")
 
         # 2. 启用索引
         enable_sql = f"ALTER TABLE `{table_name}` ENABLE KEYS;"
@@ -407,8 +297,13 @@ def sync_and_write(table_name: str, data: pd.DataFrame):
             cursor.close()
             conn.close()
 
-def fetch_single_hist(code: str, market_id: str, period: str, name: str, data_type: str, beg: str, end: str):
-    """获取单个代码的历史数据"""
+def fetch_single_hist(code: str, market_id: str, period: str, name: str, data_type: str, beg: str, end: str,
+                      last: tuple = None):
+    """
+    获取单个代码的历史数据。
+    last 为库中该代码最后一根K线 (date_int, 收盘价) 时增量请求，只返回其后的新K线；
+    收盘价与接口对不上时从该日起返回（覆盖库中的K线），该日在接口中已不存在时全量重抓。
+    """
     try:
         # 添加随机延迟，避免被封IP
         delay = np.random.uniform(1, 3)
@@ -432,40 +327,35 @@ def fetch_single_hist(code: str, market_id: str, period: str, name: str, data_ty
             "klt": {'daily':101, 'weekly':102, 'monthly':103}[period],
             "fqt": 0,
             "secid": f"{market_id}.{code}",
-            "beg": beg,
+            "beg": incremental_beg(last, beg),  # 增量时从库中最后一根K线起
             "end": end,
             "lmt": "1000000",
             "_": int(time.time()*1000)
         }
 
         # 发送请求
-        r = requests.get(url, params=params, headers=HEADERS, timeout=10)
+        r = http_session.get(url, params=params, headers=HEADERS, timeout=10)
         data_json = r.json()
         if not data_json.get("data"):
             print(f"[Warning] {code} 无数据返回，可能已退市或停牌")
             return None
 
-        # 数据处理
-        df = pd.DataFrame([item.split(",") for item in data_json["data"]["klines"]])
-
-        # 字段映射
-        en_name = {
-            table_config['columns'][k]['map']: table_config['columns'][k]['en']
-            for k in table_config['columns']
-            if 'map' in table_config['columns'][k]
-        }
-
-        # 格式转换与字段添加
-        numeric_cols = [1,2,3,4,5,6,7,8,9,10]
-        df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce')
-        df.rename(columns=en_name, inplace=True)
-        df['date'] = pd.to_datetime(df['date'])
-        df['date_int'] = df['date'].dt.strftime('%Y%m%d').astype(int)
+        # 数据处理与字段映射：klines 一次解析为数值列，date_int 由日期算出
+        df = parse_klines(data_json["data"]["klines"], kline_columns(table_config['columns']))
         df['code'] = code
         df['code_int'] = int(code) if code.isdigit() else 0
         df['period'] = period
         df['name'] = name
 
+        # 增量：去掉用于比对的重叠K线；收盘价对不上时从该日起覆盖，该日已不存在时全量重抓
+        if last is not None:
+            df, refetch = trim_overlap(df, last)
+            if refetch:
+                print(f"[Warning] {code} 库中最后一根K线在接口中已不存在，全量重抓")
+                return fetch_single_hist(code, market_id, period, name, data_type, FULL_HISTORY_BEG, end)
+            if df.empty:
+                return None
+
         # 添加缺失的列
         for col in table_config['columns']:
             if col not in df.columns:
@@ -476,8 +366,8 @@ def fetch_single_hist(code: str, market_id: str, period: str, name: str, data_ty
         print(f"获取{code} {period}数据失败: {str(e)}")
         return None
 
-def fetch_all_stock_hist(beg: str = None, end: str = None):
-    """获取全量股票历史数据（单线程+延迟）"""
+def fetch_all_stock_hist(beg: str = None, end: str = None, incremental: bool = False):
+    """获取全量股票历史数据（单线程+延迟）；incremental 时各代码从库中最后一根K线起增量抓取"""
     # 处理日期参数
     today = datetime.datetime.now().strftime("%Y%m%d")
     beg = beg or today
@@ -498,6 +388,9 @@ def fetch_all_stock_hist(beg: str = None, end: str = None):
     stock_df = stock_df[stock_df['code'].apply(is_a_stock)]
     print(f"待采集股票数量：{len(stock_df)}")
 
+    # 增量模式：一次查询取出各代码库中最后一根K线
+    last_bars = get_last_bars(CN_STOCK_HIST_DAILY_DATA['name']) if incremental else {}
+
     # 准备数据容器
     daily_data = pd.DataFrame()
 
@@ -507,7 +400,10 @@ def fetch_all_stock_hist(beg: str = None, end: str = None):
         market_id = row['market_id']
         name = row['name']
 
-        data = fetch_single_hist(code, market_id, "daily", name, "stock", beg, end)
+        last = last_bars.get(code)
+        if is_up_to_date(last, end):
+            continue
+        data = fetch_single_hist(code, market_id, "daily", name, "stock", beg, end, last=last)
 
         if data is not None:
             df = data['df']
@@ -516,8 +412,8 @@ def fetch_all_stock_hist(beg: str = None, end: str = None):
     sync_and_write(CN_STOCK_HIST_DAILY_DATA['name'], daily_data)
     print(f"[Success] 股票历史数据写入完成（日：{len(daily_data)}）")
 
-def fetch_all_etf_hist(beg: str = None, end: str = None):
-    """获取全量ETF历史数据（单线程+延迟）"""
+def fetch_all_etf_hist(beg: str = None, end: str = None, incremental: bool = False):
+    """获取全量ETF历史数据（单线程+延迟）；incremental 时各代码从库中最后一根K线起增量抓取"""
     # 处理日期参数
     today = datetime.datetime.now().strftime("%Y%m%d")
     beg = beg or today
@@ -536,6 +432,9 @@ def fetch_all_etf_hist(beg: str = None, end: str = None):
 
     print(f"待采集ETF数量：{len(etf_df)}")
 
+    # 增量模式：一次查询取出各代码库中最后一根K线
+    last_bars = get_last_bars(CN_ETF_HIST_DAILY_DATA['name']) if incremental else {}
+
     # 准备数据容器
     daily_data = pd.DataFrame()
 
@@ -545,7 +444,10 @@ def fetch_all_etf_hist(beg: str = None, end: str = None):
         market_id = row['market_id']
         name = row['name']
 
-        data = fetch_single_hist(code, market_id, "daily", name, "etf", beg, end)
+        last = last_bars.get(code)
+        if is_up_to_date(last, end):
+            continue
+        data = fetch_single_hist(code, market_id, "daily", name, "etf", beg, end, last=last)
 
         if data is not None:
             df = data['df']
@@ -554,8 +456,8 @@ def fetch_all_etf_hist(beg: str = None, end: str = None):
     sync_and_write(CN_ETF_HIST_DAILY_DATA['name'], daily_data)
     print(f"[Success] ETF历史数据写入完成（日：{len(daily_data)}）")
 
-def fetch_all_index_hist(beg: str = None, end: str = None):
-    """获取全量指数历史数据（单线程+延迟）"""
+def fetch_all_index_hist(beg: str = None, end: str = None, incremental: bool = False):
+    """获取全量指数历史数据（单线程+延迟）；incremental 时各代码从库中最后一根K线起增量抓取"""
     # 处理日期参数
     today = datetime.datetime.now().strftime("%Y%m%d")
     beg = beg or today
@@ -574,6 +476,9 @@ def fetch_all_index_hist(beg: str = None, end: str = None):
 
     print(f"待采集指数数量：{len(index_df)}")
 
+    # 增量模式：一次查询取出各代码库中最后一根K线
+    last_bars = get_last_bars(CN_INDEX_HIST_DAILY_DATA['name']) if incremental else {}
+
     # 准备数据容器
     daily_data = pd.DataFrame()
 
@@ -583,7 +488,10 @@ def fetch_all_index_hist(beg: str = None, end: str = None):
         market_id = row['market_id']
         name = row['name']
 
-        data = fetch_single_hist(code, market_id, "daily", name, "index", beg, end)
+        last = last_bars.get(code)
+        if is_up_to_date(last, end):
+            continue
+        data = fetch_single_hist(code, market_id, "daily", name, "index", beg, end, last=last)
 
         if data is not None:
             df = data['df']
@@ -638,9 +546,9 @@ def main():
         delay = np.random.uniform(1, 3)
         time.sleep(delay)
 
-        fetch_all_stock_hist(today, today)
-        fetch_all_etf_hist(today, today)
-        fetch_all_index_hist(today, today)
+        fetch_all_stock_hist(today, today, incremental=INCREMENTAL_FETCH)
+        fetch_all_etf_hist(today, today, incremental=INCREMENTAL_FETCH)
+        fetch_all_index_hist(today, today, incremental=INCREMENTAL_FETCH)
 
     # 场景2: 单日期模式
     elif len(sys.argv) == 2:
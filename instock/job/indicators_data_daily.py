@@ -10,8 +10,7 @@ sys.path.append(cpath)
 
 import pandas as pd
 import numpy as np
-import talib as tl
-import mysql.connector
+import instock.core.indicator.registry as ireg
 import datetime
 import threading
 from typing import Optional  # 新增导入
@@ -19,15 +18,22 @@ from typing import Optional  # 新增导入
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from typing import Dict, List, Tuple
 from mysql.connector import Error
-# from instock.lib.database import DBManager
 import sqlalchemy
 import time
 import instock.core.tablestructure as tbs
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
+from instock.lib.database import DBManager, executemany_upsert, get_table_columns, add_missing_columns
+from instock.lib.write_behind import WriteBehind
+from instock.lib.prefetch import prefetch
+from instock.lib.frame_split import split_by_key, key_offsets
+from instock.lib.shared_frame import SharedFrame, read_shared_rows
+from instock.lib.result_cache import fingerprint, get_cache
+from instock.core.indicator.incremental_indicator import (IndicatorEngine, INDICATOR_COLUMNS, finalize, panel_index,
+                                                          to_panel, state_path, load_state, save_state)
+from instock.core.indicator.cross_section import calculate_panel
 
 
 
-def calculate_indicators(data):
+def calculate_indicators(data, columns=None):
     # 检查数据长度是否满足最小窗口（例如MACD需要至少34条数据）
     min_window = 34  # 根据TA-Lib指标要求调整
     if len(data) < min_window:
@@ -60,164 +66,8 @@ def calculate_indicators(data):
     '''
 
 
-    # 计算MACD
-    daily_data_indicators['macd'], daily_data_indicators['macds'], daily_data_indicators['macdh'] = tl.MACD(data['close'])
-
-    # 计算KDJ的K和D
-    daily_data_indicators['kdjk'], daily_data_indicators['kdjd'] = tl.STOCH(
-        data['high'],
-        data['low'],
-        data['close'],
-        fastk_period=9,    # 默认参数需显式指定
-        slowk_period=5,
-        slowk_matype=1,
-        slowd_period=5,
-        slowd_matype=1
-    )
-
-    # 手动计算J线（J = 3*K - 2*D）
-    daily_data_indicators['kdjj'] = 3 * daily_data_indicators['kdjk'] - 2 * daily_data_indicators['kdjd']
-
-    # 计算BOLL
-    daily_data_indicators['boll_ub'], daily_data_indicators['boll'], daily_data_indicators['boll_lb'] = tl.BBANDS(data['close'])
-
-    # 计算W&R
-    daily_data_indicators['wr_6'] = tl.WILLR(data['high'], data['low'], data['close'], timeperiod=6)
-    daily_data_indicators['wr_10'] = tl.WILLR(data['high'], data['low'], data['close'], timeperiod=10)
-    daily_data_indicators['wr_14'] = tl.WILLR(data['high'], data['low'], data['close'], timeperiod=14)
-
-    # 计算CCI
-    daily_data_indicators['cci'] = tl.CCI(data['high'], data['low'], data['close'])
-    daily_data_indicators['cci_84'] = tl.SMA(daily_data_indicators['cci'], timeperiod=84)
-
-
-    # 计算RSI
-    daily_data_indicators['rsi_6'] = tl.RSI(data['close'], timeperiod=6)
-    daily_data_indicators['rsi_12'] = tl.RSI(data['close'], timeperiod=12)
-    daily_data_indicators['rsi'] = tl.RSI(data['close'])
-    daily_data_indicators['rsi_24'] = tl.RSI(data['close'], timeperiod=24)
-
-    # 手动计算VR
-    close_diff = data['close'].diff()
-    up_volume = data['volume'] * (close_diff > 0).astype(int)
-    down_volume = data['volume'] * (close_diff < 0).astype(int)
-    daily_data_indicators['vr'] = up_volume.rolling(window=26).sum() / down_volume.rolling(window=26).sum() * 100
-    daily_data_indicators['vr'] = daily_data_indicators['vr'].fillna(0.0).replace([np.inf, -np.inf], 0.0)
-    daily_data_indicators['vr_6_sma'] = tl.SMA(daily_data_indicators['vr'], timeperiod=6)
-
-    # 计算ROC
-    # 修正：ROC函数返回值只有一个，原代码可能有误
-    daily_data_indicators['roc'] = tl.ROC(data['close'])
-
-     # 计算DMI相关指标
-    timeperiod = 14
-    daily_data_indicators['pdi'] = tl.PLUS_DI(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['mdi'] = tl.MINUS_DI(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['dx'] = tl.DX(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['adx'] = tl.ADX(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['adxr'] = tl.ADXR(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-
-
-    # 计算TR和ATR
-    daily_data_indicators['tr'] = tl.TRANGE(data['high'], data['low'], data['close'])
-    daily_data_indicators['atr'] = tl.ATR(data['high'], data['low'], data['close'])
-
-
-    # 计算OBV
-    daily_data_indicators['obv'] = tl.OBV(data['close'], data['volume'])
-
-    # 计算SAR
-    daily_data_indicators['sar'] = tl.SAR(data['high'], data['low'])
-
-    # 计算PSY
-    price_up = (data['close'] > data['close'].shift(1)).astype(int)
-    daily_data_indicators['psy'] = (price_up.rolling(12).sum() / 12 * 100).fillna(0)
-    daily_data_indicators['psyma'] = daily_data_indicators['psy'].rolling(6).mean()
-
-    # 计算BRAR
-    prev_close = data['close'].shift(1, fill_value=0)
-    br_up = (data['high'] - prev_close).clip(lower=0)
-    br_down = (prev_close - data['low']).clip(lower=0)
-    daily_data_indicators['br'] = (br_up.rolling(26).sum() / br_down.rolling(26).sum()).fillna(0).replace([np.inf, -np.inf], 0) * 100
-
-    ar_up = (data['high'] - data['open']).clip(lower=0)
-    ar_down = (data['open'] - data['low']).clip(lower=0)
-    daily_data_indicators['ar'] = (ar_up.rolling(26).sum() / ar_down.rolling(26).sum()).fillna(0).replace([np.inf, -np.inf], 0) * 100
-
-    # 计算EMV
-    hl_avg = (data['high'] + data['low']) / 2
-    prev_hl_avg = hl_avg.shift(1, fill_value=0)
-    volume = data['volume'].replace(0, 1)  # 避免除零
-    daily_data_indicators['emv'] = ((hl_avg - prev_hl_avg) * (data['high'] - data['low']) / volume).rolling(14).sum()
-    daily_data_indicators['emva'] = daily_data_indicators['emv'].rolling(9).mean()
-
-    # 计算MFI
-    daily_data_indicators['mfi'] = tl.MFI(data['high'], data['low'], data['close'], data['volume'])
-    daily_data_indicators['mfisma'] = tl.SMA(daily_data_indicators['mfi'])
-
-    # 计算VWMA
-    daily_data_indicators['vwma'] = (data['close'] * data['volume']).cumsum() / data['volume'].cumsum()
-    daily_data_indicators['mvwma'] = tl.SMA(daily_data_indicators['vwma'])
-
-    # 计算PPO
-    daily_data_indicators['ppo'] = tl.PPO(data['close'], fastperiod=12, slowperiod=26, matype=1)
-    daily_data_indicators['ppos'] = tl.EMA(daily_data_indicators['ppo'], timeperiod=9)
-    daily_data_indicators['ppoh'] = daily_data_indicators['ppo'] - daily_data_indicators['ppos']
-    daily_data_indicators['ppo'] = daily_data_indicators['ppo'].fillna(0)
-    daily_data_indicators['ppos'] = daily_data_indicators['ppos'].fillna(0)
-    daily_data_indicators['ppoh'] = daily_data_indicators['ppoh'].fillna(0)
-
-    # 计算WT（假设WT1和WT2的计算方法）
-    daily_data_indicators['wt1'] = (data['close'] - tl.SMA(data['close'], timeperiod=10)) / tl.STDDEV(data['close'], timeperiod=10)
-    daily_data_indicators['wt2'] = (data['close'] - tl.SMA(data['close'], timeperiod=20)) / tl.STDDEV(data['close'], timeperiod=20)
-
-
-    # 计算DPO
-    daily_data_indicators['dpo'] = data['close'] - tl.SMA(data['close'], timeperiod=20)
-    daily_data_indicators['madpo'] = tl.SMA(daily_data_indicators['dpo'])
-
-    # 计算VHF
-    window = 28
-    high_close = data['close'].rolling(window).max()
-    low_close = data['close'].rolling(window).min()
-    sum_diff = abs(data['close'] - data['close'].shift(1)).rolling(window).sum()
-    daily_data_indicators['vhf'] = ((high_close - low_close) / sum_diff).fillna(0)
-
-    # 计算RVI
-    rvi_x = (
-        (data['close'] - data['open']) +
-        2 * (data['close'].shift(1) - data['open'].shift(1)) +
-        2 * (data['close'].shift(2) - data['open'].shift(2)) +
-        (data['close'].shift(3) - data['open'].shift(3))
-    ) / 6
-
-    rvi_y = (
-        (data['high'] - data['low']) +
-        2 * (data['high'].shift(1) - data['low'].shift(1)) +
-        2 * (data['high'].shift(2) - data['low'].shift(2)) +
-        (data['high'].shift(3) - data['low'].shift(3))
-    ) / 6
-
-    daily_data_indicators['rvi'] = (rvi_x.rolling(10).mean() / rvi_y.rolling(10).mean()).fillna(0)
-    daily_data_indicators['rvis'] = (
-        daily_data_indicators['rvi'] +
-        2 * daily_data_indicators['rvi'].shift(1) +
-        2 * daily_data_indicators['rvi'].shift(2) +
-        daily_data_indicators['rvi'].shift(3)
-    ) / 6
-
-    # 计算FI
-    daily_data_indicators['fi'] = (data['close'] - data['close'].shift(1)) * data['volume']
-    daily_data_indicators['force_2'] = tl.SMA(daily_data_indicators['fi'], timeperiod=2)
-    daily_data_indicators['force_13'] = tl.SMA(daily_data_indicators['fi'], timeperiod=13)
-
-    # 计算ENE
-    daily_data_indicators['ene_ue'] = tl.EMA(data['close'], timeperiod=25) + 2 * tl.STDDEV(data['close'], timeperiod=25)
-    daily_data_indicators['ene'] = tl.EMA(data['close'], timeperiod=25)
-    daily_data_indicators['ene_le'] = tl.EMA(data['close'], timeperiod=25) - 2 * tl.STDDEV(data['close'], timeperiod=25)
-
-    # 计算STOCHRSI
-    daily_data_indicators['stochrsi_k'], daily_data_indicators['stochrsi_d'] = tl.STOCHRSI(data['close'])
+    # 计算指标（定义见 instock.core.indicator.registry），columns 为 None 时计算全部指标
+    daily_data_indicators = pd.concat([daily_data_indicators, ireg.calculate(data, columns)], axis=1)
     daily_data_indicators = daily_data_indicators.replace([np.inf, -np.inf], np.nan)
     daily_data_indicators = daily_data_indicators.fillna(0)
 
@@ -259,8 +109,25 @@ INDICATOR_TABLES = {
 }
 
 # 数据库连接配置
-MAX_HISTORY_WINDOW = 200  # 指标计算所需最大历史窗口
 RECENT_DAYS = 10          # 保留最近交易日数量
+CONVERGE_BARS = 30        # EMA/Wilder 等递推指标在预热之外的收敛余量
+HISTORY_BARS = ireg.warmup() + RECENT_DAYS + CONVERGE_BARS  # 每个代码读取的K线数（交易日），约为原先200个日历日
+CODES_PER_TASK = 200      # shared 模式下每个进程池任务处理的代码数
+SHARED_COLUMNS = ('date_int', 'code_int', 'open', 'close', 'high', 'low', 'volume')
+INDICATOR_CACHE_VERSION = 1  # 指标公式变化时加 1，使 panel 模式的结果缓存失效
+
+# 计算方式（四选一）：
+#   incremental：有指标状态的代码只用新增K线递推，无状态或收盘价对不上的代码全量回放并建立状态
+#   panel：整批代码排成 (代码数, 天数) 矩阵一次计算；结果按批次K线指纹缓存，失败后重跑时K线未变的批次直接读取
+#   shared：批次行情放入共享内存，按代码分组提交进程池逐代码计算
+#   process：按代码切分批次，逐代码提交进程池计算
+# 只有 shared、process 模式使用进程池
+INDICATOR_MODE = 'incremental'
+_indicator_mode = os.environ.get('indicator_mode')
+if _indicator_mode is not None:
+    INDICATOR_MODE = _indicator_mode
+INDICATOR_MODES = ('incremental', 'panel', 'shared', 'process')
+POOL_MODES = ('shared', 'process')
 
 def get_latest_codes(data_type: str) -> List[int]:
     """获取指定类型的最新代码列表（返回整数列表），只获取参与指标计算的代码"""
@@ -279,33 +146,59 @@ def get_latest_codes(data_type: str) -> List[int]:
 
 
 def get_hist_data(code: int, data_type: str, last_date: str = None) -> pd.DataFrame:
-    """获取带日期范围的行情数据（从新的K线表获取）"""
+    """获取截至 last_date（默认最新）最近 HISTORY_BARS 个交易日的行情数据（从新的K线表获取，按日期升序）"""
     try:
+        end_date_int = int(pd.Timestamp(last_date).strftime("%Y%m%d")) if last_date else None
+        start_date_int = get_history_start(data_type, HISTORY_BARS, end_date_int)
+        date_condition = ""
+        if start_date_int is not None:
+            date_condition += f" AND date_int >= {start_date_int}"
+        if end_date_int is not None:
+            date_condition += f" AND date_int <= {end_date_int}"
         with DBManager.get_new_connection() as conn:
-            base_query = f"""
+            query = f"""
                 SELECT date, code, code_int, name, open, close, high, low, volume
                 FROM {TABLE_MAP[data_type]['hist_table']}
-                WHERE code_int = '{code}'
+                WHERE code_int = '{code}'{date_condition}
+                ORDER BY date_int ASC
             """
-
-            if last_date:
-                query = f"""
-                    {base_query}
-                    AND date >= (
-                        SELECT DATE_SUB('{last_date}', INTERVAL {MAX_HISTORY_WINDOW} DAY)
-                        FROM DUAL
-                    )
-                """
-            else:
-                query = base_query + " ORDER BY date ASC "
-
             data = pd.read_sql(query, conn)
-            return data.sort_values('date', ascending=True) if not data.empty else pd.DataFrame()
+            return data if not data.empty else pd.DataFrame()
     except Exception as e:
         print(f"获取{data_type}历史数据失败：{code}-{str(e)}")
         return pd.DataFrame()
 
 
+_history_starts = {}
+_history_starts_lock = threading.Lock()
+
+
+def get_history_start(data_type: str, bars: int = HISTORY_BARS, end_date_int: int = None) -> Optional[int]:
+    """
+    交易日历下界：K线表中截至 end_date_int（默认最新）倒数第 bars 个交易日的 date_int。
+    连续交易的代码按此下界正好取到 bars 条K线，停牌代码相应更少；表中交易日不足 bars 个时返回 None（不限下界）。
+    同一进程内按 (类型, 条数, 截止日) 缓存，各批次共用。
+    """
+    key = (data_type, bars, end_date_int)
+    with _history_starts_lock:
+        if key in _history_starts:
+            return _history_starts[key]
+
+    end_condition = f"WHERE date_int <= {int(end_date_int)}" if end_date_int is not None else ""
+    query = f"""
+        SELECT DISTINCT date_int
+        FROM {TABLE_MAP[data_type]['hist_table']}
+        {end_condition}
+        ORDER BY date_int DESC
+        LIMIT 1 OFFSET {int(bars) - 1}
+    """
+    with DBManager.get_new_connection() as conn:
+        rows = pd.read_sql(query, conn)
+    start = int(rows['date_int'].iloc[0]) if not rows.empty else None
+    with _history_starts_lock:
+        _history_starts[key] = start
+    return start
+
 
 def calculate_and_save(code: str, data_type: str):
     """完整的处理流水线"""
@@ -359,42 +252,11 @@ def sync_and_save(table_name: str, data: pd.DataFrame):
     #         if conn.is_connected():
     #             conn.close()
 
-    sql_txt = sql语句生成器(table_name, data)
-    execute_raw_sql(sql_txt)
-
-
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
+    # 预处理数据（如添加code_int）
+    if 'code' in data.columns and 'code_int' not in data.columns:
+        data.insert(0, 'code_int', data['code'].astype(int))
+    # 返回写库结果：False 由 WriteBehind 计为失败，本类型不保存指标状态
+    return executemany_upsert(table_name, data, unique_keys=['date', 'code'])
 
 
 def create_table_if_not_exists(table_name):
@@ -481,159 +343,29 @@ def create_table_if_not_exists(table_name):
 
 
 def 同步表结构(conn, table_name, data_columns):
-    """动态添加缺失字段（线程安全+事务锁）"""
+    """动态添加缺失字段：字段集合进程内缓存，缺失字段一条 ALTER TABLE 一次性添加"""
     try:
-        cursor = conn.cursor(buffered=True)
-
-        # 1. 获取表级写锁
-        cursor.execute(f"LOCK TABLES `{table_name}` WRITE;")
-
-        # 2. 使用 INFORMATION_SCHEMA 检查字段
-        cursor.execute(f"""
-            SELECT COLUMN_NAME
-            FROM INFORMATION_SCHEMA.COLUMNS
-            WHERE TABLE_NAME = '{table_name}'
-              AND TABLE_SCHEMA = DATABASE()
-        """)
-        existing_columns = {row[0] for row in cursor.fetchall()}
+        existing_columns = get_table_columns(table_name, conn)
 
-        # 3. 获取配置表字段
+        # 获取配置表字段
         table_config = tbs.TABLE_REGISTRY.get(table_name, {})
-        all_required_columns = set(table_config.get('columns', {}).keys())
+        config_columns = table_config.get('columns', {})
 
-        # 4. 遍历处理字段
+        missing_columns = {}
         for col in data_columns:
-            try:
-                if col not in existing_columns:
-                    if col in all_required_columns:
-                        col_info = table_config['columns'][col]
-                        sql_type = tbs._get_sql_type(col_info['type'])
-                        alter_sql = f"ALTER TABLE `{table_name}` ADD COLUMN `{col}` {sql_type};"
-                        print(f"[EXECUTE] 执行SQL：{alter_sql}")
-                        cursor.execute(alter_sql)
-                        conn.commit()
-                    else:
-                        print(f"[DEBUG] 字段 {col} 不在配置表中，已跳过")
-                else:
-                    pass  # 字段已存在，无需处理
-            except mysql.connector.Error as err:
-                if err.errno == 1060:  # 捕获重复字段错误
-                    print(f"[WARNING] 字段 {col} 可能已被其他线程创建，错误信息：{err}")
-                else:
-                    raise
-            except Exception as e:
-                print(f"[ERROR] 处理字段 {col} 失败：{str(e)}")
-                conn.rollback()
+            if col in existing_columns:
+                continue
+            if col in config_columns:
+                missing_columns[col] = tbs._get_sql_type(config_columns[col]['type'])
+            else:
+                print(f"[WARNING] 字段 {col} 不在配置表中，已跳过")
 
-        # 5. 释放锁
-        cursor.execute("UNLOCK TABLES;")
-        conn.commit()
-        print(f"[SUCCESS] 表 {table_name} 结构同步完成")
+        if missing_columns and add_missing_columns(table_name, missing_columns, conn) is None:
+            print(f"[CRITICAL] 同步表结构失败：{table_name}")
 
     except Exception as main_error:
         print(f"[CRITICAL] 同步表结构主流程失败：{str(main_error)}")
         conn.rollback()
-    finally:
-        if conn.is_connected():
-            cursor.close()
-
-
-def sql语句生成器(table_name, data):
-    # # 准备模板
-    # sql_template = """INSERT INTO `{table_name}` ({columns}) VALUES {values} ON DUPLICATE KEY UPDATE {update_clause};"""
-    # # 预处理列名和更新子句
-    # columns = ', '.join([f"`{col}`" for col in data.columns])
-    # update_clause = ', '.join([f"`{col}`=VALUES(`{col}`)" for col in data.columns if col not in ['date', 'code']])
-    # 准备模板
-    #
-    #
-    # 检查输入数据是否为空
-    if data.empty:
-        print("[WARNING] 输入数据为空，跳过SQL生成")
-        return ""
-
-    # 预处理数据（如添加code_int）
-    if 'code' in data.columns and 'code_int' not in data.columns:
-        data.insert(0, 'code_int', data['code'].astype(int))
-
-    sql_template = """INSERT INTO `{table_name}` ({columns})
-        VALUES {values}
-        ON DUPLICATE KEY UPDATE {update_clause};"""
-
-    # 预处理列名
-    columns = ', '.join([f"`{col}`" for col in data.columns])
-
-    # 指定唯一键列（这些字段用于比对数据库中的记录）
-    unique_keys = ['date', 'code']
-
-    # 更新子句：更新所有非唯一键的列
-    update_clause = ', '.join(
-        [f"`{col}`=VALUES(`{col}`)"
-         for col in data.columns
-         if col not in unique_keys]
-    )
-    # 批量处理值
-    value_rows = []
-    for row in data.itertuples(index=False):
-        values = []
-        for item in row:
-            if pd.isna(item) or item in ['-', '']:
-                values.append("NULL")
-            elif isinstance(item, (datetime.date, datetime.datetime)):
-                values.append(f"'{item.strftime('%Y-%m-%d')}'")
-            elif isinstance(item, (int, float, bool)):
-                values.append(str(item))
-            else:
-                # 使用三重引号避免嵌套冲突
-                cleaned_item = str(item).replace("'", "''")
-                values.append(f"'{cleaned_item}'")
-        value_rows.append(f"({', '.join(values)})")
-
-    # 批量生成SQL
-    sql_statements = [
-        sql_template.format(
-            table_name=table_name,
-            columns=columns,
-            values=values,
-            update_clause=update_clause
-        )
-        for values in value_rows
-    ]
-
-    # 连接所有语句
-    sql_txt = "\n".join(sql_statements)
-    return sql_txt
-
-
-def execute_raw_sql(sql, params=None, max_query_size=1024*1024, batch_size=5000):
-    """改进批量写入性能"""
-    if not sql.strip():
-        print("[WARNING] SQL语句为空，跳过执行")
-        return False
-
-    connection = DBManager.get_new_connection()
-    if not connection:
-        return False
-    try:
-        cursor = connection.cursor()
-        statements = [s.strip() for s in sql.split(';') if s.strip()]
-        if not statements:
-            print("[WARNING] 无有效SQL语句")
-            return False
-
-        for statement in statements:
-            cursor.execute(statement)
-        connection.commit()
-        return True
-    except Error as e:
-        print(f"数据库错误: {e}")
-        connection.rollback()
-        return False
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
-
 
 
 from itertools import islice
@@ -673,9 +405,8 @@ def sync_table_structure(table_name: str, data_columns: List[str]):
         with DBManager.get_new_connection() as conn:
             cursor = conn.cursor()
 
-            # 1. 创建表（如果不存在）
-            cursor.execute(f"SHOW TABLES LIKE '{table_name}'")
-            if not cursor.fetchone():
+            # 1. 创建表（如果不存在），已缓存字段的表不再查询
+            if not get_table_columns(table_name, conn):
                 # 基础表结构（date, code_int, code, name）
                 create_sql = f"""
                     CREATE TABLE `{table_name}` (
@@ -690,45 +421,41 @@ def sync_table_structure(table_name: str, data_columns: List[str]):
                 cursor.execute(create_sql)
                 print(f"创建基础表 {table_name}")
 
-            # 2. 动态添加指标字段
-            cursor.execute(f"""
-                SELECT COLUMN_NAME
-                FROM INFORMATION_SCHEMA.COLUMNS
-                WHERE TABLE_NAME = '{table_name}'
-                  AND TABLE_SCHEMA = DATABASE()
-            """)
-            existing_columns = {row[0] for row in cursor.fetchall()}
-
-            # 3. 遍历指标字段，添加缺失列
-            for col in data_columns:
-                if col not in existing_columns and col not in ['id', 'date','date_int', 'code_int', 'code', 'name']:
-                    # 自动推断字段类型（假设均为FLOAT）
-                    alter_sql = f"ALTER TABLE `{table_name}` ADD COLUMN `{col}` FLOAT;"
-                    cursor.execute(alter_sql)
-                    print(f"动态添加字段 {col} 到表 {table_name}")
+            # 2. 动态添加指标字段（自动推断字段类型，假设均为FLOAT），缺失字段一次性添加
+            existing_columns = get_table_columns(table_name, conn)
+            missing_columns = {col: 'FLOAT' for col in data_columns
+                               if col not in existing_columns and col not in ['id', 'date','date_int', 'code_int', 'code', 'name']}
+            if missing_columns:
+                if add_missing_columns(table_name, missing_columns, conn) is None:
+                    raise Exception("添加字段失败")
+                print(f"动态添加字段 {list(missing_columns)} 到表 {table_name}")
             conn.commit()
     except Exception as e:
         print(f"同步表 {table_name} 结构失败：{str(e)}")
         sys.exit(1)
 
 
-def get_hist_data_batch(batch_codes: List[int], data_type: str) -> pd.DataFrame:
-    """严格按批次执行单次查询（无分块），获取最近MAX_HISTORY_WINDOW天数据"""
+def get_hist_data_batch(batch_codes: List[int], data_type: str, since_date_int: int = None) -> pd.DataFrame:
+    """
+    严格按批次执行单次查询（无分块），获取各代码最近 HISTORY_BARS 个交易日的数据，
+    指定 since_date_int 时取该日起的数据。结果已按 (code_int, date_int) 排序。
+    """
     if not batch_codes:
         return pd.DataFrame()
 
     try:
+        if since_date_int is None:
+            since_date_int = get_history_start(data_type)
+
         with DBManager.get_new_connection() as conn:
             code_list = ",".join(map(str, batch_codes))
-            
-            # 计算日期范围
-            date_condition = f"date >= CURDATE() - INTERVAL {MAX_HISTORY_WINDOW} DAY"
-            
+            date_condition = f"AND date_int >= {int(since_date_int)}" if since_date_int else ""
+
             query = f"""
                 SELECT date, date_int, code, code_int, name, open, close, high, low, volume
                 FROM {TABLE_MAP[data_type]['hist_table']}
                 WHERE code_int IN ({code_list})
-                  AND {date_condition}
+                  {date_condition}
                 ORDER BY code_int, date_int ASC 
             """
             return pd.read_sql(query, conn)
@@ -768,72 +495,338 @@ def process_single_code(
         print(f"处理代码 {code} 失败：{str(e)}")
         return pd.DataFrame()
 
+def process_code_chunk(handle, chunk, data_type: str) -> pd.DataFrame:
+    """子进程：从共享内存读取一组代码的连续行，逐个计算指标，合并后一次返回"""
+    codes, starts, ends, code_strs, names = chunk
+    offset = starts[0]
+    block = read_shared_rows(handle, offset, ends[-1])
+    block['date_int'] = block['date_int'].astype('int64')
+    block['code_int'] = block['code_int'].astype('int64')
+    block['date'] = pd.to_datetime(block['date_int'].astype(str), format='%Y%m%d').dt.date
+
+    results = []
+    for code, start, end, code_str, name in zip(codes, starts, ends, code_strs, names):
+        code_data = block.iloc[start - offset:end - offset].assign(code=code_str, name=name)
+        result = process_single_code(code=code, data_type=data_type, code_data=code_data)
+        if result is not None and not result.empty:
+            results.append(result)
+    return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+
+
+def process_batch_shared(executor, batch_data: pd.DataFrame, data_type: str) -> List[pd.DataFrame]:
+    """批次数值列放入共享内存，每 CODES_PER_TASK 个代码提交一个任务，只传行偏移量"""
+    batch_data, codes, starts, ends = key_offsets(batch_data, 'code_int')
+    # code/name 每个代码只传一份（取最新一行）
+    last_rows = batch_data.iloc[ends - 1]
+    code_strs = last_rows['code'].tolist()
+    names = last_rows['name'].tolist()
+    codes, starts, ends = codes.tolist(), starts.tolist(), ends.tolist()
+
+    valid_dfs = []
+    with SharedFrame(batch_data, SHARED_COLUMNS) as shared:
+        futures = []
+        for i in range(0, len(codes), CODES_PER_TASK):
+            chunk = (codes[i:i + CODES_PER_TASK], starts[i:i + CODES_PER_TASK], ends[i:i + CODES_PER_TASK],
+                     code_strs[i:i + CODES_PER_TASK], names[i:i + CODES_PER_TASK])
+            futures.append(executor.submit(process_code_chunk, shared.handle, chunk, data_type))
+        for future in as_completed(futures):
+            result = future.result()
+            if result is not None and not result.empty:
+                valid_dfs.append(result)
+    return valid_dfs
+
+
+def load_indicator_state(data_type: str):
+    """读取指标状态，返回 ({code_int: (最后日期, 最后收盘价)}, {code_int: 状态行号}, 引擎)"""
+    loaded = load_state(state_path(data_type))
+    if loaded is None:
+        return {}, {}, IndicatorEngine(0)
+    codes, last_dates, last_closes, engine = loaded
+    known = {int(c): (int(d), float(p)) for c, d, p in zip(codes, last_dates, last_closes)}
+    state_rows = {int(c): i for i, c in enumerate(codes)}
+    return known, state_rows, engine
+
+
+def get_incremental_batch(batch_codes: List[int], data_type: str, known: Dict[int, Tuple[int, float]]):
+    """
+    增量模式的批次查询：有状态的代码只取状态最后日期起的K线，并核对最后日期的收盘价；
+    收盘价不一致（复权、数据修正）或查不到的代码与无状态代码一起查询完整历史。
+    返回 (核对通过的代码, 其新增K线, 需重建状态代码的完整K线)
+    """
+    known_codes = [code for code in batch_codes if code in known]
+    matched = []
+    new_bars = pd.DataFrame()
+    if known_codes:
+        since = min(known[code][0] for code in known_codes)
+        bars = get_hist_data_batch(known_codes, data_type, since)
+        if not bars.empty:
+            last = pd.DataFrame([(code, *known[code]) for code in known_codes],
+                                columns=['code_int', 'last_date', 'last_close'])
+            bars = bars.merge(last, on='code_int', how='inner')
+            anchor = bars[bars['date_int'] == bars['last_date']]
+            matched_set = set(anchor.loc[np.isclose(anchor['close'], anchor['last_close']), 'code_int'].tolist())
+            matched = [code for code in known_codes if code in matched_set]
+            new_bars = bars[bars['code_int'].isin(matched_set) & (bars['date_int'] > bars['last_date'])]
+            new_bars = new_bars.drop(columns=['last_date', 'last_close'])
+
+    matched_set = set(matched)
+    rebuild_codes = [code for code in batch_codes if code not in matched_set]
+    full_bars = get_hist_data_batch(rebuild_codes, data_type) if rebuild_codes else pd.DataFrame()
+    return matched, new_bars, full_bars
+
+
+def run_engine(engine: IndicatorEngine, bars: pd.DataFrame, codes_order: List[int]):
+    """
+    用 bars 推进 engine（engine 第 i 行对应 codes_order[i]，bars 中没有K线的代码状态不变）。
+    返回 (与 calculate_indicators 同列的指标行, 各行在右对齐矩阵中的列号, 矩阵宽度, 各代码最后一行)
+    """
+    bars, codes, starts, ends = key_offsets(bars, 'code_int')
+    rows, cols, width = panel_index(starts, ends)
+    order = {code: i for i, code in enumerate(codes_order)}
+    rows = np.array([order[code] for code in codes.tolist()], dtype=np.int64)[rows]
+    panels = [to_panel(bars[col].to_numpy(dtype=np.float64), rows, cols, engine.n, width)
+              for col in ('open', 'high', 'low', 'close', 'volume')]
+    values = engine.replay(*panels)
+    return indicator_rows(bars, values, rows, cols), cols, width, bars.iloc[ends - 1]
+
+
+def indicator_rows(bars: pd.DataFrame, values: Dict[str, np.ndarray], rows, cols) -> pd.DataFrame:
+    """把 (代码数, 天数) 的指标矩阵按 bars 的行顺序取回，列与 calculate_indicators 一致"""
+    return frame_rows(bars, {name: finalize(values[name][rows, cols]) for name in INDICATOR_COLUMNS})
+
+
+def frame_rows(bars: pd.DataFrame, values: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """由K线行和与之逐行对应的（已填 0）指标值组装输出行，列与 calculate_indicators 一致"""
+    columns = {
+        'date': bars['date'].to_numpy(),
+        'code': bars['code'].to_numpy(),
+        'date_int': bars['date_int'].astype(str).to_numpy(),
+        'code_int': bars['code_int'].to_numpy(),
+        'name': bars['name'].to_numpy(),
+        'close': bars['close'].to_numpy(),
+    }
+    for name in INDICATOR_COLUMNS:
+        columns[name] = values[name]
+    return pd.DataFrame(columns)
+
+
+def process_batch_panel(batch_data: pd.DataFrame) -> List[pd.DataFrame]:
+    """
+    全量模式的截面计算：整批代码一次算完，结果与逐代码 process_single_code 一致
+    （数据不足34条、最新数据超过30天的代码跳过，每个代码保留最近 RECENT_DAYS 个交易日）
+    """
+    batch_data, codes, starts, ends = key_offsets(batch_data, 'code_int')
+    enough = (ends - starts) >= 34
+    for code in codes[~enough].tolist():
+        print(f"代码 {code} 数据不足34条，跳过")
+    last_rows = batch_data.iloc[ends - 1]
+    keep = enough & (last_rows['date'] >= datetime.date.today() - datetime.timedelta(days=30)).to_numpy()
+    batch_data = batch_data[np.repeat(keep, ends - starts)]
+    if batch_data.empty:
+        return []
+
+    batch_data, codes, starts, ends = key_offsets(batch_data, 'code_int')
+    rows, cols, width = panel_index(starts, ends)
+    recent = cols >= width - RECENT_DAYS
+    inputs = [batch_data[col].to_numpy(dtype=np.float64) for col in ('open', 'high', 'low', 'close', 'volume')]
+
+    cache = get_cache('indicators_daily')
+    key = fingerprint(INDICATOR_CACHE_VERSION, INDICATOR_COLUMNS, RECENT_DAYS,
+                      batch_data['code_int'].to_numpy(dtype=np.int64),
+                      batch_data['date_int'].to_numpy(dtype=np.int64), *inputs)
+    cached = cache.get(key)
+    if cached is not None:
+        return [frame_rows(batch_data[recent], cached)]
+
+    panels = [to_panel(values, rows, cols, len(codes), width) for values in inputs]
+    values = calculate_panel(*panels)
+    result = indicator_rows(batch_data, values, rows, cols)[recent]
+    cache.put(key, {name: result[name].to_numpy() for name in INDICATOR_COLUMNS})
+    return [result]
+
+
+def process_batch_incremental(batch_codes: List[int], matched: List[int], new_bars: pd.DataFrame,
+                              full_bars: pd.DataFrame, known, state_rows, engine: IndicatorEngine):
+    """
+    增量模式处理一个批次，返回 (待写库指标行列表, 本批次状态 (代码, 最后日期, 最后收盘价, 引擎))：
+    核对通过的代码只推进新增K线并输出新增行；其余代码用完整历史从头回放建立状态，
+    输出最近 RECENT_DAYS 个交易日（回放结果与 calculate_indicators 一致）。
+    """
+    results = []
+    parts = []
+
+    if matched:
+        sub_engine = engine.select([state_rows[code] for code in matched])
+        last_dates = np.array([known[code][0] for code in matched], dtype=np.int64)
+        last_closes = np.array([known[code][1] for code in matched], dtype=np.float64)
+        if not new_bars.empty:
+            indicators, _, _, last_rows = run_engine(sub_engine, new_bars, matched)
+            results.append(indicators)
+            order = {code: i for i, code in enumerate(matched)}
+            idx = np.array([order[code] for code in last_rows['code_int'].tolist()], dtype=np.int64)
+            last_dates[idx] = last_rows['date_int'].to_numpy(dtype=np.int64)
+            last_closes[idx] = last_rows['close'].to_numpy(dtype=np.float64)
+        parts.append((np.array(matched, dtype=np.int64), last_dates, last_closes, sub_engine))
+
+    if not full_bars.empty:
+        # 数据不足34条的代码不建立状态，下次仍走全量
+        full_bars, codes, starts, ends = key_offsets(full_bars, 'code_int')
+        enough = (ends - starts) >= 34
+        for code in codes[~enough].tolist():
+            print(f"代码 {code} 数据不足34条，跳过")
+        full_bars = full_bars[np.repeat(enough, ends - starts)]
+        if not full_bars.empty:
+            rebuild = codes[enough].tolist()
+            new_engine = IndicatorEngine(len(rebuild))
+            indicators, cols, width, last_rows = run_engine(new_engine, full_bars, rebuild)
+            # 与 process_single_code 一致：只保留最近 RECENT_DAYS 个交易日，跳过最新数据过旧的代码
+            indicators = indicators[cols >= width - RECENT_DAYS]
+            stale_before = datetime.date.today() - datetime.timedelta(days=30)
+            fresh = last_rows.loc[last_rows['date'] >= stale_before, 'code_int']
+            results.append(indicators[indicators['code_int'].isin(fresh)])
+            parts.append((np.array(rebuild, dtype=np.int64), last_rows['date_int'].to_numpy(dtype=np.int64),
+                          last_rows['close'].to_numpy(dtype=np.float64), new_engine))
+
+    return [df for df in results if not df.empty], parts
+
+
+def save_indicator_state(data_type: str, parts):
+    """合并各批次的状态并写入状态文件"""
+    if not parts:
+        return
+    codes = np.concatenate([p[0] for p in parts])
+    last_dates = np.concatenate([p[1] for p in parts])
+    last_closes = np.concatenate([p[2] for p in parts])
+    engine = IndicatorEngine.concat([p[3] for p in parts])
+    save_state(state_path(data_type), codes, last_dates, last_closes, engine)
+    print(f"💾 {data_type}指标状态已保存，共 {len(codes)} 个代码")
+
+
+def process_batch_executor(executor, batch_data: pd.DataFrame, batch_codes: List[int],
+                           data_type: str) -> List[pd.DataFrame]:
+    """process 模式：一次排序切分出各代码数据，逐代码提交进程池"""
+    code_frames = split_by_key(batch_data, 'code_int')
+    futures = []
+    for code in batch_codes:
+        code_data = code_frames.get(code)
+        if code_data is None:
+            continue
+        futures.append(executor.submit(
+            process_single_code,
+            code=code,
+            data_type=data_type,
+            code_data=code_data
+        ))
+
+    # 收集结果
+    valid_dfs = []
+    for future in as_completed(futures):
+        result = future.result()
+        if result is not None and not result.empty:
+            valid_dfs.append(result)
+    return valid_dfs
+
+
+def run_incremental(data_type: str, codes: List[int], batch_size: int, writer: WriteBehind) -> int:
+    """incremental 模式处理一个类型，返回写库条数；全部落库成功后才保存指标状态"""
+    total_processed = 0
+    known, state_rows, engine = load_indicator_state(data_type)
+    state_parts = []
+    batches = [(codes[batch_idx:batch_idx + batch_size], data_type, known)
+               for batch_idx in range(0, len(codes), batch_size)]
+    for batch_no, ((batch_codes, _, _), (matched, new_bars, full_bars)) in enumerate(
+            prefetch(get_incremental_batch, batches), 1):
+        print(f"🔁 处理批次 {batch_no}/{len(batches)}，代码数：{len(batch_codes)}，"
+              f"增量 {len(matched)} 个")
+        valid_dfs, parts = process_batch_incremental(
+            batch_codes, matched, new_bars, full_bars, known, state_rows, engine)
+        state_parts.extend(parts)
+        if valid_dfs:
+            combined_data = pd.concat(valid_dfs, ignore_index=True)
+            writer.submit(sync_and_save, INDICATOR_TABLES[data_type], combined_data)
+            total_processed += len(combined_data)
+            print(f"✅ 批次已提交写库，新增 {len(combined_data)} 条记录")
+
+    # 本类型全部落库成功后才保存状态，避免状态领先于数据库
+    if writer.flush():
+        save_indicator_state(data_type, state_parts)
+    else:
+        print(f"❌ {data_type}存在写库失败的批次，不更新指标状态")
+    return total_processed
+
+
+def run_full(executor, data_type: str, codes: List[int], batch_size: int, writer: WriteBehind) -> int:
+    """panel/shared/process 模式处理一个类型（每次读取近期完整历史重算），返回写库条数"""
+    total_processed = 0
+    # 分批处理，后台线程预读后续批次的历史数据
+    batches = [(codes[batch_idx:batch_idx + batch_size], data_type)
+               for batch_idx in range(0, len(codes), batch_size)]
+    for batch_no, ((batch_codes, _), batch_data) in enumerate(
+            prefetch(get_hist_data_batch, batches), 1):
+        print(f"🔁 处理批次 {batch_no}/{len(batches)}，代码数：{len(batch_codes)}")
+
+        if batch_data.empty:
+            print(f"⚠️ 批次 {batch_no} 无数据，跳过")
+            continue
+
+        if INDICATOR_MODE == 'panel':
+            valid_dfs = process_batch_panel(batch_data)
+        elif INDICATOR_MODE == 'shared':
+            valid_dfs = process_batch_shared(executor, batch_data, data_type)
+        else:
+            valid_dfs = process_batch_executor(executor, batch_data, batch_codes, data_type)
+
+        # 保存结果（异步写库，队列满时在此等待）
+        if valid_dfs:
+            combined_data = pd.concat(valid_dfs, ignore_index=True)
+            writer.submit(sync_and_save, INDICATOR_TABLES[data_type], combined_data)
+            total_processed += len(combined_data)
+            print(f"✅ 批次已提交写库，新增 {len(combined_data)} 条记录")
+    return total_processed
+
+
 def main():
     start_time = time.time()
-    print(f"🟢 开始指标计算，保留最近{RECENT_DAYS}个交易日数据")
+    if INDICATOR_MODE not in INDICATOR_MODES:
+        print(f"❌ 未知的计算方式 {INDICATOR_MODE}，可选：{'/'.join(INDICATOR_MODES)}")
+        return
+    print(f"🟢 开始指标计算（{INDICATOR_MODE}），保留最近{RECENT_DAYS}个交易日数据")
 
     # 配置参数
     batch_size = 500
     max_workers = 8
 
+    # 写库放到后台线程，计算下一批时上一批在落库
+    writer = WriteBehind(name='indicators_daily_writer')
+    # 进程池只在逐代码计算的模式下创建
+    executor = ProcessPoolExecutor(max_workers=max_workers) if INDICATOR_MODE in POOL_MODES else None
+
     try:
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            for data_type in ['stock', 'etf', 'index', 'industry']:
-                codes = get_latest_codes(data_type)
-                if not codes:
-                    print(f"⚠️ 未找到{data_type}代码，跳过")
-                    continue
-
-                print(f"📊 开始处理 {data_type}，共 {len(codes)} 个代码")
-
-                total_processed = 0
-
-                # 分批处理
-                for batch_idx in range(0, len(codes), batch_size):
-                    batch_codes = codes[batch_idx:batch_idx + batch_size]
-                    print(
-                        f"🔁 处理批次 {batch_idx // batch_size + 1}/{len(codes) // batch_size + 1}，代码数：{len(batch_codes)}")
-
-                    # 批量获取历史数据
-                    batch_data = get_hist_data_batch(batch_codes, data_type)
-                    if batch_data.empty:
-                        print(f"⚠️ 批次 {batch_idx // batch_size + 1} 无数据，跳过")
-                        continue
-
-                    # 并行处理
-                    futures = []
-                    for code in batch_codes:
-                        code_data = batch_data[batch_data['code_int'] == code].copy()
-                        if code_data.empty:
-                            continue
-                        futures.append(executor.submit(
-                            process_single_code,
-                            code=code,
-                            data_type=data_type,
-                            code_data=code_data
-                        ))
-
-                    # 收集结果
-                    valid_dfs = []
-                    for future in as_completed(futures):
-                        result = future.result()
-                        if result is not None and not result.empty:
-                            valid_dfs.append(result)
-
-                    # 保存结果
-                    if valid_dfs:
-                        combined_data = pd.concat(valid_dfs, ignore_index=True)
-                        sync_and_save(INDICATOR_TABLES[data_type], combined_data)
-                        total_processed += len(combined_data)
-                        print(f"✅ 批次保存成功，新增 {len(combined_data)} 条记录")
-
-                print(f"🎉 {data_type}处理完成，共处理 {total_processed} 条记录")
+        for data_type in ['stock', 'etf', 'index', 'industry']:
+            codes = get_latest_codes(data_type)
+            if not codes:
+                print(f"⚠️ 未找到{data_type}代码，跳过")
+                continue
+
+            print(f"📊 开始处理 {data_type}，共 {len(codes)} 个代码")
+
+            if INDICATOR_MODE == 'incremental':
+                total_processed = run_incremental(data_type, codes, batch_size, writer)
+            else:
+                total_processed = run_full(executor, data_type, codes, batch_size, writer)
+
+            print(f"🎉 {data_type}处理完成，共处理 {total_processed} 条记录")
 
     except Exception as e:
         print(f"❌ 主程序异常: {str(e)}")
     finally:
+        if executor is not None:
+            executor.shutdown()
+        # 等待所有批次落库并报告写库错误
+        if not writer.close():
+            print("❌ 部分批次写库失败，详见日志")
         duration = time.time() - start_time
         print(f"\n🕒 总耗时: {duration:.2f}秒 ({duration / 60:.2f}分钟)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -15,7 +15,6 @@ import numpy as np
 import pandas as pd
 import time
 import datetime
-import mysql.connector
 import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
 import pandas_market_calendars as mcal
@@ -24,7 +23,7 @@ from typing import List, Dict
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
+from instock.lib.database import DBManager
 import indicators_data_daily as indicators_data_daily
 import threeday_indicators as threeday_indicators
 import market_sentiment_a as market_sentiment_a
@@ -65,41 +64,6 @@ execute_raw_sql(sql,params)：执行插入数据表
 """
 
 
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
-
-
-
 def sql_batch_generator(table_name, data, batch_size=500):
     """通用批量SQL生成器"""
     # if 'code' in data.columns and 'code_int' not in data.columns:
@@ -10,22 +10,23 @@ sys.path.append(cpath)
 
 import pandas as pd
 import numpy as np
-import talib as tl
-import mysql.connector
+import instock.core.indicator.registry as ireg
 import datetime
 import threading
 # from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple
-from mysql.connector import Error
-# from instock.lib.database import DBManager
 import sqlalchemy
 import instock.core.tablestructure as tbs
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset 
+from instock.lib.database import DBManager, executemany_upsert, get_table_columns, add_missing_columns
+from instock.lib.frame_split import key_offsets
+from instock.lib.kline_resample import FREQS, resample_ohlcv
+from instock.lib.write_behind import WriteBehind
+from instock.core.indicator.incremental_indicator import INDICATOR_COLUMNS, finalize, panel_index, to_panel
+from instock.core.indicator.cross_section import calculate_panel
 
 
 
-def calculate_indicators(data):
+def calculate_indicators(data, columns=None):
     # 检查数据长度是否满足最小窗口（例如MACD需要至少34条数据）
     min_window = 34  # 根据TA-Lib指标要求调整
     if len(data) < min_window:
@@ -53,198 +54,8 @@ def calculate_indicators(data):
     '''
 
 
-    # 计算MACD
-    daily_data_indicators['macd'], daily_data_indicators['macds'], daily_data_indicators['macdh'] = tl.MACD(data['close'])
-
-    # 计算KDJ的K和D
-    daily_data_indicators['kdjk'], daily_data_indicators['kdjd'] = tl.STOCH(
-        data['high'], 
-        data['low'], 
-        data['close'],
-        fastk_period=9,    # 默认参数需显式指定
-        slowk_period=5,
-        slowk_matype=1,
-        slowd_period=5,
-        slowd_matype=1
-    )
-
-    # 手动计算J线（J = 3*K - 2*D）
-    daily_data_indicators['kdjj'] = 3 * daily_data_indicators['kdjk'] - 2 * daily_data_indicators['kdjd']
-
-    # 计算BOLL
-    daily_data_indicators['boll_ub'], daily_data_indicators['boll'], daily_data_indicators['boll_lb'] = tl.BBANDS(data['close'])
-    
-    # 计算W&R
-    daily_data_indicators['wr_6'] = tl.WILLR(data['high'], data['low'], data['close'], timeperiod=6)
-    daily_data_indicators['wr_10'] = tl.WILLR(data['high'], data['low'], data['close'], timeperiod=10)
-    daily_data_indicators['wr_14'] = tl.WILLR(data['high'], data['low'], data['close'], timeperiod=14)
-
-    # 计算CCI
-    daily_data_indicators['cci'] = tl.CCI(data['high'], data['low'], data['close'])
-    daily_data_indicators['cci_84'] = tl.SMA(daily_data_indicators['cci'], timeperiod=84)
-
-    # # 计算TRIX和TRMA（假设TRMA是TRIX的简单移动平均）
-    # daily_data_indicators['trix'] = tl.TRIX(data['close'])
-    # daily_data_indicators['trix_20_sma'] = tl.SMA(daily_data_indicators['trix'], timeperiod=20)
-
-    # 计算CR
-    # data['m_price'] = data['amount'] / data['volume']
-    # data['m_price_sf1'] = data['m_price'].shift(1, fill_value=0.0)
-    # data['h_m'] = data['high'] - data[['m_price_sf1', 'high']].min(axis=1)
-    # data['m_l'] = data['m_price_sf1'] - data[['m_price_sf1', 'low']].min(axis=1)
-    # data['h_m_sum'] = data['h_m'].rolling(window=26).sum()
-    # data['m_l_sum'] = data['m_l'].rolling(window=26).sum()
-    # data['cr'] = (data['h_m_sum'] / data['m_l_sum']).fillna(0).replace([np.inf, -np.inf], 0) * 100
-    # data['cr-ma1'] = data['cr'].rolling(window=5).mean()
-    # data['cr-ma2'] = data['cr'].rolling(window=10).mean()
-    # data['cr-ma3'] = data['cr'].rolling(window=20).mean()
-
-    # 计算SMA（简单移动平均）
-    # data['sma'] = tl.SMA(data['close'])
-
-    # 计算RSI
-    daily_data_indicators['rsi_6'] = tl.RSI(data['close'], timeperiod=6)
-    daily_data_indicators['rsi_12'] = tl.RSI(data['close'], timeperiod=12)
-    daily_data_indicators['rsi'] = tl.RSI(data['close'])
-    daily_data_indicators['rsi_24'] = tl.RSI(data['close'], timeperiod=24)
-
-    # 手动计算VR
-    close_diff = data['close'].diff()
-    up_volume = data['volume'] * (close_diff > 0).astype(int)
-    down_volume = data['volume'] * (close_diff < 0).astype(int)
-    daily_data_indicators['vr'] = up_volume.rolling(window=26).sum() / down_volume.rolling(window=26).sum() * 100
-    daily_data_indicators['vr'] = daily_data_indicators['vr'].fillna(0.0).replace([np.inf, -np.inf], 0.0)
-    daily_data_indicators['vr_6_sma'] = tl.SMA(daily_data_indicators['vr'], timeperiod=6)
-
-    # 计算ROC
-    # 修正：ROC函数返回值只有一个，原代码可能有误
-    daily_data_indicators['roc'] = tl.ROC(data['close'])
-
-     # 计算DMI相关指标
-    timeperiod = 14
-    daily_data_indicators['pdi'] = tl.PLUS_DI(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['mdi'] = tl.MINUS_DI(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['dx'] = tl.DX(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['adx'] = tl.ADX(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['adxr'] = tl.ADXR(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-
-
-    # 计算TR和ATR
-    daily_data_indicators['tr'] = tl.TRANGE(data['high'], data['low'], data['close'])
-    daily_data_indicators['atr'] = tl.ATR(data['high'], data['low'], data['close'])
-
-    # 计算DMA和AMA（假设AMA是DMA的简单移动平均）
-    # data['dma'] = tl.DMA(data['close'])
-    # data['dma_10_sma'] = tl.SMA(data['dma'], timeperiod=10)
-
-    # 计算OBV
-    daily_data_indicators['obv'] = tl.OBV(data['close'], data['volume'])
-
-    # 计算SAR
-    daily_data_indicators['sar'] = tl.SAR(data['high'], data['low'])
-
-    # 计算PSY
-    price_up = (data['close'] > data['close'].shift(1)).astype(int)
-    daily_data_indicators['psy'] = (price_up.rolling(12).sum() / 12 * 100).fillna(0)
-    daily_data_indicators['psyma'] = daily_data_indicators['psy'].rolling(6).mean()
-
-    # 计算BRAR
-    prev_close = data['close'].shift(1, fill_value=0)
-    br_up = (data['high'] - prev_close).clip(lower=0)
-    br_down = (prev_close - data['low']).clip(lower=0)
-    daily_data_indicators['br'] = (br_up.rolling(26).sum() / br_down.rolling(26).sum()).fillna(0).replace([np.inf, -np.inf], 0) * 100
-
-    ar_up = (data['high'] - data['open']).clip(lower=0)
-    ar_down = (data['open'] - data['low']).clip(lower=0)
-    daily_data_indicators['ar'] = (ar_up.rolling(26).sum() / ar_down.rolling(26).sum()).fillna(0).replace([np.inf, -np.inf], 0) * 100
-
-    # 计算EMV
-    hl_avg = (data['high'] + data['low']) / 2
-    prev_hl_avg = hl_avg.shift(1, fill_value=0)
-    volume = data['volume'].replace(0, 1)  # 避免除零
-    daily_data_indicators['emv'] = ((hl_avg - prev_hl_avg) * (data['high'] - data['low']) / volume).rolling(14).sum()
-    daily_data_indicators['emva'] = daily_data_indicators['emv'].rolling(9).mean()
-
-    # # 计算BIAS
-    # daily_data_indicators['bias'] = (data['close'] - tl.SMA(data['close'], timeperiod=6)) / tl.SMA(data['close'], timeperiod=6) * 100
-    # daily_data_indicators['bias_12'] = (data['close'] - tl.SMA(data['close'], timeperiod=12)) / tl.SMA(data['close'], timeperiod=12) * 100
-    # daily_data_indicators['bias_24'] = (data['close'] - tl.SMA(data['close'], timeperiod=24)) / tl.SMA(data['close'], timeperiod=24) * 100
-
-    # 计算MFI
-    daily_data_indicators['mfi'] = tl.MFI(data['high'], data['low'], data['close'], data['volume'])
-    daily_data_indicators['mfisma'] = tl.SMA(daily_data_indicators['mfi'])
-
-    # 计算VWMA
-    daily_data_indicators['vwma'] = (data['close'] * data['volume']).cumsum() / data['volume'].cumsum()
-    daily_data_indicators['mvwma'] = tl.SMA(daily_data_indicators['vwma'])
-
-    # 计算PPO
-    daily_data_indicators['ppo'] = tl.PPO(data['close'], fastperiod=12, slowperiod=26, matype=1)
-    daily_data_indicators['ppos'] = tl.EMA(daily_data_indicators['ppo'], timeperiod=9)
-    daily_data_indicators['ppoh'] = daily_data_indicators['ppo'] - daily_data_indicators['ppos']
-    daily_data_indicators['ppo'] = daily_data_indicators['ppo'].fillna(0)
-    daily_data_indicators['ppos'] = daily_data_indicators['ppos'].fillna(0)
-    daily_data_indicators['ppoh'] = daily_data_indicators['ppoh'].fillna(0)
-
-    # 计算WT（假设WT1和WT2的计算方法）
-    daily_data_indicators['wt1'] = (data['close'] - tl.SMA(data['close'], timeperiod=10)) / tl.STDDEV(data['close'], timeperiod=10)
-    daily_data_indicators['wt2'] = (data['close'] - tl.SMA(data['close'], timeperiod=20)) / tl.STDDEV(data['close'], timeperiod=20)
-
-    # 计算Supertrend（简单示例，实际可能需要更复杂的实现）
-    # atr_multiplier = 3
-    # daily_data_indicators['atr'] = tl.ATR(data['high'], data['low'], data['close'])
-    # daily_data_indicators['upper_band'] = data['close'] + (atr_multiplier * daily_data_indicators['atr'])
-    # daily_data_indicators['lower_band'] = data['close'] - (atr_multiplier * daily_data_indicators['atr'])
-    # daily_data_indicators['supertrend'] = daily_data_indicators['upper_band']
-    # daily_data_indicators['supertrend_ub'] = daily_data_indicators['upper_band']
-    # daily_data_indicators['supertrend_lb'] = daily_data_indicators['lower_band']
-
-    # 计算DPO
-    daily_data_indicators['dpo'] = data['close'] - tl.SMA(data['close'], timeperiod=20)
-    daily_data_indicators['madpo'] = tl.SMA(daily_data_indicators['dpo'])
-
-    # 计算VHF
-    window = 28
-    high_close = data['close'].rolling(window).max()
-    low_close = data['close'].rolling(window).min()
-    sum_diff = abs(data['close'] - data['close'].shift(1)).rolling(window).sum()
-    daily_data_indicators['vhf'] = ((high_close - low_close) / sum_diff).fillna(0)
-
-    # 计算RVI
-    rvi_x = (
-        (data['close'] - data['open']) +
-        2 * (data['close'].shift(1) - data['open'].shift(1)) +
-        2 * (data['close'].shift(2) - data['open'].shift(2)) +
-        (data['close'].shift(3) - data['open'].shift(3))
-    ) / 6
-
-    rvi_y = (
-        (data['high'] - data['low']) +
-        2 * (data['high'].shift(1) - data['low'].shift(1)) +
-        2 * (data['high'].shift(2) - data['low'].shift(2)) +
-        (data['high'].shift(3) - data['low'].shift(3))
-    ) / 6
-
-    daily_data_indicators['rvi'] = (rvi_x.rolling(10).mean() / rvi_y.rolling(10).mean()).fillna(0)
-    daily_data_indicators['rvis'] = (
-        daily_data_indicators['rvi'] + 
-        2 * daily_data_indicators['rvi'].shift(1) + 
-        2 * daily_data_indicators['rvi'].shift(2) + 
-        daily_data_indicators['rvi'].shift(3)
-    ) / 6
-
-    # 计算FI
-    daily_data_indicators['fi'] = (data['close'] - data['close'].shift(1)) * data['volume']
-    daily_data_indicators['force_2'] = tl.SMA(daily_data_indicators['fi'], timeperiod=2)
-    daily_data_indicators['force_13'] = tl.SMA(daily_data_indicators['fi'], timeperiod=13)
-
-    # 计算ENE
-    daily_data_indicators['ene_ue'] = tl.EMA(data['close'], timeperiod=25) + 2 * tl.STDDEV(data['close'], timeperiod=25)
-    daily_data_indicators['ene'] = tl.EMA(data['close'], timeperiod=25)
-    daily_data_indicators['ene_le'] = tl.EMA(data['close'], timeperiod=25) - 2 * tl.STDDEV(data['close'], timeperiod=25)
-
-    # 计算STOCHRSI
-    daily_data_indicators['stochrsi_k'], daily_data_indicators['stochrsi_d'] = tl.STOCHRSI(data['close'])
+    # 计算指标（定义见 instock.core.indicator.registry），columns 为 None 时计算全部指标
+    daily_data_indicators = pd.concat([daily_data_indicators, ireg.calculate(data, columns)], axis=1)
     daily_data_indicators = daily_data_indicators.replace([np.inf, -np.inf], np.nan)
     daily_data_indicators = daily_data_indicators.fillna(0)
 
@@ -281,7 +92,22 @@ INDICATOR_TABLES = {
 }
 
 # 数据库连接配置
-MAX_HISTORY_WINDOW = 300  # 指标计算所需最大历史窗口
+HISTORY_BARS = 1000       # 每批读取各代码最近的日线条数（约合周线 200 根、月线 48 根）
+MIN_BARS = 34             # 与 calculate_indicators 一致，K线不足的代码跳过
+
+# 周线/月线指标表（由同一批日线合成后计算）
+RESAMPLE_TABLES = {
+    'weekly': {
+        'stock': tbs.TABLE_CN_STOCK_INDICATORS_WEEKLY['name'],
+        'etf': tbs.TABLE_CN_ETF_INDICATORS_WEEKLY['name'],
+        'index': tbs.TABLE_CN_INDEX_INDICATORS_WEEKLY['name']
+    },
+    'monthly': {
+        'stock': tbs.TABLE_CN_STOCK_INDICATORS_MONTHLY['name'],
+        'etf': tbs.TABLE_CN_ETF_INDICATORS_MONTHLY['name'],
+        'index': tbs.TABLE_CN_INDEX_INDICATORS_MONTHLY['name']
+    }
+}
 
 
 def get_latest_codes(data_type: str) -> List[str]:
@@ -298,104 +124,6 @@ def get_latest_codes(data_type: str) -> List[str]:
         print(f"获取{data_type}代码失败：{str(e)}")
         return []
 
-def get_hist_data(code: str, data_type: str, last_date: str = None) -> pd.DataFrame:
-    """获取带日期范围的行情数据"""
-    try:
-        with DBManager.get_new_connection() as conn:
-            base_query = f"""
-                SELECT * FROM {TABLE_MAP[data_type]['hist_table']}
-                WHERE code = '{code}' 
-            """
-            
-            if last_date:
-                query = f"""
-                    {base_query}
-                    AND date >= (
-                        SELECT DATE_SUB('{last_date}', INTERVAL {MAX_HISTORY_WINDOW} DAY) 
-                        FROM DUAL
-                    )
-                """
-            else:
-                query = base_query + " ORDER BY date DESC LIMIT 1000"
-
-            data = pd.read_sql(query, conn)
-            # --- 调试7: 验证原始数据质量 ---
-            # print(f"[DEBUG] {code} 原始数据统计:")
-            # print("记录数:", len(data))
-            # print("时间范围:", data['date'].min(), "至", data['date'].max())
-            # print("缺失值统计:")
-            # print(data[['close', 'high', 'low', 'volume']].isnull().sum())
-            
-            return data.sort_values('date', ascending=True) if not data.empty else pd.DataFrame()
-            # return data.sort_values('date', ascending=True)
-    except Exception as e:
-        print(f"获取{data_type}历史数据失败：{code}-{str(e)}")
-        return pd.DataFrame()
-
-def calculate_and_save(code: str, data_type: str):
-    """完整的处理流水线"""
-    try:
-        # 检查目标表是否存在
-        table_name = INDICATOR_TABLES[data_type]
-        # create_table_if_not_exists(table_name)
-        
-        # 获取最新处理日期
-        last_processed_date = get_last_processed_date(table_name, code)
-        
-        # 获取历史数据（增量逻辑）
-        hist_data = get_hist_data(code, data_type, last_processed_date)
-        if hist_data.empty:
-            print(f"跳过空数据：{data_type} {code}")
-            return
-
-        # 检查必需字段是否存在
-        required_columns = {'date', 'code', 'close', 'high', 'low', 'volume'}
-        missing_columns = required_columns - set(hist_data.columns)
-        if missing_columns:
-            print(f"数据缺失关键列 {missing_columns}，跳过处理：{code}")
-            return
-
-        # 计算指标
-        # print(f"\n=== 开始处理 {code} ===")
-        indicators = calculate_indicators(hist_data)
-        
-        # --- 调试5: 输出前5行数据样本 ---
-        # print(f"[DEBUG] {code} 计算结果样本:")
-        # print(indicators.head())
-        
-        # --- 调试6: 检查是否存在负无穷或零值 ---
-        # print(f"[DEBUG] {code} 异常值统计:")
-        # print("Inf values:", (indicators == np.inf).sum().sum())
-        # print("-Inf values:", (indicators == -np.inf).sum().sum())
-        # print("Zero values:", (indicators == 0).sum().sum())
-
-        # 过滤已存在数据
-        if last_processed_date:
-            indicators = indicators[indicators['date'] > last_processed_date]
-        
-        # 写入数据库前检查数据是否为空
-        if not indicators.empty:
-            sync_and_save(table_name, indicators)
-            print(f"更新{data_type}指标：{code} {len(indicators)}条")
-        else:
-            print(f"无新数据需更新：{code}")
-    except Exception as e:
-        print(f"处理{data_type} {code}失败：{str(e)}")
-
-def get_last_processed_date(table: str, code: str) -> str:
-    """获取指定代码的最后处理日期"""
-    try:
-        with DBManager.get_new_connection() as conn:
-            query = f"""
-                SELECT MAX(date) AS last_date 
-                FROM {table} 
-                WHERE code = '{code}'
-            """
-            result = pd.read_sql(query, conn)
-            return result.iloc[0]['last_date']
-    except:
-        return None
-
 def sync_and_save(table_name: str, data: pd.DataFrame):
     # print(f"[DEBUG] 准备写入数据，形状：{data.shape}")
     """同步表结构并保存数据"""
@@ -406,42 +134,11 @@ def sync_and_save(table_name: str, data: pd.DataFrame):
             if conn.is_connected():
                 conn.close()
                 
-    sql_txt = sql语句生成器(table_name, data)
-    execute_raw_sql(sql_txt)
-
-
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
+    # 预处理数据（如添加code_int）
+    if 'code' in data.columns and 'code_int' not in data.columns:
+        data.insert(0, 'code_int', data['code'].astype(int))
+    # 返回写库结果：False 由 WriteBehind 计为失败，main() 结束时报告
+    return executemany_upsert(table_name, data, unique_keys=['date', 'code'])
 
 
 def create_table_if_not_exists(table_name):
@@ -482,159 +179,29 @@ def create_table_if_not_exists(table_name):
 
 
 def 同步表结构(conn, table_name, data_columns):
-    """动态添加缺失字段（线程安全+事务锁）"""
+    """动态添加缺失字段：字段集合进程内缓存，缺失字段一条 ALTER TABLE 一次性添加"""
     try:
-        cursor = conn.cursor(buffered=True)
-        
-        # 1. 获取表级写锁
-        cursor.execute(f"LOCK TABLES `{table_name}` WRITE;")
-        
-        # 2. 使用 INFORMATION_SCHEMA 检查字段
-        cursor.execute(f"""
-            SELECT COLUMN_NAME 
-            FROM INFORMATION_SCHEMA.COLUMNS 
-            WHERE TABLE_NAME = '{table_name}' 
-              AND TABLE_SCHEMA = DATABASE()
-        """)
-        existing_columns = {row[0] for row in cursor.fetchall()}
-        
-        # 3. 获取配置表字段
+        existing_columns = get_table_columns(table_name, conn)
+
+        # 获取配置表字段
         table_config = tbs.TABLE_REGISTRY.get(table_name, {})
-        all_required_columns = set(table_config.get('columns', {}).keys())
-        
-        # 4. 遍历处理字段
+        config_columns = table_config.get('columns', {})
+
+        missing_columns = {}
         for col in data_columns:
-            try:
-                if col not in existing_columns:
-                    if col in all_required_columns:
-                        col_info = table_config['columns'][col]
-                        sql_type = tbs._get_sql_type(col_info['type'])
-                        alter_sql = f"ALTER TABLE `{table_name}` ADD COLUMN `{col}` {sql_type};"
-                        print(f"[EXECUTE] 执行SQL：{alter_sql}")
-                        cursor.execute(alter_sql)
-                        conn.commit()
-                    else:
-                        print(f"[DEBUG] 字段 {col} 不在配置表中，已跳过")
-                else:
-                    pass  # 字段已存在，无需处理
-            except mysql.connector.Error as err:
-                if err.errno == 1060:  # 捕获重复字段错误
-                    print(f"[WARNING] 字段 {col} 可能已被其他线程创建，错误信息：{err}")
-                else:
-                    raise
-            except Exception as e:
-                print(f"[ERROR] 处理字段 {col} 失败：{str(e)}")
-                conn.rollback()
-                
-        # 5. 释放锁
-        cursor.execute("UNLOCK TABLES;")
-        conn.commit()
-        print(f"[SUCCESS] 表 {table_name} 结构同步完成")
-        
+            if col in existing_columns:
+                continue
+            if col in config_columns:
+                missing_columns[col] = tbs._get_sql_type(config_columns[col]['type'])
+            else:
+                print(f"[WARNING] 字段 {col} 不在配置表中，已跳过")
+
+        if missing_columns and add_missing_columns(table_name, missing_columns, conn) is None:
+            print(f"[CRITICAL] 同步表结构失败：{table_name}")
+
     except Exception as main_error:
         print(f"[CRITICAL] 同步表结构主流程失败：{str(main_error)}")
         conn.rollback()
-    finally:
-        if conn.is_connected():
-            cursor.close()
-
-
-def sql语句生成器(table_name, data):
-    # # 准备模板
-    # sql_template = """INSERT INTO `{table_name}` ({columns}) VALUES {values} ON DUPLICATE KEY UPDATE {update_clause};"""
-    # # 预处理列名和更新子句
-    # columns = ', '.join([f"`{col}`" for col in data.columns])
-    # update_clause = ', '.join([f"`{col}`=VALUES(`{col}`)" for col in data.columns if col not in ['date', 'code']])
-    # 准备模板
-    # 
-    # 
-    # 检查输入数据是否为空
-    if data.empty:
-        print("[WARNING] 输入数据为空，跳过SQL生成")
-        return ""
-
-    # 预处理数据（如添加code_int）
-    if 'code' in data.columns and 'code_int' not in data.columns:
-        data.insert(0, 'code_int', data['code'].astype(int))
-
-    sql_template = """INSERT INTO `{table_name}` ({columns}) 
-        VALUES {values} 
-        ON DUPLICATE KEY UPDATE {update_clause};"""
-
-    # 预处理列名
-    columns = ', '.join([f"`{col}`" for col in data.columns])
-
-    # 指定唯一键列（这些字段用于比对数据库中的记录）
-    unique_keys = ['date', 'code'] 
-
-    # 更新子句：更新所有非唯一键的列
-    update_clause = ', '.join(
-        [f"`{col}`=VALUES(`{col}`)"
-         for col in data.columns
-         if col not in unique_keys]
-    )
-    # 批量处理值
-    value_rows = []
-    for row in data.itertuples(index=False):
-        values = []
-        for item in row:
-            if pd.isna(item) or item in ['-', '']:
-                values.append("NULL")
-            elif isinstance(item, (datetime.date, datetime.datetime)):
-                values.append(f"'{item.strftime('%Y-%m-%d')}'")
-            elif isinstance(item, (int, float, bool)):
-                values.append(str(item))
-            else:
-                # 使用三重引号避免嵌套冲突
-                cleaned_item = str(item).replace("'", "''")
-                values.append(f"'{cleaned_item}'")
-        value_rows.append(f"({', '.join(values)})")
-
-    # 批量生成SQL
-    sql_statements = [
-        sql_template.format(
-            table_name=table_name,
-            columns=columns,
-            values=values,
-            update_clause=update_clause
-        )
-        for values in value_rows
-    ]
-
-    # 连接所有语句
-    sql_txt = "\n".join(sql_statements)
-    return sql_txt
-
-
-def execute_raw_sql(sql, params=None, max_query_size=1024*1024, batch_size=5000):
-    """改进批量写入性能"""
-    if not sql.strip():
-        print("[WARNING] SQL语句为空，跳过执行")
-        return False
-    
-    connection = DBManager.get_new_connection()
-    if not connection:
-        return False
-    try:
-        cursor = connection.cursor()
-        statements = [s.strip() for s in sql.split(';') if s.strip()]
-        if not statements:
-            print("[WARNING] 无有效SQL语句")
-            return False
-        
-        for statement in statements:
-            cursor.execute(statement)
-        connection.commit()
-        return True
-    except Error as e:
-        print(f"数据库错误: {e}")
-        connection.rollback()
-        return False
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
-
 
 
 from itertools import islice
@@ -644,37 +211,131 @@ def batch(iterable, batch_size=100):
     while batch := list(islice(iterator, batch_size)):
         yield batch
 
+def get_hist_data_batch(batch_codes: List[str], data_type: str) -> pd.DataFrame:
+    """一次查询一批代码各自最近 HISTORY_BARS 条日线，按 (code, date) 升序返回"""
+    if not batch_codes:
+        return pd.DataFrame()
+    try:
+        with DBManager.get_new_connection() as conn:
+            code_list = ",".join(f"'{code}'" for code in batch_codes)
+            query = f"""
+                SELECT date, code, code_int, name, open, close, high, low, volume
+                FROM (
+                    SELECT date, code, code_int, name, open, close, high, low, volume,
+                           ROW_NUMBER() OVER (PARTITION BY code ORDER BY date DESC) AS rn
+                    FROM {TABLE_MAP[data_type]['hist_table']}
+                    WHERE code IN ({code_list})
+                ) t
+                WHERE rn <= {HISTORY_BARS}
+                ORDER BY code, date ASC
+            """
+            return pd.read_sql(query, conn)
+    except Exception as e:
+        print(f"获取{data_type}批次数据失败：{str(e)}")
+        return pd.DataFrame()
+
+
+def get_last_processed_dates_batch(table: str, codes: List[str]) -> Dict[str, datetime.date]:
+    """一次查询一批代码在指标表中的最后日期"""
+    if not codes:
+        return {}
+    try:
+        with DBManager.get_new_connection() as conn:
+            code_list = ",".join(f"'{code}'" for code in codes)
+            query = f"""
+                SELECT code, MAX(date) AS last_date
+                FROM {table}
+                WHERE code IN ({code_list})
+                GROUP BY code
+            """
+            result = pd.read_sql(query, conn)
+            return dict(zip(result['code'], result['last_date']))
+    except Exception as e:
+        print(f"获取{table}最后处理日期失败：{str(e)}")
+        return {}
+
+
+def calculate_indicators_batch(bars: pd.DataFrame) -> pd.DataFrame:
+    """
+    整批代码排成 (代码数, K线数) 矩阵一次算完指标（与逐代码 calculate_indicators 结果一致），
+    K线不足 MIN_BARS 条的代码跳过
+    """
+    if bars.empty:
+        return pd.DataFrame()
+    bars, codes, starts, ends = key_offsets(bars, 'code')
+    keep = (ends - starts) >= MIN_BARS
+    if not keep.any():
+        return pd.DataFrame()
+    if not keep.all():
+        bars = bars.iloc[np.repeat(keep, ends - starts)]
+        bars, codes, starts, ends = key_offsets(bars, 'code')
+
+    rows, cols, width = panel_index(starts, ends)
+    panels = [to_panel(bars[col].to_numpy(dtype=np.float64), rows, cols, len(codes), width)
+              for col in ('open', 'high', 'low', 'close', 'volume')]
+    values = calculate_panel(*panels)
+    columns = {
+        'date': bars['date'].to_numpy(),
+        'code': bars['code'].to_numpy(),
+        'code_int': bars['code_int'].to_numpy(),
+        'name': bars['name'].to_numpy(),
+        'close': bars['close'].to_numpy(),
+    }
+    for name in INDICATOR_COLUMNS:
+        columns[name] = finalize(values[name][rows, cols])
+    return pd.DataFrame(columns)
+
+
+def filter_new_rows(indicators: pd.DataFrame, last_dates: Dict[str, datetime.date], inclusive: bool) -> pd.DataFrame:
+    """只保留各代码最后处理日期之后的行；inclusive 时含最后日期（周/月线未走完的周期需要重算）"""
+    if indicators.empty or not last_dates:
+        return indicators
+    dates = pd.to_datetime(indicators['date'])
+    last = pd.to_datetime(indicators['code'].map(last_dates))
+    newer = (dates >= last) if inclusive else (dates > last)
+    return indicators[(last.isna() | newer).to_numpy()]
+
+
 def main():
     # 预先初始化所有表结构（主线程执行）
     for data_type in ['stock', 'etf', 'index']:
-        table_name = INDICATOR_TABLES[data_type]
-        create_table_if_not_exists(table_name)  # 确保只执行一次
-
-    batch_size = 500  # 每批处理100个代码
-    max_workers = 50   # 根据CPU核心数调整（建议2-4倍核心数）
-    
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for data_type in ['etf', 'index' , 'stock']:
+        create_table_if_not_exists(INDICATOR_TABLES[data_type])  # 确保只执行一次
+        for freq in FREQS:
+            create_table_if_not_exists(RESAMPLE_TABLES[freq][data_type])
+
+    batch_size = 500  # 每批处理500个代码
+
+    # 每批日线只读一次：日线指标直接计算，周线/月线由同一批日线合成后计算；写库放到后台线程
+    writer = WriteBehind(name='indicators_weekly_writer')
+    try:
+        for data_type in ['etf', 'index', 'stock']:
             codes = get_latest_codes(data_type)
             print(f"开始处理 {data_type} 共 {len(codes)} 个代码")
-            
-            # 分批次提交任务
+
             for code_batch in batch(codes, batch_size=batch_size):
-                for code in code_batch:
-                    futures.append(executor.submit(calculate_and_save, code, data_type))
-                
-                # 控制批次提交节奏
-                _ = [future.result() for future in futures]  # 等待当前批次完成
-                futures.clear()
-                print(f"已完成一批 {len(code_batch)} 个代码的处理")
+                daily_bars = get_hist_data_batch(code_batch, data_type)
+                if daily_bars.empty:
+                    print(f"批次无数据，跳过 {len(code_batch)} 个代码")
+                    continue
+
+                for freq in ('daily',) + FREQS:
+                    if freq == 'daily':
+                        table_name = INDICATOR_TABLES[data_type]
+                        bars = daily_bars
+                    else:
+                        table_name = RESAMPLE_TABLES[freq][data_type]
+                        bars = resample_ohlcv(daily_bars, freq, key='code')
+                    indicators = calculate_indicators_batch(bars)
+                    last_dates = get_last_processed_dates_batch(table_name, code_batch)
+                    indicators = filter_new_rows(indicators, last_dates, inclusive=(freq != 'daily'))
+                    if not indicators.empty:
+                        writer.submit(sync_and_save, table_name, indicators)
+                        print(f"更新{data_type}{freq}指标：{len(indicators)}条")
 
-        # 处理剩余任务
-        for future in futures:
-            try:
-                future.result()
-            except Exception as e:
-                print(f"任务执行异常：{str(e)}")
+                print(f"已完成一批 {len(code_batch)} 个代码的处理")
+    finally:
+        if not writer.close():
+            print("部分批次写库失败，详见日志")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
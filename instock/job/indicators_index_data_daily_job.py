@@ -20,6 +20,7 @@ import instock.core.indicator.calculate_index_indicator as idr
 from functools import lru_cache
 import instock.lib.trade_time as trd
 from instock.lib.singleton_type import singleton_type
+import instock.lib.http_session as http_session
 from sqlalchemy import text
 from sqlalchemy import Date, Float, String  # 引入 SQLAlchemy 的 Date、Float 和 String 类型
 from sqlalchemy import create_engine, MetaData, Table, Column
@@ -186,7 +187,7 @@ def index_zh_a_spot_em() -> pd.DataFrame:
     }
     try:
         # 发送第一次请求获取总数据量和 page_size
-        r = requests.get(url, params=params)
+        r = http_session.get(url, params=params)
         r.raise_for_status()
         data_json = r.json()
         # print(f'{data_json}')
@@ -199,7 +200,7 @@ def index_zh_a_spot_em() -> pd.DataFrame:
         for page in range(1, total_pages + 1):
             params["pn"] = str(page)
             params["pz"] = str(page_size)
-            r = requests.get(url, params=params)
+            r = http_session.get(url, params=params)
             r.raise_for_status()
             data_json = r.json()
             if data_json["data"]["diff"]:
@@ -280,7 +281,7 @@ def fetch_index_hist(
         "_": "1623766962675",
     }
     # print(f"Fetching historical data for symbol {symbol} with params: {params}")
-    r = requests.get(url, params=params)
+    r = http_session.get(url, params=params)
     data_json = r.json()
     # print(f'{data_json}')
     if not (data_json["data"] and data_json["data"]["klines"]):
@@ -364,7 +365,7 @@ def code_id_map_em() -> dict:
             "_": "1623833739532",
         }
         try:
-            r = requests.get(url, params=params)
+            r = http_session.get(url, params=params)
             r.raise_for_status()
             data_json = r.json()
             total = data_json["data"]["total"]
@@ -376,7 +377,7 @@ def code_id_map_em() -> dict:
             for page in range(1, total_pages + 1):
                 params["pn"] = str(page)
                 params["pz"] = str(page_size)
-                r = requests.get(url, params=params)
+                r = http_session.get(url, params=params)
                 r.raise_for_status()
                 data_json = r.json()
                 if data_json["data"]["diff"]:
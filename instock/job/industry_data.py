@@ -10,15 +10,15 @@ sys.path.append(cpath)
 
 import json
 import math
-import requests
 import numpy as np
 import pandas as pd
-import talib as tl
+import instock.core.indicator.registry as ireg
 import time
 import datetime 
-import mysql.connector
 # import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
+from instock.lib.prefetch import prefetch
+from instock.lib.frame_split import split_by_key
 import pandas_market_calendars as mcal
 from mysql.connector import Error
 from typing import Optional  # 新增导入
@@ -27,7 +27,9 @@ from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
 from sqlalchemy.dialects.mysql import TINYINT
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset 
+from instock.lib.database import DBManager, executemany_upsert, get_table_columns, add_missing_columns
+import instock.lib.http_session as http_session
+from instock.lib.kline_parse import kline_columns, parse_klines
 
 
 
@@ -417,15 +419,8 @@ def industry_zh_a_spot_em() -> pd.DataFrame:
             
             # 3. 生成并执行SQL
             try:
-                # 生成批量SQL
-                sql_batches = sql_batch_generator(
-                    table_name=table_name,
-                    data=temp_df,
-                    batch_size=1000  # 根据实际情况调整
-                )
-                
-                # 执行批量插入
-                execute_batch_sql(sql_batches)
+                # 参数化批量写入
+                executemany_upsert(table_name, temp_df, unique_keys=['date_int', 'name'], batch_size=1000)
                 print(f"[Success] 行业主表批量写入完成，数据量：{len(temp_df)}")
             except Exception as e:
                 print(f"[Critical] 行业主表批量写入失败: {str(e)}")
@@ -481,15 +476,8 @@ def industry_zh_a_spot_em() -> pd.DataFrame:
             
             # 4. 生成并执行SQL
             try:
-                # 生成批量SQL
-                sql_batches = sql_batch_generator(
-                    table_name=industry_info,
-                    data=industry_info_df,
-                    batch_size=1000  # 根据实际情况调整
-                )
-                
-                # 执行批量插入
-                execute_batch_sql(sql_batches)
+                # 参数化批量写入
+                executemany_upsert(industry_info, industry_info_df, unique_keys=['date_int', 'name'], batch_size=1000)
                 
                 print(f"[Success] 行业基础信息表写入完成，数据量：{len(industry_info_df)}")
             except Exception as e:
@@ -519,7 +507,7 @@ def fetch_zh_a_spot_data(
         page_param_name: start_page  # 起始页码
     }
     try:
-        r = requests.get(url, params=first_page_params)
+        r = http_session.get(url, params=first_page_params)
         r.raise_for_status()
         data_json = r.json()
         data_count = data_json["data"]["total"]
@@ -539,7 +527,7 @@ def fetch_zh_a_spot_data(
             page_param_name: page   # 正确设置页码参数
         }
         try:
-            r = requests.get(url, params=page_params)
+            r = http_session.get(url, params=page_params)
             r.raise_for_status()
             return r.json()["data"]["diff"]
         except Exception as e:
@@ -662,25 +650,13 @@ def fetch_single_hist(code: str, market_id: str, period: str, name: str, data_ty
         }
 
         # 发送请求与数据处理（与原逻辑一致）
-        r = requests.get(url, params=params, timeout=10)
+        r = http_session.get(url, params=params, timeout=10)
         data_json = r.json()
         if not data_json.get("data"):
             return None
 
-        # 数据处理与字段映射
-        df = pd.DataFrame([item.split(",") for item in data_json["data"]["klines"]])
-        en_name = {
-            table_config['columns'][k]['map']: table_config['columns'][k]['en']
-            for k in table_config['columns']
-            if 'map' in table_config['columns'][k]
-        }
-        
-        # 格式转换与字段添加
-        numeric_cols = [1,2,3,4,5,6,7,8,9,10]
-        df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce')
-        df.rename(columns=en_name, inplace=True)
-        df['date'] = pd.to_datetime(df['date'])
-        df['date_int'] = df['date'].astype(str).str.replace('-', '')
+        # 数据处理与字段映射：klines 一次解析为数值列，date_int 由日期算出
+        df = parse_klines(data_json["data"]["klines"], kline_columns(table_config['columns']))
         df['code'] = code
         # df['code_int'] = code
         df['period'] = period
@@ -776,11 +752,7 @@ def process_3day_data(
         
         if not df.empty:
             # 第三步：写入目标表
-            sql_batches = sql语句生成器("industry_3day_indicators", df)
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                futures = [executor.submit(DBManager.execute_sql, sql) for sql in sql_batches]
-                for future in tqdm(as_completed(futures), total=len(futures), desc="写入进度"):
-                    future.result()
+            executemany_upsert("industry_3day_indicators", df, unique_keys=['date_int', 'name'])
             print(f"industry_3day_indicators 数据更新完成，新增 {len(df)} 条记录")
         else:
             print(f"未从 cn_industry_indicators 获取到有效数据")
@@ -1040,10 +1012,9 @@ def sync_and_save(table_name: str, data: pd.DataFrame):
     #         if conn.is_connected():
     #             conn.close()
                 
-    sql_txt = sql语句生成器(table_name, data)
-    execute_raw_sql(sql_txt)
+    executemany_upsert(table_name, data, unique_keys=['date_int', 'name'])
 
-def calculate_indicators(data):
+def calculate_indicators(data, columns=None):
     # 检查数据长度是否满足最小窗口（例如MACD需要至少34条数据）
     min_window = 34  # 根据TA-Lib指标要求调整
     if len(data) < min_window:
@@ -1076,198 +1047,8 @@ def calculate_indicators(data):
     '''
 
 
-    # 计算MACD
-    daily_data_indicators['macd'], daily_data_indicators['macds'], daily_data_indicators['macdh'] = tl.MACD(data['close'])
-
-    # 计算KDJ的K和D
-    daily_data_indicators['kdjk'], daily_data_indicators['kdjd'] = tl.STOCH(
-        data['high'], 
-        data['low'], 
-        data['close'],
-        fastk_period=9,    # 默认参数需显式指定
-        slowk_period=5,
-        slowk_matype=1,
-        slowd_period=5,
-        slowd_matype=1
-    )
-
-    # 手动计算J线（J = 3*K - 2*D）
-    daily_data_indicators['kdjj'] = 3 * daily_data_indicators['kdjk'] - 2 * daily_data_indicators['kdjd']
-
-    # 计算BOLL
-    daily_data_indicators['boll_ub'], daily_data_indicators['boll'], daily_data_indicators['boll_lb'] = tl.BBANDS(data['close'])
-    
-    # 计算W&R
-    daily_data_indicators['wr_6'] = tl.WILLR(data['high'], data['low'], data['close'], timeperiod=6)
-    daily_data_indicators['wr_10'] = tl.WILLR(data['high'], data['low'], data['close'], timeperiod=10)
-    daily_data_indicators['wr_14'] = tl.WILLR(data['high'], data['low'], data['close'], timeperiod=14)
-
-    # 计算CCI
-    daily_data_indicators['cci'] = tl.CCI(data['high'], data['low'], data['close'])
-    daily_data_indicators['cci_84'] = tl.SMA(daily_data_indicators['cci'], timeperiod=84)
-
-    # # 计算TRIX和TRMA（假设TRMA是TRIX的简单移动平均）
-    # daily_data_indicators['trix'] = tl.TRIX(data['close'])
-    # daily_data_indicators['trix_20_sma'] = tl.SMA(daily_data_indicators['trix'], timeperiod=20)
-
-    # 计算CR
-    # data['m_price'] = data['amount'] / data['volume']
-    # data['m_price_sf1'] = data['m_price'].shift(1, fill_value=0.0)
-    # data['h_m'] = data['high'] - data[['m_price_sf1', 'high']].min(axis=1)
-    # data['m_l'] = data['m_price_sf1'] - data[['m_price_sf1', 'low']].min(axis=1)
-    # data['h_m_sum'] = data['h_m'].rolling(window=26).sum()
-    # data['m_l_sum'] = data['m_l'].rolling(window=26).sum()
-    # data['cr'] = (data['h_m_sum'] / data['m_l_sum']).fillna(0).replace([np.inf, -np.inf], 0) * 100
-    # data['cr-ma1'] = data['cr'].rolling(window=5).mean()
-    # data['cr-ma2'] = data['cr'].rolling(window=10).mean()
-    # data['cr-ma3'] = data['cr'].rolling(window=20).mean()
-
-    # 计算SMA（简单移动平均）
-    # data['sma'] = tl.SMA(data['close'])
-
-    # 计算RSI
-    daily_data_indicators['rsi_6'] = tl.RSI(data['close'], timeperiod=6)
-    daily_data_indicators['rsi_12'] = tl.RSI(data['close'], timeperiod=12)
-    daily_data_indicators['rsi'] = tl.RSI(data['close'])
-    daily_data_indicators['rsi_24'] = tl.RSI(data['close'], timeperiod=24)
-
-    # 手动计算VR
-    close_diff = data['close'].diff()
-    up_volume = data['volume'] * (close_diff > 0).astype(int)
-    down_volume = data['volume'] * (close_diff < 0).astype(int)
-    daily_data_indicators['vr'] = up_volume.rolling(window=26).sum() / down_volume.rolling(window=26).sum() * 100
-    daily_data_indicators['vr'] = daily_data_indicators['vr'].fillna(0.0).replace([np.inf, -np.inf], 0.0)
-    daily_data_indicators['vr_6_sma'] = tl.SMA(daily_data_indicators['vr'], timeperiod=6)
-
-    # 计算ROC
-    # 修正：ROC函数返回值只有一个，原代码可能有误
-    daily_data_indicators['roc'] = tl.ROC(data['close'])
-
-     # 计算DMI相关指标
-    timeperiod = 14
-    daily_data_indicators['pdi'] = tl.PLUS_DI(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['mdi'] = tl.MINUS_DI(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['dx'] = tl.DX(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['adx'] = tl.ADX(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-    daily_data_indicators['adxr'] = tl.ADXR(data['high'], data['low'], data['close'], timeperiod=timeperiod)
-
-
-    # 计算TR和ATR
-    daily_data_indicators['tr'] = tl.TRANGE(data['high'], data['low'], data['close'])
-    daily_data_indicators['atr'] = tl.ATR(data['high'], data['low'], data['close'])
-
-    # 计算DMA和AMA（假设AMA是DMA的简单移动平均）
-    # data['dma'] = tl.DMA(data['close'])
-    # data['dma_10_sma'] = tl.SMA(data['dma'], timeperiod=10)
-
-    # 计算OBV
-    daily_data_indicators['obv'] = tl.OBV(data['close'], data['volume'])
-
-    # 计算SAR
-    daily_data_indicators['sar'] = tl.SAR(data['high'], data['low'])
-
-    # 计算PSY
-    price_up = (data['close'] > data['close'].shift(1)).astype(int)
-    daily_data_indicators['psy'] = (price_up.rolling(12).sum() / 12 * 100).fillna(0)
-    daily_data_indicators['psyma'] = daily_data_indicators['psy'].rolling(6).mean()
-
-    # 计算BRAR
-    prev_close = data['close'].shift(1, fill_value=0)
-    br_up = (data['high'] - prev_close).clip(lower=0)
-    br_down = (prev_close - data['low']).clip(lower=0)
-    daily_data_indicators['br'] = (br_up.rolling(26).sum() / br_down.rolling(26).sum()).fillna(0).replace([np.inf, -np.inf], 0) * 100
-
-    ar_up = (data['high'] - data['open']).clip(lower=0)
-    ar_down = (data['open'] - data['low']).clip(lower=0)
-    daily_data_indicators['ar'] = (ar_up.rolling(26).sum() / ar_down.rolling(26).sum()).fillna(0).replace([np.inf, -np.inf], 0) * 100
-
-    # 计算EMV
-    hl_avg = (data['high'] + data['low']) / 2
-    prev_hl_avg = hl_avg.shift(1, fill_value=0)
-    volume = data['volume'].replace(0, 1)  # 避免除零
-    daily_data_indicators['emv'] = ((hl_avg - prev_hl_avg) * (data['high'] - data['low']) / volume).rolling(14).sum()
-    daily_data_indicators['emva'] = daily_data_indicators['emv'].rolling(9).mean()
-
-    # # 计算BIAS
-    # daily_data_indicators['bias'] = (data['close'] - tl.SMA(data['close'], timeperiod=6)) / tl.SMA(data['close'], timeperiod=6) * 100
-    # daily_data_indicators['bias_12'] = (data['close'] - tl.SMA(data['close'], timeperiod=12)) / tl.SMA(data['close'], timeperiod=12) * 100
-    # daily_data_indicators['bias_24'] = (data['close'] - tl.SMA(data['close'], timeperiod=24)) / tl.SMA(data['close'], timeperiod=24) * 100
-
-    # 计算MFI
-    daily_data_indicators['mfi'] = tl.MFI(data['high'], data['low'], data['close'], data['volume'])
-    daily_data_indicators['mfisma'] = tl.SMA(daily_data_indicators['mfi'])
-
-    # 计算VWMA
-    daily_data_indicators['vwma'] = (data['close'] * data['volume']).cumsum() / data['volume'].cumsum()
-    daily_data_indicators['mvwma'] = tl.SMA(daily_data_indicators['vwma'])
-
-    # 计算PPO
-    daily_data_indicators['ppo'] = tl.PPO(data['close'], fastperiod=12, slowperiod=26, matype=1)
-    daily_data_indicators['ppos'] = tl.EMA(daily_data_indicators['ppo'], timeperiod=9)
-    daily_data_indicators['ppoh'] = daily_data_indicators['ppo'] - daily_data_indicators['ppos']
-    daily_data_indicators['ppo'] = daily_data_indicators['ppo'].fillna(0)
-    daily_data_indicators['ppos'] = daily_data_indicators['ppos'].fillna(0)
-    daily_data_indicators['ppoh'] = daily_data_indicators['ppoh'].fillna(0)
-
-    # 计算WT（假设WT1和WT2的计算方法）
-    daily_data_indicators['wt1'] = (data['close'] - tl.SMA(data['close'], timeperiod=10)) / tl.STDDEV(data['close'], timeperiod=10)
-    daily_data_indicators['wt2'] = (data['close'] - tl.SMA(data['close'], timeperiod=20)) / tl.STDDEV(data['close'], timeperiod=20)
-
-    # 计算Supertrend（简单示例，实际可能需要更复杂的实现）
-    # atr_multiplier = 3
-    # daily_data_indicators['atr'] = tl.ATR(data['high'], data['low'], data['close'])
-    # daily_data_indicators['upper_band'] = data['close'] + (atr_multiplier * daily_data_indicators['atr'])
-    # daily_data_indicators['lower_band'] = data['close'] - (atr_multiplier * daily_data_indicators['atr'])
-    # daily_data_indicators['supertrend'] = daily_data_indicators['upper_band']
-    # daily_data_indicators['supertrend_ub'] = daily_data_indicators['upper_band']
-    # daily_data_indicators['supertrend_lb'] = daily_data_indicators['lower_band']
-
-    # 计算DPO
-    daily_data_indicators['dpo'] = data['close'] - tl.SMA(data['close'], timeperiod=20)
-    daily_data_indicators['madpo'] = tl.SMA(daily_data_indicators['dpo'])
-
-    # 计算VHF
-    window = 28
-    high_close = data['close'].rolling(window).max()
-    low_close = data['close'].rolling(window).min()
-    sum_diff = abs(data['close'] - data['close'].shift(1)).rolling(window).sum()
-    daily_data_indicators['vhf'] = ((high_close - low_close) / sum_diff).fillna(0)
-
-    # 计算RVI
-    rvi_x = (
-        (data['close'] - data['open']) +
-        2 * (data['close'].shift(1) - data['open'].shift(1)) +
-        2 * (data['close'].shift(2) - data['open'].shift(2)) +
-        (data['close'].shift(3) - data['open'].shift(3))
-    ) / 6
-
-    rvi_y = (
-        (data['high'] - data['low']) +
-        2 * (data['high'].shift(1) - data['low'].shift(1)) +
-        2 * (data['high'].shift(2) - data['low'].shift(2)) +
-        (data['high'].shift(3) - data['low'].shift(3))
-    ) / 6
-
-    daily_data_indicators['rvi'] = (rvi_x.rolling(10).mean() / rvi_y.rolling(10).mean()).fillna(0)
-    daily_data_indicators['rvis'] = (
-        daily_data_indicators['rvi'] + 
-        2 * daily_data_indicators['rvi'].shift(1) + 
-        2 * daily_data_indicators['rvi'].shift(2) + 
-        daily_data_indicators['rvi'].shift(3)
-    ) / 6
-
-    # 计算FI
-    daily_data_indicators['fi'] = (data['close'] - data['close'].shift(1)) * data['volume']
-    daily_data_indicators['force_2'] = tl.SMA(daily_data_indicators['fi'], timeperiod=2)
-    daily_data_indicators['force_13'] = tl.SMA(daily_data_indicators['fi'], timeperiod=13)
-
-    # 计算ENE
-    daily_data_indicators['ene_ue'] = tl.EMA(data['close'], timeperiod=25) + 2 * tl.STDDEV(data['close'], timeperiod=25)
-    daily_data_indicators['ene'] = tl.EMA(data['close'], timeperiod=25)
-    daily_data_indicators['ene_le'] = tl.EMA(data['close'], timeperiod=25) - 2 * tl.STDDEV(data['close'], timeperiod=25)
-
-    # 计算STOCHRSI
-    daily_data_indicators['stochrsi_k'], daily_data_indicators['stochrsi_d'] = tl.STOCHRSI(data['close'])
+    # 计算指标（定义见 instock.core.indicator.registry），columns 为 None 时计算全部指标
+    daily_data_indicators = pd.concat([daily_data_indicators, ireg.calculate(data, columns)], axis=1)
     daily_data_indicators = daily_data_indicators.replace([np.inf, -np.inf], np.nan)
     daily_data_indicators = daily_data_indicators.fillna(0)
 
@@ -1282,8 +1063,7 @@ def calculate_indicators(data):
 定义公共函数：
 create_table_if_not_exists(table_name)：检查数据表是否存在，如果不存在，则创建数据库并添加索引
 同步表结构(conn, table_name, data_columns)： 动态检查并自动添加表中缺失的字段
-sql语句生成器(table_name,data)：带入参数数据表名和数据，生成数据插入语句
-execute_raw_sql(sql,params)：执行插入数据表
+executemany_upsert：instock.lib.database 中的参数化批量写入
 """
 
 #例句
@@ -1320,41 +1100,6 @@ def fetch_and_format_stock_info(sql):
             conn.close()
 
 
-
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
-
-
 def create_table_if_not_exists(table_name):
     # 创建表（不含索引）
     create_table_sql = f"""
@@ -1437,220 +1182,29 @@ def create_table_if_not_exists(table_name):
 
 
 def 同步表结构(conn, table_name, data_columns):
-    """动态添加缺失字段，附带调试日志和错误处理"""
+    """动态添加缺失字段：字段集合进程内缓存，缺失字段一条 ALTER TABLE 一次性添加"""
     try:
-        cursor = conn.cursor(buffered=True)
-        
-        # 调试：打印基本信息
-        # print(f"\n[DEBUG] 开始同步表结构：{table_name}")
-        # print(f"[DEBUG] 数据列要求字段：{data_columns}")
-
-        # 获取现有字段
-        cursor.execute(f"DESCRIBE `{table_name}`;")
-        existing_columns = [row[0] for row in cursor.fetchall()]
-        # print(f"[DEBUG] 数据库现有字段：{existing_columns}")
+        existing_columns = get_table_columns(table_name, conn)
 
         # 获取配置表字段
         table_config = TABLE_REGISTRY.get(table_name, {})
-        all_required_columns = list(table_config.get('columns', {}).keys())
-        # print(f"[DEBUG] 配置表要求字段：{all_required_columns}")
+        config_columns = table_config.get('columns', {})
 
-        # 遍历处理字段
+        missing_columns = {}
         for col in data_columns:
-            try:
-                # print(f"\n[DEBUG] 正在检查字段：{col}")
-                
-                if col not in existing_columns:
-                    if col in all_required_columns:
-                        # 从配置获取字段类型
-                        col_info = table_config['columns'][col]
-                        sql_type = _get_sql_type(col_info['type'])
-                        
-                        # 执行添加字段
-                        alter_sql = f"ALTER TABLE `{table_name}` ADD COLUMN `{col}` {sql_type};"
-                        print(f"[EXECUTE] 执行SQL：{alter_sql}")
-                        
-                        cursor.execute(alter_sql)
-                        # print(f"[SUCCESS] 字段 {col} 添加成功")
-                    else:
-                        print(f"[WARNING] 字段 {col} 不在配置表中，已跳过")
-                else:
-                    pass
-                    # print(f"[INFO] 字段 {col} 已存在，无需添加")
-            except Exception as col_error:
-                print(f"[ERROR] 处理字段 {col} 时发生错误：{str(col_error)}")
-                conn.rollback()  # 回滚当前字段操作
+            if col in existing_columns:
+                continue
+            if col in config_columns:
+                missing_columns[col] = _get_sql_type(config_columns[col]['type'])
+            else:
+                print(f"[WARNING] 字段 {col} 不在配置表中，已跳过")
 
-        conn.commit()
-        print(f"[SUCCESS] 表 {table_name} 结构同步完成")
+        if missing_columns and add_missing_columns(table_name, missing_columns, conn) is None:
+            print(f"[CRITICAL] 同步表结构失败：{table_name}")
 
     except Exception as main_error:
         print(f"[CRITICAL] 同步表结构主流程失败：{str(main_error)}")
         conn.rollback()
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            print("[INFO] 数据库游标已关闭")
-
-
-def sql语句生成器(table_name, data, batch_size=500):
-    # 预处理code_int字段
-    # if 'code' in data.columns and 'code_int' not in data.columns:
-    #     data.insert(0, 'code_int', data['code'].astype(int))
-
-    # SQL模板（批量版本）
-    sql_template = """INSERT INTO `{table_name}` ({columns}) 
-        VALUES {values}
-        ON DUPLICATE KEY UPDATE {update_clause};"""
-
-    # 定义字段和更新子句
-    columns = ', '.join([f"`{col}`" for col in data.columns])
-    unique_keys = ['date_int', 'name']
-    update_clause = ', '.join(
-        [f"`{col}`=VALUES(`{col}`)" 
-         for col in data.columns if col not in unique_keys]
-    )
-
-    # 分批次处理数据
-    batches = []
-    for i in range(0, len(data), batch_size):
-        batch = data.iloc[i:i+batch_size]
-        value_rows = []
-
-        for row in batch.itertuples(index=False):
-            values = []
-            for item in row:
-                # 处理空值和特殊字符
-                if pd.isna(item) or item in ['-', '']:
-                    values.append("NULL")
-                elif isinstance(item, (datetime.date, datetime.datetime)):
-                    values.append(f"'{item.strftime('%Y-%m-%d')}'")
-                elif isinstance(item, (int, float)):
-                    values.append(str(item))
-                else:
-                    cleaned = str(item).replace("'", "''").replace("\\", "\\\\")
-                    values.append(f"'{cleaned}'")
-            value_rows.append(f"({', '.join(values)})")
-
-        # 合并为单个VALUES子句
-        values_str = ',\n'.join(value_rows)
-        batches.append(
-            sql_template.format(
-                table_name=table_name,
-                columns=columns,
-                values=values_str,
-                update_clause=update_clause
-            )
-        )
-    
-    return batches
-
-def sql_batch_generator(table_name, data, batch_size=500):
-    """通用批量SQL生成器"""
-
-    columns = ', '.join([f"`{col}`" for col in data.columns])
-    unique_keys = ['date_int', 'name']
-    update_clause = ', '.join(
-        [f"`{col}`=VALUES(`{col}`)" 
-         for col in data.columns if col not in unique_keys]
-    )
-
-    batches = []
-    for i in range(0, len(data), batch_size):
-        batch = data.iloc[i:i+batch_size]
-        value_rows = []
-
-        for row in batch.itertuples(index=False):
-            values = []
-            for item in row:
-                if pd.isna(item) or item in ['-', '']:
-                    values.append("NULL")
-                elif isinstance(item, (datetime.date, datetime.datetime)):
-                    values.append(f"'{item.strftime('%Y-%m-%d')}'")
-                elif isinstance(item, (int, float)):
-                    values.append(str(item))
-                else:
-                    cleaned = str(item).replace("'", "''").replace("\\", "\\\\")
-                    values.append(f"'{cleaned}'")
-            value_rows.append(f"({', '.join(values)})")
-
-        sql = f"""INSERT INTO `{table_name}` ({columns}) 
-               VALUES {','.join(value_rows)}
-               ON DUPLICATE KEY UPDATE {update_clause};"""
-        batches.append(sql)
-    
-    return batches
-
-def execute_batch_sql(sql_batches, max_retries=3):
-    """通用批量执行函数"""
-    for batch in sql_batches:
-        attempt = 0
-        while attempt < max_retries:
-            conn = None
-            try:
-                conn = DBManager.get_new_connection()
-                cursor = conn.cursor()
-                
-                # 执行单个批次
-                cursor.execute(batch)
-                
-                # 显式消费结果集
-                while True:
-                    if cursor.with_rows:
-                        cursor.fetchall()
-                    if not cursor.nextset():
-                        break
-                
-                conn.commit()
-                print(f"成功插入 {batch.count('VALUES')} 行数据")
-                break
-                
-            except Error as e:
-                attempt += 1
-                print(f"第{attempt}次重试失败: {e}")
-                if conn:
-                    conn.rollback()
-                time.sleep(2**attempt)  # 指数退避
-            finally:
-                if conn and conn.is_connected():
-                    cursor.close()
-                    conn.close()
-
-
-
-
-def execute_raw_sql(sql, conn=None, params=None):
-    """执行原始SQL（支持传入现有连接）"""
-    close_conn = False
-    if conn is None:
-        conn = DBManager.get_new_connection()
-        close_conn = True
-    if not conn:
-        return False
-
-    try:
-        cursor = conn.cursor(buffered=True)
-        if isinstance(sql, list):
-            sql = ';'.join(sql)  # 将列表元素拼接成字符串
-        statements = [s.strip() for s in sql.split(';') if s.strip()]
-        
-        for statement in statements:
-            cursor.execute(statement)
-            while True:
-                if cursor.with_rows:
-                    cursor.fetchall()
-                if not cursor.nextset():
-                    break
-        conn.commit()
-        return True
-    except Error as e:
-        print(f"执行失败: {e}")
-        conn.rollback()
-        return False
-    finally:
-        if close_conn and conn.is_connected():
-            cursor.close()
-            conn.close()
 
 
 def is_open(price):
@@ -1709,13 +1263,9 @@ def sync_and_write(table_name: str, data: pd.DataFrame):
         # 同步表结构
         同步表结构(conn, table_name, data.columns)
 
-        # 生成批量SQL列表
-        sql_batches = sql_batch_generator(table_name, data)  # 返回的是列表
-
-        # 逐条执行SQL
-        for sql in sql_batches:
-            if not execute_raw_sql(sql, conn):  # 传入现有连接
-                raise Exception(f"{table_name} 写入失败")
+        # 参数化批量写入
+        if not executemany_upsert(table_name, data, unique_keys=['date_int', 'name'], batch_size=500, conn=conn):
+            raise Exception(f"{table_name} 写入失败")
 
         # 启用索引
         enable_sql = f"ALTER TABLE `{table_name}` ENABLE KEYS;"
@@ -1764,9 +1314,8 @@ def sync_table_structure(table_name: str, data_columns: List[str]):
         with DBManager.get_new_connection() as conn:
             cursor = conn.cursor()
             
-            # 1. 创建表（如果不存在）
-            cursor.execute(f"SHOW TABLES LIKE '{table_name}'")
-            if not cursor.fetchone():
+            # 1. 创建表（如果不存在），已缓存字段的表不再查询
+            if not get_table_columns(table_name, conn):
                 # 基础表结构（date, code_int, code, name）
                 create_sql = f"""
                     CREATE TABLE `{table_name}` (
@@ -1928,14 +1477,15 @@ def main():
                 names = get_latest_codes(data_type)
                 print(f"开始处理 {data_type} 共 {len(names)} 个代码")
 
-                for batch_idx in range(0, len(names), batch_size):
-                    batch_names = names[batch_idx:batch_idx + batch_size]
-                    print(f"处理批次 {batch_idx//batch_size+1}，代码数：{len(batch_names)}")
+                # 1. 获取本批次历史数据，后台线程预读后续批次
+                batches = [(names[batch_idx:batch_idx + batch_size], data_type)
+                           for batch_idx in range(0, len(names), batch_size)]
+                for batch_no, ((batch_names, _), batch_data) in enumerate(
+                        prefetch(get_hist_data_batch, batches), 1):
+                    print(f"处理批次 {batch_no}，代码数：{len(batch_names)}")
 
-                    # 1. 获取本批次历史数据
-                    batch_data = get_hist_data_batch(batch_names, data_type)
                     if batch_data.empty:
-                        print(f"批次 {batch_idx//batch_size+1} 无数据，跳过")
+                        print(f"批次 {batch_no} 无数据，跳过")
                         continue
 
                     # 2. 批量获取最后处理日期（关键修改点）
@@ -1947,11 +1497,12 @@ def main():
                     )
 
                     # 3. 并行处理本批次代码
+                    name_frames = split_by_key(batch_data, 'name')
                     futures = []
                     for name in batch_names:
                         # 从批次数据中提取单个代码数据
-                        code_data = batch_data[batch_data['name'] == name].copy()
-                        if code_data.empty:
+                        code_data = name_frames.get(name)
+                        if code_data is None:
                             continue
                         # 提交任务时传入预取的最后处理日期
                         futures.append(executor.submit(
@@ -13,7 +13,7 @@ import logging
 from datetime import datetime, timedelta
 import pandas as pd
 import sqlalchemy
-from sqlalchemy import MetaData, Table, text
+from sqlalchemy import text
 from tqdm import tqdm
 from instock.lib.database import db_host, db_user, db_password, db_database, db_charset 
 import instock.lib.database as mdb
@@ -297,8 +297,7 @@ def optimized_data_insert(data):
     table_name = "industry_sentiment_a"
     try:
         with mdb.engine().connect() as conn:
-            metadata = MetaData()
-            table = Table(table_name, metadata, autoload_with=conn.engine)
+            table = mdb.reflect_table(table_name, conn.engine)
             
             # 调试：打印表结构
             # print("\n[DEBUG] 表结构字段：")
@@ -13,7 +13,7 @@ import logging
 from datetime import datetime, timedelta
 import pandas as pd
 import sqlalchemy
-from sqlalchemy import MetaData, Table, text
+from sqlalchemy import text
 from tqdm import tqdm
 from instock.lib.database import db_host, db_user, db_password, db_database, db_charset 
 import instock.lib.database as mdb
@@ -338,8 +338,7 @@ def optimized_data_insert(data):
             
             # 定义唯一键和需要更新的字段
             unique_keys = {'date_int'}
-            metadata = MetaData()
-            table = Table(table_name, metadata, autoload_with=conn.engine)
+            table = mdb.reflect_table(table_name, conn.engine)
             
             # 排除唯一键和自增主键，其他字段均更新
             update_columns = [col.name for col in table.columns 
@@ -17,14 +17,14 @@ import numpy as np
 import pandas as pd
 import time
 import datetime
-import mysql.connector
 import pandas_market_calendars as mcal
 from mysql.connector import Error
 from typing import List, Dict
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
+from instock.lib.database import DBManager
+import instock.lib.write_behind as wb
 
 
 # import pandas_ta as ta
@@ -142,56 +142,6 @@ def process_stock_data(stock_data):
 
 
 ########################################################################
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset,
-                use_pure=True  # 强制使用纯Python实现
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
-
-    @staticmethod
-    def query_sql(sql: str, params=None):
-        """执行查询SQL并返回DataFrame"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                # 直接使用SQL字符串查询，不使用参数化
-                return pd.read_sql_query(sql, connection)
-            except Error as e:
-                print(f"Error while querying SQL: {e}")
-                return pd.DataFrame()
-            finally:
-                if connection.is_connected():
-                    connection.close()
-        else:
-            return pd.DataFrame()
 
 
 def sql_batch_generator(table_name, data, batch_size=500):
@@ -236,7 +186,8 @@ def sql_batch_generator(table_name, data, batch_size=500):
 
 
 def execute_batch_sql(sql_batches, max_retries=3):
-    """通用批量执行函数"""
+    """通用批量执行函数，全部批次写入成功返回 True，有批次重试后仍失败返回 False"""
+    ok = True
     for batch in sql_batches:
         attempt = 0
         while attempt < max_retries:
@@ -269,6 +220,10 @@ def execute_batch_sql(sql_batches, max_retries=3):
                 if conn and conn.is_connected():
                     cursor.close()
                     conn.close()
+        if attempt >= max_retries:
+            print(f"批次重试{max_retries}次后仍失败，放弃写入")
+            ok = False
+    return ok
 
 
 def save_to_database(df):
@@ -294,8 +249,12 @@ def save_to_database(df):
     # 生成批量SQL
     sql_batches = sql_batch_generator('pattern_stock', filtered_df, 6000)
 
-    # 执行批量插入
-    execute_batch_sql(sql_batches)
+    # 各批次交给写库线程并行执行，等待全部完成；execute_batch_sql 返回 False 计为失败
+    for batch in sql_batches:
+        wb.submit(execute_batch_sql, [batch])
+    if not wb.flush():
+        print(f"部分批次写库失败，{len(filtered_df)} 条记录未全部保存")
+        return
 
     print(f"成功保存 {len(filtered_df)} 条记录到数据库")
 
@@ -12,18 +12,18 @@ sys.path.append(cpath)
 import json
 import re
 import math
-import requests
 import numpy as np
 import pandas as pd
 import time
 import datetime
-import mysql.connector
 import pandas_market_calendars as mcal
 from mysql.connector import Error
 from typing import List, Dict
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
+from instock.lib.database import DBManager
+import instock.lib.http_session as http_session
 
 
 ########################################################################
@@ -52,7 +52,7 @@ def fetch_sina_index_data():
     }
 
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        response = http_session.get(url, params=params, headers=headers, timeout=10)
         response.raise_for_status()
 
         # 处理新浪特殊JSON格式
@@ -187,7 +187,7 @@ def index_spot_df() -> pd.DataFrame:
     try:
         # 获取总页数
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = http_session.get(url, params=params, timeout=10)
             response.raise_for_status()
             data_json = response.json()
             total_count = data_json["data"]["total"]
@@ -207,7 +207,7 @@ def index_spot_df() -> pd.DataFrame:
                     params["pn"] = str(page)
                     params["_"] = str(int(time.time() * 1000))  # 更新时间戳防止缓存
 
-                    response = requests.get(url, params=params, timeout=10)
+                    response = http_session.get(url, params=params, timeout=10)
                     response.raise_for_status()
 
                     data_json = response.json()
@@ -327,44 +327,6 @@ def index_spot_df() -> pd.DataFrame:
 
 
 ########################################################################
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                # host=db_host,
-                # user=db_user,
-                # password=db_password,
-                # database=db_database,
-                # charset=db_charset
-                host="rm-uf6kkirh7qc88ug36fo.mysql.rds.aliyuncs.com",
-                user="aheng",
-                password="Admin888dashabi",
-                database="instockdb",
-                charset="utf8mb4",
-                use_pure=True  # 强制使用纯Python实现
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
 
 
 def sql_batch_generator(table_name, data, batch_size=500):
@@ -20,7 +20,6 @@ import pandas as pd
 import numpy as np
 # 替换 import talib as tl
 import ta
-import mysql.connector
 import datetime
 import threading
 from typing import Optional  # 新增导入
@@ -28,12 +27,14 @@ from typing import Optional  # 新增导入
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from typing import Dict, List, Tuple
 from mysql.connector import Error
-# from instock.lib.database import DBManager
 import sqlalchemy
 import time
 import psutil
 from functools import lru_cache
 from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
+from instock.lib.database import DBManager, executemany_upsert, get_engine, get_table_columns, add_missing_columns
+from instock.lib.frame_split import split_by_key
+from instock.core.indicator.incremental_indicator import finalize, load_state, state_path
 
 
 
@@ -159,6 +160,14 @@ INDICATOR_TABLES = {
 
 # 数据库连接配置
 MAX_HISTORY_WINDOW = 60  # 指标计算所需最大历史窗口
+USE_INTRADAY = True       # 交易时段内股票用日终指标状态 + 实时快照计算当日临时指标，不读历史表（每次调用刷新一次，频率由调度决定）
+# 盘中刷新的时段（与 trade_time.OPEN_TIME 相同）；trade_time 依赖交易日历单例，这里只需按时刻判断
+TRADE_SESSIONS = (
+    (datetime.time(9, 15, 0), datetime.time(11, 30, 0)),
+    (datetime.time(13, 0, 0), datetime.time(15, 0, 0)),
+)
+INTRADAY_COLUMNS = ('kdjk', 'kdjd', 'kdjj', 'rsi_6', 'rsi_12', 'rsi', 'rsi_24', 'cci',
+                    'boll_ub', 'boll', 'boll_lb', 'wr_6', 'obv')  # 盘中写库的指标列
 
 
 def get_latest_codes(data_type: str) -> List[str]:
@@ -320,42 +329,10 @@ def get_last_processed_dates_batch(table: str, codes: List[int]) -> Dict[int, st
 
 
 def sync_and_save(table_name: str, data: pd.DataFrame):
-    sql_txt = sql语句生成器(table_name, data)
-    execute_raw_sql(sql_txt)
-
-
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
+    # 预处理数据（如添加code_int）
+    if 'code' in data.columns and 'code_int' not in data.columns:
+        data.insert(0, 'code_int', data['code'].astype(int))
+    executemany_upsert(table_name, data, unique_keys=['date', 'code'])
 
 
 def create_table_if_not_exists(table_name):
@@ -440,108 +417,6 @@ def create_table_if_not_exists(table_name):
     create_index("idx_date_int", ["date_int"])
 
 
-
-
-
-
-def sql语句生成器(table_name, data):
-    # # 准备模板
-    # sql_template = """INSERT INTO `{table_name}` ({columns}) VALUES {values} ON DUPLICATE KEY UPDATE {update_clause};"""
-    # # 预处理列名和更新子句
-    # columns = ', '.join([f"`{col}`" for col in data.columns])
-    # update_clause = ', '.join([f"`{col}`=VALUES(`{col}`)" for col in data.columns if col not in ['date', 'code']])
-    # 准备模板
-    #
-    #
-    # 检查输入数据是否为空
-    if data.empty:
-        print("[WARNING] 输入数据为空，跳过SQL生成")
-        return ""
-
-    # 预处理数据（如添加code_int）
-    if 'code' in data.columns and 'code_int' not in data.columns:
-        data.insert(0, 'code_int', data['code'].astype(int))
-
-    sql_template = """INSERT INTO `{table_name}` ({columns})
-        VALUES {values}
-        ON DUPLICATE KEY UPDATE {update_clause};"""
-
-    # 预处理列名
-    columns = ', '.join([f"`{col}`" for col in data.columns])
-
-    # 指定唯一键列（这些字段用于比对数据库中的记录）
-    unique_keys = ['date', 'code']
-
-    # 更新子句：更新所有非唯一键的列
-    update_clause = ', '.join(
-        [f"`{col}`=VALUES(`{col}`)"
-         for col in data.columns
-         if col not in unique_keys]
-    )
-    # 批量处理值
-    value_rows = []
-    for row in data.itertuples(index=False):
-        values = []
-        for item in row:
-            if pd.isna(item) or item in ['-', '']:
-                values.append("NULL")
-            elif isinstance(item, (datetime.date, datetime.datetime)):
-                values.append(f"'{item.strftime('%Y-%m-%d')}'")
-            elif isinstance(item, (int, float, bool)):
-                values.append(str(item))
-            else:
-                # 使用三重引号避免嵌套冲突
-                cleaned_item = str(item).replace("'", "''")
-                values.append(f"'{cleaned_item}'")
-        value_rows.append(f"({', '.join(values)})")
-
-    # 批量生成SQL
-    sql_statements = [
-        sql_template.format(
-            table_name=table_name,
-            columns=columns,
-            values=values,
-            update_clause=update_clause
-        )
-        for values in value_rows
-    ]
-
-    # 连接所有语句
-    sql_txt = "\n".join(sql_statements)
-    return sql_txt
-
-
-def execute_raw_sql(sql, params=None, max_query_size=1024*1024, batch_size=5000):
-    """改进批量写入性能"""
-    if not sql.strip():
-        print("[WARNING] SQL语句为空，跳过执行")
-        return False
-
-    connection = DBManager.get_new_connection()
-    if not connection:
-        return False
-    try:
-        cursor = connection.cursor()
-        statements = [s.strip() for s in sql.split(';') if s.strip()]
-        if not statements:
-            print("[WARNING] 无有效SQL语句")
-            return False
-
-        for statement in statements:
-            cursor.execute(statement)
-        connection.commit()
-        return True
-    except Error as e:
-        print(f"数据库错误: {e}")
-        connection.rollback()
-        return False
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
-
-
-
 from itertools import islice
 
 def batch(iterable, batch_size=100):
@@ -579,9 +454,8 @@ def sync_table_structure(table_name: str, data_columns: List[str]):
         with DBManager.get_new_connection() as conn:
             cursor = conn.cursor()
 
-            # 1. 创建表（如果不存在）
-            cursor.execute(f"SHOW TABLES LIKE '{table_name}'")
-            if not cursor.fetchone():
+            # 1. 创建表（如果不存在），已缓存字段的表不再查询
+            if not get_table_columns(table_name, conn):
                 # 基础表结构（date, code_int, code, name）
                 create_sql = f"""
                     CREATE TABLE `{table_name}` (
@@ -599,22 +473,14 @@ def sync_table_structure(table_name: str, data_columns: List[str]):
                 cursor.execute(create_sql)
                 print(f"创建基础表 {table_name}")
 
-            # 2. 动态添加指标字段
-            cursor.execute(f"""
-                SELECT COLUMN_NAME
-                FROM INFORMATION_SCHEMA.COLUMNS
-                WHERE TABLE_NAME = '{table_name}'
-                  AND TABLE_SCHEMA = DATABASE()
-            """)
-            existing_columns = {row[0] for row in cursor.fetchall()}
-
-            # 3. 遍历指标字段，添加缺失列
-            for col in data_columns:
-                if col not in existing_columns and col not in ['id', 'date','date_int', 'code_int', 'code', 'name']:
-                    # 自动推断字段类型（假设均为FLOAT）
-                    alter_sql = f"ALTER TABLE `{table_name}` ADD COLUMN `{col}` FLOAT;"
-                    cursor.execute(alter_sql)
-                    print(f"动态添加字段 {col} 到表 {table_name}")
+            # 2. 动态添加指标字段（自动推断字段类型，假设均为FLOAT），缺失字段一次性添加
+            existing_columns = get_table_columns(table_name, conn)
+            missing_columns = {col: 'FLOAT' for col in data_columns
+                               if col not in existing_columns and col not in ['id', 'date','date_int', 'code_int', 'code', 'name']}
+            if missing_columns:
+                if add_missing_columns(table_name, missing_columns, conn) is None:
+                    raise Exception("添加字段失败")
+                print(f"动态添加字段 {list(missing_columns)} 到表 {table_name}")
             conn.commit()
     except Exception as e:
         print(f"同步表 {table_name} 结构失败：{str(e)}")
@@ -801,8 +667,9 @@ def process_batch(batch_codes: List[int], data_type: str) -> pd.DataFrame:
     last_dates_map = get_last_processed_dates_batch(table_name, unique_codes)
 
     results = []
+    code_frames = split_by_key(indicators, 'code_int')
     for code in unique_codes:
-        code_indicators = indicators[indicators['code_int'] == code]
+        code_indicators = code_frames[code]
         last_date = last_dates_map.get(code, None)
         if last_date:
             # 只保留大于最后日期的数据
@@ -904,7 +771,7 @@ def sync_and_save(table_name: str, data: pd.DataFrame):
 
     try:
         # 使用SQLAlchemy进行批量插入
-        engine = sqlalchemy.create_engine(
+        engine = get_engine(
             f"mysql+mysqlconnector://{db_user}:{db_password}@{db_host}/{db_database}?charset={db_charset}"
         )
 
@@ -923,9 +790,108 @@ def sync_and_save(table_name: str, data: pd.DataFrame):
         print(f"成功保存 {len(data)} 条记录到 {table_name}")
     except Exception as e:
         print(f"保存数据失败: {str(e)}")
-        # 回退到原始方法
-        sql_txt = sql语句生成器(table_name, data)
-        execute_raw_sql(sql_txt)
+        # 回退到参数化批量写入
+        # 预处理数据（如添加code_int）
+        if 'code' in data.columns and 'code_int' not in data.columns:
+            data.insert(0, 'code_int', data['code'].astype(int))
+        executemany_upsert(table_name, data, unique_keys=['date', 'code'])
+
+
+# 盘中模式：日终作业（indicators_data_daily）保存的指标状态只读一次并常驻内存，
+# 每次把实时快照当作当日的临时K线，在状态副本上推进一步，状态本身不变，不再读历史表。
+def load_intraday_state(data_type: str = 'stock'):
+    """读取日终指标状态，返回 {'rows': {code_int: 状态行号}, 'last_date': 各行最后K线日期, 'engine': 引擎}，没有状态时返回 None"""
+    loaded = load_state(state_path(data_type))
+    if loaded is None:
+        return None
+    codes, last_dates, _, engine = loaded
+    return {
+        'rows': {int(code): i for i, code in enumerate(codes)},
+        'last_date': np.asarray(last_dates, dtype=np.int64),
+        'engine': engine,
+    }
+
+
+def get_realtime_snapshot() -> pd.DataFrame:
+    """最新一期实时行情：以 realtime_stock_df 为准，缺失的代码用 realtime_stock_sina 补齐"""
+    frames = []
+    for table in ('realtime_stock_df', 'realtime_stock_sina'):
+        sql = f"""
+            SELECT date, date_int, code, code_int, name,
+                   `开盘价` AS open, `最高价` AS high, `最低价` AS low, `收盘价` AS close, `成交量(手)` AS volume
+            FROM `{table}`
+            WHERE date_int = (SELECT MAX(date_int) FROM `{table}`)
+        """
+        df = DBManager.query_sql(sql)
+        if df is not None and not df.empty:
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame()
+    snapshot = pd.concat(frames, ignore_index=True)
+    # 两个来源日期不一致时只用较新的一期，停牌或未开盘（价格为 0）的代码不参与
+    snapshot = snapshot[snapshot['date_int'] == snapshot['date_int'].max()]
+    snapshot = snapshot[(snapshot['close'] > 0) & (snapshot['high'] > 0) & (snapshot['low'] > 0)]
+    return snapshot.drop_duplicates('code_int', keep='first')
+
+
+def calculate_intraday(state, snapshot: pd.DataFrame) -> pd.DataFrame:
+    """把快照作为当日临时K线，在状态副本上推进一步，返回各代码当日的临时指标行"""
+    if snapshot.empty:
+        return pd.DataFrame()
+    rows = snapshot['code_int'].astype(int).map(state['rows'])
+    snapshot = snapshot[rows.notna().to_numpy()]
+    rows = rows.dropna().to_numpy(dtype=np.int64)
+    # 状态已含当日K线（收盘后日终作业已运行）的代码不再叠加
+    fresh = snapshot['date_int'].to_numpy(dtype=np.int64) > state['last_date'][rows]
+    snapshot, rows = snapshot[fresh], rows[fresh]
+    if snapshot.empty:
+        return pd.DataFrame()
+
+    engine = state['engine'].select(rows)
+    values = engine.step(*(snapshot[col].to_numpy(dtype=np.float64)
+                           for col in ('open', 'high', 'low', 'close', 'volume')),
+                         np.ones(len(rows), dtype=bool))
+    result = pd.DataFrame({
+        'date': snapshot['date'].to_numpy(),
+        'code': snapshot['code'].to_numpy(),
+        'date_int': snapshot['date_int'].astype(str).to_numpy(),
+        'code_int': snapshot['code_int'].to_numpy(),
+        'name': snapshot['name'].to_numpy(),
+        'close': snapshot['close'].to_numpy(),
+    })
+    for name in INTRADAY_COLUMNS:
+        result[name] = finalize(values[name])
+    return result
+
+
+def is_trade_session(now_time: datetime.datetime) -> bool:
+    now = now_time.time()
+    return any(begin <= now < end for begin, end in TRADE_SESSIONS)
+
+
+def run_intraday(data_type: str = 'stock') -> Optional[int]:
+    """
+    用最新实时快照刷新一次当日临时指标并返回写入条数；没有指标状态、计算或写库失败时返回 None（改为读取历史数据计算）。
+    只刷新一次：快照由 realtime_stock 写入，刷新频率由调度（先运行 realtime_stock 再运行本作业）决定。
+    """
+    state = load_intraday_state(data_type)
+    if state is None:
+        print(f"⚠️ 未找到{data_type}指标状态，改为读取历史数据计算")
+        return None
+
+    try:
+        result = calculate_intraday(state, get_realtime_snapshot())
+        if result.empty:
+            print("⚠️ 没有比指标状态更新的实时快照，盘中指标未刷新")
+            return 0
+        if not executemany_upsert(INDICATOR_TABLES[data_type], result, unique_keys=['date', 'code']):
+            print("盘中指标写库失败，改为读取历史数据计算")
+            return None
+    except Exception as e:
+        print(f"盘中指标刷新失败，改为读取历史数据计算: {str(e)}")
+        return None
+    print(f"盘中指标已刷新 {len(result)} 条 | {datetime.datetime.now().strftime('%H:%M:%S')}")
+    return len(result)
 
 
 # 优化6: 内存监控与优化
@@ -950,6 +916,12 @@ def main():
                 print("内存不足，终止处理")
                 break
 
+            if USE_INTRADAY and data_type == 'stock' and is_trade_session(datetime.datetime.now()):
+                processed = run_intraday(data_type)
+                if processed is not None:
+                    total_processed += processed
+                    continue
+
             processed = process_data_type(data_type)
             total_processed += processed
     finally:
@@ -1,9 +1,17 @@
-import requests
+# 在项目运行时，临时将项目路径添加到环境变量
+import os.path
+import sys
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
+
 import pandas as pd
 import datetime
 import time
 from tqdm import tqdm  # 进度条工具
 import json
+from instock.lib.rate_control import EmptyPayload, get_controller
+import instock.lib.http_session as http_session
 
 
 # ================ 行业数据获取函数 ================
@@ -18,12 +26,13 @@ def fetch_tencent_industry_data(board_type='hy', offset=0, count=200):
         "count": count
     }
     try:
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
+        with get_controller(url).pace():
+            response = http_session.get(url, params=params, timeout=10)
+            response.raise_for_status()
             data = response.json()
-            if data['code'] == 0:
-                return data['data']['rank_list'], data['data']['total']
-        return [], 0
+            if data['code'] != 0:
+                raise EmptyPayload(f"code={data['code']}")
+        return data['data']['rank_list'], data['data']['total']
     except Exception as e:
         print(f"请求失败: {e}")
         return [], 0
@@ -39,9 +48,6 @@ def get_tencent_all_industries(board_type='hy'):
     first_page_data, total = fetch_tencent_industry_data(board_type=board_type, offset=0, count=count)
     all_industries.extend(first_page_data)
 
-    # 添加请求间隔
-    request_interval = 0.5  # 每次请求间隔0.5秒
-
     # 处理分页
     if total > count:
         total_pages = (total + count - 1) // count
@@ -50,9 +56,6 @@ def get_tencent_all_industries(board_type='hy'):
             page_data, _ = fetch_tencent_industry_data(board_type=board_type, offset=offset, count=count)
             all_industries.extend(page_data)
 
-            # 添加请求间隔
-            time.sleep(request_interval)
-
     # 创建DataFrame
     temp_df = pd.DataFrame(all_industries)
 
@@ -154,7 +157,10 @@ def get_industry_stocks(industry_id, industry_name="", sort_type=1, max_count=50
             }
 
             try:
-                response = requests.get(url, params=params, timeout=15)
+                with get_controller(url).pace():
+                    response = http_session.get(url, params=params, timeout=15)
+                    if response.status_code in (403, 429):
+                        response.raise_for_status()
                 if response.status_code == 200:
                     data = response.json()
 
@@ -188,9 +194,6 @@ def get_industry_stocks(industry_id, industry_name="", sort_type=1, max_count=50
                 print(f"请求异常: {e}")
                 break
 
-            # 请求间隔防止被封
-            time.sleep(0.3)
-
     # 创建DataFrame
     if not all_stocks:
         print("未获取到股票数据")
@@ -11,19 +11,19 @@ sys.path.append(cpath)
 import json
 import re
 import math
-import requests
 import numpy as np
 import pandas as pd
 import time
 import datetime 
-import mysql.connector
 import pandas_market_calendars as mcal
 from mysql.connector import Error
 from typing import List, Dict
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset 
+from instock.lib.database import DBManager, get_table_columns, add_missing_columns
+from instock.lib.rate_control import get_controller
+import instock.lib.http_session as http_session
 
 
 numeric_cols = ["f2", "f3", "f4", "f5", "f6", "f7", "f8", "f10", "f15", "f16", "f17", "f18", "f22", "f11", "f24", "f25", "f9", "f115", "f114", "f23", "f112", "f113", "f61", "f48", "f37", "f49", "f57", "f40", "f41", "f45", "f46", "f38", "f39", "f20", "f21" ]
@@ -55,8 +55,9 @@ def fetch_sina_stock_data(page):
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
+        with get_controller(url).pace():
+            response = http_session.get(url, headers=headers, timeout=10)
+            response.raise_for_status()
 
         # 新浪返回的是JSONP格式，实际是JSON字符串
         data_str = response.text.strip()
@@ -91,9 +92,6 @@ def stock_hs_a_spot_sina():
         print(f"获取到第{page}页数据，共{len(stock_data)}条记录")
         all_stocks.extend(stock_data)
 
-        # 添加延迟避免被封IP
-        time.sleep(1.5)
-
     print("所有数据获取完成！")
     print(f"总共获取到 {len(all_stocks)} 条股票数据")
 
@@ -198,8 +196,9 @@ def fetch_sina_index_data(page):
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
+        with get_controller(url).pace():
+            response = http_session.get(url, headers=headers, timeout=10)
+            response.raise_for_status()
 
         # 新浪返回的是JSONP格式，实际是JSON字符串
         data_str = response.text.strip()
@@ -234,9 +233,6 @@ def index_dpzs_spot_sina():
         print(f"获取到第{page}页数据，共{len(stock_data)}条记录")
         all_stocks.extend(stock_data)
 
-        # 添加延迟避免被封IP
-        time.sleep(1.5)
-
     print("所有数据获取完成！")
     print(f"总共获取到 {len(all_stocks)} 条指数数据")
 
@@ -345,7 +341,7 @@ def fetch_tencent_stock_data(offset=0, count=200):
         "count": count
     }
     try:
-        response = requests.get(url, params=params)
+        response = http_session.get(url, params=params)
         if response.status_code == 200:
             data = response.json()
             if data['code'] == 0:
@@ -639,7 +635,7 @@ def fetch_zh_a_spot_data(
         page_param_name: start_page  # 起始页码
     }
     try:
-        r = requests.get(url, params=first_page_params)
+        r = http_session.get(url, params=first_page_params)
         r.raise_for_status()
         data_json = r.json()
         data_count = data_json["data"]["total"]
@@ -659,7 +655,7 @@ def fetch_zh_a_spot_data(
             page_param_name: page   # 正确设置页码参数
         }
         try:
-            r = requests.get(url, params=page_params, headers=HEADERS)
+            r = http_session.get(url, params=page_params, headers=HEADERS)
             r.raise_for_status()
             return r.json()["data"]["diff"]
         except Exception as e:
@@ -691,9 +687,8 @@ def sync_table_structure(table_name: str, data_columns: List[str]):
         with DBManager.get_new_connection() as conn:
             cursor = conn.cursor()
 
-            # 检查表是否存在
-            cursor.execute(f"SHOW TABLES LIKE '{table_name}'")
-            if cursor.fetchone():
+            # 检查表是否存在（字段已缓存的表不再查询）
+            if get_table_columns(table_name, conn):
                 print(f"表 {table_name} 已存在，跳过创建")
                 return
 
@@ -716,13 +711,13 @@ def sync_table_structure(table_name: str, data_columns: List[str]):
             cursor.execute(create_sql)
             print(f"成功创建表 {table_name}")
 
-            # 添加额外字段
+            # 添加额外字段（一条 ALTER TABLE 一次性添加）
             base_columns = {'id', 'date', 'date_int', 'code_int', 'code', 'name'}
-            for col in data_columns:
-                if col not in base_columns:
-                    alter_sql = f"ALTER TABLE `{table_name}` ADD COLUMN `{col}` FLOAT;"
-                    cursor.execute(alter_sql)
-                    print(f"添加字段 {col} 到表 {table_name}")
+            extra_columns = {col: 'FLOAT' for col in data_columns if col not in base_columns}
+            if extra_columns:
+                if add_missing_columns(table_name, extra_columns, conn) is None:
+                    raise Exception("添加字段失败")
+                print(f"添加字段 {list(extra_columns)} 到表 {table_name}")
 
             conn.commit()
             print(f"表 {table_name} 结构创建完成")
@@ -732,40 +727,6 @@ def sync_table_structure(table_name: str, data_columns: List[str]):
         sys.exit(1)
 
 
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
-
-
 def sql_batch_generator(table_name, data, batch_size=500):
     """通用批量SQL生成器"""
     if 'code' in data.columns and 'code_int' not in data.columns:
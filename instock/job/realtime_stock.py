@@ -9,21 +9,19 @@ cpath_current = os.path.dirname(os.path.dirname(__file__))
 cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
 sys.path.append(cpath)
 
+import asyncio
 import json
 import re
 import math
-import requests
 import numpy as np
 import pandas as pd
 import time
-import datetime
-import mysql.connector
 import pandas_market_calendars as mcal
-from mysql.connector import Error
 from typing import List, Dict
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
-from tqdm import tqdm
+from instock.lib.database import load_data_upsert, executemany_upsert
+from instock.lib.async_crawler import crawl
+from instock.lib.rate_control import EmptyPayload
 
 
 
@@ -34,55 +32,45 @@ from tqdm import tqdm
 # 接口：https://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/Market_Center.getHQNodeData?page=55&num=100&sort=symbol&asc=0&node=hs_a&symbol=
 # hs_a，沪深A股，最多55页（包含北京）
 
-def fetch_sina_stock_data(page):
-    """从新浪接口获取股票数据"""
-    url = f"https://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/Market_Center.getHQNodeData?page={page}&num=100&sort=symbol&asc=0&node=hs_a"
+SINA_URL = "https://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/Market_Center.getHQNodeData"
+SINA_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': 'https://vip.stock.finance.sina.com.cn/mkt/'
+}
+SINA_PAGES = 55  # 沪深A股总页数
 
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Referer': 'https://vip.stock.finance.sina.com.cn/mkt/'
-    }
 
+def parse_sina_page(response):
+    """解析新浪一页股票数据"""
+    # 新浪返回的是JSONP格式，实际是JSON字符串
+    data_str = response.text.strip()
+
+    # 处理特殊JSON格式（无引号的key）
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
+        # 尝试直接解析
+        return json.loads(data_str)
+    except json.JSONDecodeError:
+        # 修复非法JSON：给key加双引号
+        fixed_json = re.sub(r'(\w+):', r'"\1":', data_str)
+        return json.loads(fixed_json)
 
-        # 新浪返回的是JSONP格式，实际是JSON字符串
-        data_str = response.text.strip()
 
-        # 处理特殊JSON格式（无引号的key）
-        try:
-            # 尝试直接解析
-            return json.loads(data_str)
-        except json.JSONDecodeError:
-            # 修复非法JSON：给key加双引号
-            fixed_json = re.sub(r'(\w+):', r'"\1":', data_str)
-            return json.loads(fixed_json)
-
-    except Exception as e:
-        print(f"第{page}页请求失败: {str(e)}")
-        return None
+async def fetch_sina_stocks(crawler):
+    """并发获取新浪全部分页，返回股票记录列表"""
+    params_list = [{"page": page, "num": 100, "sort": "symbol", "asc": 0, "node": "hs_a"}
+                   for page in range(1, SINA_PAGES + 1)]
+    pages = await crawler.fetch_all(SINA_URL, params_list, headers=SINA_HEADERS, parse=parse_sina_page,
+                                    desc="获取新浪股票数据")
+    return [stock for page in pages if page for stock in page]
 
 
-def stock_hs_a_spot_sina():
-    """从新浪接口获取所有股票实时数据"""
+def stock_hs_a_spot_sina(all_stocks=None):
+    """从新浪接口获取所有股票实时数据；all_stocks 为已抓取的记录时只做处理和写库"""
     print("开始获取新浪实时股票数据...")
     start_time = time.time()
 
-    total_pages = 55  # 沪深A股总页数
-    all_stocks = []  # 存储所有股票数据
-
-    # 使用tqdm显示进度条
-    with tqdm(total=total_pages, desc="获取新浪股票数据") as pbar:
-        for page in range(1, total_pages + 1):
-            stock_data = fetch_sina_stock_data(page)
-            if stock_data:
-                all_stocks.extend(stock_data)
-                pbar.set_postfix({"当前页": page, "总记录": len(all_stocks)})
-
-            # 更新进度条
-            pbar.update(1)
-            time.sleep(0.5)  # 添加延迟避免被封IP
+    if all_stocks is None:
+        all_stocks = crawl(fetch_sina_stocks)
 
     # 转换为DataFrame
     if not all_stocks:
@@ -144,15 +132,9 @@ def stock_hs_a_spot_sina():
 
     # print(realtime_stock_sina.head())
 
-    # 生成批量SQL
-    sql_batches = sql_batch_generator(
-        table_name='realtime_stock_sina',
-        data=realtime_stock_sina,
-        batch_size=6000  # 根据实际情况调整
-    )
-
-    # 执行批量插入
-    execute_batch_sql(sql_batches)
+    # LOAD DATA 批量写入，失败时回退到参数化批量写入
+    if not load_data_upsert('realtime_stock_sina', realtime_stock_sina, unique_keys=['date_int', 'code_int']):
+        executemany_upsert('realtime_stock_sina', realtime_stock_sina, unique_keys=['date_int', 'code_int'])
     print(f"[Success] 新浪股票实时数据写入完成，数据量：{len(realtime_stock_sina)}，耗时 {time.time() - start_time:.2f}秒")
     return realtime_stock_sina
 
@@ -163,10 +145,12 @@ def stock_hs_a_spot_sina():
 # https://proxy.finance.qq.com/cgi/cgi-bin/rank/hs/getBoardRankList?_appver=11.17.0&board_code=aStock&sort_type=price&direct=down&offset=0&count=200
 # （来源网址：https://stockapp.finance.qq.com/mstats/#mod=list&id=hs_hsj&module=hs&type=hsj）
 
-def fetch_tencent_stock_data(offset=0, count=200):
-    """获取单页股票数据"""
-    url = "https://proxy.finance.qq.com/cgi/cgi-bin/rank/hs/getBoardRankList"
-    params = {
+TENCENT_URL = "https://proxy.finance.qq.com/cgi/cgi-bin/rank/hs/getBoardRankList"
+TENCENT_PAGE_SIZE = 200  # 每页固定200条
+
+
+def tencent_params(offset=0, count=TENCENT_PAGE_SIZE):
+    return {
         "_appver": "11.17.0",
         "board_code": "aStock",
         "sort_type": "price",
@@ -174,38 +158,37 @@ def fetch_tencent_stock_data(offset=0, count=200):
         "offset": offset,
         "count": count
     }
-    try:
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            if data['code'] == 0:
-                return data['data']['rank_list'], data['data']['total']
-        return [], 0
-    except Exception as e:
-        print(f"请求失败: {e}")
-        return [], 0
 
 
-def get_tencent_all_stocks():
-    """从新浪接口获取所有股票实时数据"""
-    print("开始获取腾讯实时股票数据...")
-    start_time = time.time()
+def parse_tencent_page(response):
+    """解析腾讯一页股票数据，返回 (股票记录列表, 总数)"""
+    data = response.json()
+    if data['code'] != 0:
+        raise EmptyPayload(f"code={data['code']}")
+    return data['data']['rank_list'], data['data']['total']
+
 
-    """获取所有股票数据"""
-    all_stocks = []
-    count = 200  # 每页固定200条
-    first_page_data, total = fetch_tencent_stock_data(offset=0, count=count)
-    all_stocks.extend(first_page_data)
+async def fetch_tencent_stocks(crawler):
+    """先取第一页得到总数，再并发获取其余分页，返回股票记录列表"""
+    first = await crawler.fetch(TENCENT_URL, params=tencent_params(), parse=parse_tencent_page)
+    if first is None:
+        return []
+    all_stocks, total = first
+    params_list = [tencent_params(offset=offset) for offset in range(TENCENT_PAGE_SIZE, total, TENCENT_PAGE_SIZE)]
+    pages = await crawler.fetch_all(TENCENT_URL, params_list, parse=parse_tencent_page, desc="获取腾讯股票数据")
+    for page in pages:
+        if page:
+            all_stocks.extend(page[0])
+    return all_stocks
 
-    if total > count:
-        total_pages = (total + count - 1) // count  # 计算总页数
-        for page in tqdm(range(1, total_pages), desc="获取腾讯股票数据"):
-            offset = page * count
-            page_data, _ = fetch_tencent_stock_data(offset=offset, count=count)
-            all_stocks.extend(page_data)
 
-            # 在每次请求后添加延时
-            time.sleep(0.5)  # 添加延时避免被封IP
+def get_tencent_all_stocks(all_stocks=None):
+    """从腾讯接口获取所有股票实时数据；all_stocks 为已抓取的记录时只做处理和写库"""
+    print("开始获取腾讯实时股票数据...")
+    start_time = time.time()
+
+    if all_stocks is None:
+        all_stocks = crawl(fetch_tencent_stocks)
 
     # 转换为DataFrame
     if not all_stocks:
@@ -274,15 +257,9 @@ def get_tencent_all_stocks():
 
     # print(realtime_stock_tx.head())
 
-    # 生成批量SQL
-    sql_batches = sql_batch_generator(
-        table_name='realtime_stock_tx',
-        data=realtime_stock_tx,
-        batch_size=6000  # 根据实际情况调整
-    )
-
-    # 执行批量插入
-    execute_batch_sql(sql_batches)
+    # LOAD DATA 批量写入，失败时回退到参数化批量写入
+    if not load_data_upsert('realtime_stock_tx', realtime_stock_tx, unique_keys=['date_int', 'code_int']):
+        executemany_upsert('realtime_stock_tx', realtime_stock_tx, unique_keys=['date_int', 'code_int'])
     print(f"[Success] 腾讯股票实时数据写入完成，数据量：{len(realtime_stock_tx)}，耗时 {time.time() - start_time:.2f}秒")
 
     return realtime_stock_tx
@@ -292,22 +269,14 @@ def get_tencent_all_stocks():
 
 # 获取沪市A股+深市A股实时股票数据数据并写入数据库
 
-def stock_zh_a_spot_em() -> pd.DataFrame:
-    '''
-    东方财富网-沪深京 A 股-实时行情
-    https://quote.eastmoney.com/center/gridlist.html#hs_a_board
-    :return: 实时行情
-    :rtype: pandas.DataFrame
-    '''
-    start_time = time.time()
-    print("开始获取东方财富实时股票数据...")
+EM_URL = "http://82.push2.eastmoney.com/api/qt/clist/get"
+EM_PAGE_SIZE = 100
+
 
-    page_size = 100
-    url = "http://82.push2.eastmoney.com/api/qt/clist/get"
-    # 初始请求参数，先获取总数据量和 page_size
-    params = {
-        "pn": "1",
-        "pz": str(page_size),
+def em_params(page):
+    return {
+        "pn": str(page),
+        "pz": str(EM_PAGE_SIZE),
         "po": "1",
         "np": "1",
         "ut": "bd1d9ddb04089700cf9c27f6f7426281",
@@ -316,47 +285,49 @@ def stock_zh_a_spot_em() -> pd.DataFrame:
         "fid": "f3",
         "fs": "m:0 t:6,m:0 t:80,m:1 t:2,m:1 t:23,m:0 t:81 s:2048",
         "fields": "f2,f3,f4,f5,f6,f7,f8,f9,f10,f11,f12,f13,f14,f15,f16,f17,f18,f20,f21,f22,f23,f24,f25,f26,f37,f38,f39,f40,f41,f45,f46,f48,f49,f57,f61,f100,f112,f113,f114,f115,f221",
-        "_": str(int(time.time() * 1000)),
+        "_": str(int(time.time() * 1000)),  # 时间戳防止缓存
     }
 
-    try:
-        # 获取总页数
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data_json = response.json()
-            total_count = data_json["data"]["total"]
-            page_total = math.ceil(total_count / page_size)
-            print(f"总数据量: {total_count}, 总页数: {page_total}")
-        except Exception as e:
-            print(f"获取总页数失败: {str(e)}")
-            return pd.DataFrame()
-
-        all_data = []
 
-        # 使用tqdm显示进度条
-        with tqdm(total=page_total, desc="获取东方财富股票数据") as pbar:
-            for page in range(1, page_total + 1):
-                try:
-                    # 更新页码参数
-                    params["pn"] = str(page)
-                    params["_"] = str(int(time.time() * 1000))  # 更新时间戳防止缓存
-
-                    response = requests.get(url, params=params,  timeout=10)
-                    response.raise_for_status()
-
-                    data_json = response.json()
-                    page_data = data_json["data"]["diff"]
-                    all_data.extend(page_data)
-
-                    pbar.set_postfix({"当前页": page, "总记录": len(all_data)})
-                    pbar.update(1)
-
-                except Exception as e:
-                    print(f"第{page}页请求失败: {str(e)}")
+def parse_em_page(response):
+    """解析东方财富一页股票数据，返回 (股票记录列表, 总数)"""
+    data = response.json()["data"]
+    if not data:
+        raise EmptyPayload("data 为空")
+    return data["diff"], data["total"]
+
+
+async def fetch_em_stocks(crawler):
+    """先取第一页得到总数，再并发获取其余分页，返回股票记录列表"""
+    first = await crawler.fetch(EM_URL, params=em_params(1), parse=parse_em_page)
+    if first is None:
+        print("获取总页数失败")
+        return []
+    all_data, total_count = first
+    page_total = math.ceil(total_count / EM_PAGE_SIZE)
+    print(f"总数据量: {total_count}, 总页数: {page_total}")
+    pages = await crawler.fetch_all(EM_URL, [em_params(page) for page in range(2, page_total + 1)],
+                                    parse=parse_em_page, desc="获取东方财富股票数据")
+    for page in pages:
+        if page:
+            all_data.extend(page[0])
+    return all_data
+
+
+def stock_zh_a_spot_em(all_data=None) -> pd.DataFrame:
+    '''
+    东方财富网-沪深京 A 股-实时行情
+    https://quote.eastmoney.com/center/gridlist.html#hs_a_board
+    :param all_data: 已抓取的记录，为空时先抓取
+    :return: 实时行情
+    :rtype: pandas.DataFrame
+    '''
+    start_time = time.time()
+    print("开始获取东方财富实时股票数据...")
 
-                # 添加请求间隔，避免被封IP
-                time.sleep(1)
+    try:
+        if all_data is None:
+            all_data = crawl(fetch_em_stocks)
 
         if not all_data:
             print("未获取到任何数据")
@@ -448,15 +419,9 @@ def stock_zh_a_spot_em() -> pd.DataFrame:
 
         # print(realtime_stock_df.head())
 
-        # 生成批量SQL
-        sql_batches = sql_batch_generator(
-            table_name='realtime_stock_df',
-            data=realtime_stock_df,
-            batch_size=6000  # 根据实际情况调整
-        )
-
-        # 执行批量插入
-        execute_batch_sql(sql_batches)
+        # LOAD DATA 批量写入，失败时回退到参数化批量写入
+        if not load_data_upsert('realtime_stock_df', realtime_stock_df, unique_keys=['date_int', 'code_int']):
+            executemany_upsert('realtime_stock_df', realtime_stock_df, unique_keys=['date_int', 'code_int'])
         print(
             f"[Success] 东方财富股票实时数据写入完成，数据量：{len(realtime_stock_df)}，耗时 {time.time() - start_time:.2f}秒")
 
@@ -467,133 +432,24 @@ def stock_zh_a_spot_em() -> pd.DataFrame:
 
 
 ########################################################################
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                # host=db_host,
-                # user=db_user,
-                # password=db_password,
-                # database=db_database,
-                # charset=db_charset,
-                host="rm-uf6kkirh7qc88ug36fo.mysql.rds.aliyuncs.com",
-                user="aheng",
-                password="Admin888dashabi",
-                database="instockdb",
-                charset="utf8mb4",
-                use_pure=True  # 强制使用纯Python实现
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
-
-
-def sql_batch_generator(table_name, data, batch_size=500):
-    columns = ', '.join([f"`{col}`" for col in data.columns])
-    unique_keys = ['date_int', 'code_int']
-    update_clause = ', '.join(
-        [f"`{col}`=VALUES(`{col}`)"
-         for col in data.columns if col not in unique_keys]
-    )
-
-    batches = []
-    for i in range(0, len(data), batch_size):
-        batch = data.iloc[i:i + batch_size]
-        value_rows = []
-
-        for row in batch.itertuples(index=False):
-            values = []
-            for item in row:
-                if pd.isna(item) or item in ['-', '']:
-                    values.append("NULL")
-                elif isinstance(item, (datetime.date, datetime.datetime)):
-                    values.append(f"'{item.strftime('%Y-%m-%d')}'")
-                elif isinstance(item, (int, float)):
-                    values.append(str(item))
-                else:
-                    cleaned = str(item).replace("'", "''").replace("\\", "\\\\")
-                    values.append(f"'{cleaned}'")
-            value_rows.append(f"({', '.join(values)})")
-
-        sql = f"""INSERT INTO `{table_name}` ({columns}) 
-               VALUES {','.join(value_rows)}
-               ON DUPLICATE KEY UPDATE {update_clause};"""
-        batches.append(sql)
-
-    return batches
-
-
-def execute_batch_sql(sql_batches, max_retries=3):
-    """通用批量执行函数"""
-    for batch in sql_batches:
-        attempt = 0
-        while attempt < max_retries:
-            conn = None
-            try:
-                conn = DBManager.get_new_connection()
-                cursor = conn.cursor()
-
-                # 执行单个批次
-                cursor.execute(batch)
-
-                # 显式消费结果集
-                while True:
-                    if cursor.with_rows:
-                        cursor.fetchall()
-                    if not cursor.nextset():
-                        break
-
-                conn.commit()
-                print(f"成功插入 {batch.count('VALUES')} 行数据")
-                break
-
-            except Error as e:
-                attempt += 1
-                print(f"第{attempt}次重试失败: {e}")
-                if conn:
-                    conn.rollback()
-                time.sleep(2 ** attempt)  # 指数退避
-            finally:
-                if conn and conn.is_connected():
-                    cursor.close()
-                    conn.close()
 
 
 def main():
-    # 创建进程池（最多3个进程）
-    with ProcessPoolExecutor(max_workers=3) as executor:
-        # 提交三个任务到进程池
-        futures = [
-            executor.submit(stock_zh_a_spot_em),
-            executor.submit(stock_hs_a_spot_sina),
-            executor.submit(get_tencent_all_stocks)
-        ]
-
-        # 等待所有任务完成（可选添加进度条）
-        for future in tqdm(as_completed(futures), total=len(futures), desc="执行数据获取任务"):
-            try:
-                future.result()  # 获取结果（如有异常会在此抛出）
-            except Exception as e:
-                print(f"任务执行出错: {str(e)}")
+    # 三个数据源的分页在同一个事件循环中并发抓取（各站点分别限速），再逐个处理写库；
+    # 某个数据源抓取时抛出异常只作废该数据源（按空数据处理），不影响其它两个
+    async def fetch_all_sources(crawler):
+        return await asyncio.gather(fetch_em_stocks(crawler), fetch_sina_stocks(crawler),
+                                    fetch_tencent_stocks(crawler), return_exceptions=True)
+
+    results = crawl(fetch_all_sources)
+    for func, stocks in zip((stock_zh_a_spot_em, stock_hs_a_spot_sina, get_tencent_all_stocks), results):
+        if isinstance(stocks, Exception):
+            print(f"{func.__name__} 抓取出错: {str(stocks)}")
+            stocks = []
+        try:
+            func(stocks)
+        except Exception as e:
+            print(f"任务执行出错: {str(e)}")
 
 
 if __name__ == "__main__":
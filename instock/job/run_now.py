@@ -10,12 +10,10 @@ sys.path.append(cpath)
 
 import json
 import math
-import requests
 import numpy as np
 import pandas as pd
 import time
 import datetime
-import mysql.connector
 import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
 import pandas_market_calendars as mcal
@@ -24,7 +22,8 @@ from typing import List, Dict
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
+from instock.lib.database import DBManager
+import instock.lib.http_session as http_session
 import stock_zijin as stock_zijin
 import indicators_data_daily as indicators_data_daily
 import threeday_indicators as threeday_indicators
@@ -434,7 +433,7 @@ def fetch_zh_a_spot_data(
         page_param_name: start_page  # 起始页码
     }
     try:
-        r = requests.get(url, params=first_page_params)
+        r = http_session.get(url, params=first_page_params)
         r.raise_for_status()
         data_json = r.json()
         data_count = data_json["data"]["total"]
@@ -454,7 +453,7 @@ def fetch_zh_a_spot_data(
             page_param_name: page   # 正确设置页码参数
         }
         try:
-            r = requests.get(url, params=page_params)
+            r = http_session.get(url, params=page_params)
             r.raise_for_status()
             return r.json()["data"]["diff"]
         except Exception as e:
@@ -663,7 +662,7 @@ def index_spot_data(
         page_param_name: start_page  # 起始页码
     }
     try:
-        r = requests.get(url, params=first_page_params)
+        r = http_session.get(url, params=first_page_params)
         r.raise_for_status()
         data_json = r.json()
         data_count = data_json["data"]["total"]
@@ -683,7 +682,7 @@ def index_spot_data(
             page_param_name: page   # 正确设置页码参数
         }
         try:
-            r = requests.get(url, params=page_params)
+            r = http_session.get(url, params=page_params)
             r.raise_for_status()
             return r.json()["data"]["diff"]
         except Exception as e:
@@ -894,7 +893,7 @@ def etf_spot_data(
         page_param_name: start_page  # 起始页码
     }
     try:
-        r = requests.get(url, params=first_page_params)
+        r = http_session.get(url, params=first_page_params)
         r.raise_for_status()
         data_json = r.json()
         data_count = data_json["data"]["total"]
@@ -914,7 +913,7 @@ def etf_spot_data(
             page_param_name: page   # 正确设置页码参数
         }
         try:
-            r = requests.get(url, params=page_params)
+            r = http_session.get(url, params=page_params)
             r.raise_for_status()
             return r.json()["data"]["diff"]
         except Exception as e:
@@ -944,42 +943,6 @@ execute_raw_sql(sql,params)：执行插入数据表
 """
 
 
-
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
-
-
-
 def sql_batch_generator(table_name, data, batch_size=500):
     """通用批量SQL生成器"""
     # if 'code' in data.columns and 'code_int' not in data.columns:
@@ -14,9 +14,7 @@ import akshare as ak
 import pandas as pd
 import pandas_market_calendars as mcal
 from tqdm import tqdm
-import mysql.connector
-from mysql.connector import Error
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
+from instock.lib.database import DBManager
 
 
 # 获取股票资金流数据
@@ -57,37 +55,6 @@ stock_fund_flow_individual_df = stock_fund_flow_individual_df.assign(
 
 print(f'{stock_fund_flow_individual_df}')
 
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建新的数据库连接"""
-        try:
-            return mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset
-            )
-        except Error as e:
-            print(f"数据库连接失败: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str):
-        """执行SQL语句"""
-        conn = DBManager.get_new_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute(sql)
-                conn.commit()
-            except Error as e:
-                print(f"SQL执行失败: {e}\nSQL: {sql[:200]}...")
-                conn.rollback()
-            finally:
-                cursor.close()
-                conn.close()
 
 def create_table():
     """创建数据表"""
@@ -14,12 +14,12 @@ import concurrent.futures
 from datetime import datetime, timedelta
 import pandas as pd
 import sqlalchemy
-from sqlalchemy import MetaData, Table, text
+from sqlalchemy import text
 from tqdm import tqdm
-import mysql.connector
-from sqlalchemy import create_engine, DATE, FLOAT, VARCHAR, INT
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset 
+from sqlalchemy import DATE, FLOAT, VARCHAR, INT
+from instock.lib.database import db_host, db_user, db_password, db_database, DBManager, get_engine
 import instock.lib.database as mdb
+import instock.lib.write_behind as wb
 
 __author__ = 'hqm'
 __date__ = '2025/4/15'
@@ -154,7 +154,8 @@ def guess_buy(strategy_name, start_date_int, end_date_int=None):
         # print(f'{data}')
 
         # 插入数据库逻辑（使用优化后的插入方法）
-        optimized_data_insert(data)
+        # 异步写库，下一个策略的查询与本次写库重叠
+        wb.submit(optimized_data_insert, data)
         
     except Exception as e:
         logging.error(f"处理异常：{e}")
@@ -204,8 +205,7 @@ def optimized_data_insert(data):
     table_name = "cn_etf_indicators_buy"
     try:
         with mdb.engine().connect() as conn:
-            metadata = MetaData()
-            table = Table(table_name, metadata, autoload_with=conn.engine)
+            table = mdb.reflect_table(table_name, conn.engine)
             
             # 调试：打印表结构
             # print("\n[DEBUG] 表结构字段：")
@@ -349,7 +349,7 @@ db_config = {
 
 class StockHistData:
     def __init__(self):
-        self.engine = create_engine(
+        self.engine = get_engine(
             f"mysql+mysqlconnector://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
         )
 
@@ -390,7 +390,7 @@ def process_table(table, hist_data):
     table_name = table['name']
     
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = DBManager.get_new_connection()
         cursor = conn.cursor()
         cursor.execute(f"""
             SELECT date, date_int, code , code_int, name, strategy, close, kdjj, turnover
@@ -576,6 +576,10 @@ def main():
                 end_date_int=end_date
             )
 
+        # 等待全部策略结果落库
+        if not wb.flush():
+            raise Exception("策略结果写库失败")
+
         # 回测
         prepare()
         
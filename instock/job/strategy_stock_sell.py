@@ -14,10 +14,11 @@ import time
 from datetime import datetime, timedelta
 import pandas as pd
 import sqlalchemy
-from sqlalchemy import MetaData, Table, text
+from sqlalchemy import text
 from tqdm import tqdm
 from instock.lib.database import db_host, db_user, db_password, db_database, db_charset 
 import instock.lib.database as mdb
+import instock.lib.write_behind as wb
 import instock.core.tablestructure as tbs
 
 __author__ = 'hqm'
@@ -156,7 +157,8 @@ def guess_buy(strategy_name, start_date_int, end_date_int=None):
         # print(f'{data}')
 
         # 插入数据库逻辑（使用优化后的插入方法）
-        optimized_data_insert(data)
+        # 异步写库，下一个策略的查询与本次写库重叠
+        wb.submit(optimized_data_insert, data)
         
     except Exception as e:
         logging.error(f"处理异常：{e}")
@@ -217,8 +219,7 @@ def optimized_data_insert(data):
     # table_name = "cn_stock_indicators_sell"
     try:
         with mdb.engine().connect() as conn:
-            metadata = MetaData()
-            table = Table(table_name, metadata, autoload_with=conn.engine)
+            table = mdb.reflect_table(table_name, conn.engine)
             
             # 调试：打印表结构
             # print("\n[DEBUG] 表结构字段：")
@@ -310,6 +311,10 @@ def main():
                 start_date_int=start_date,
                 end_date_int=end_date
             )
+
+        # 等待全部策略结果落库
+        if not wb.flush():
+            raise Exception("策略结果写库失败")
         
     except Exception as e:
         logging.error(f"执行失败: {e}")
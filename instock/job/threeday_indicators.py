@@ -16,7 +16,6 @@ import numpy as np
 import pandas as pd
 import time
 import datetime
-import mysql.connector
 import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
 import pandas_market_calendars as mcal
@@ -26,60 +25,8 @@ from typing import List, Dict
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from instock.lib.database import db_host, db_user, db_password, db_database, db_charset
-
-
-class DBManager:
-    @staticmethod
-    def get_new_connection():
-        """创建并返回一个新的数据库连接"""
-        try:
-            connection = mysql.connector.connect(
-                host=db_host,
-                user=db_user,
-                password=db_password,
-                database=db_database,
-                charset=db_charset,
-                use_pure=True  # 强制使用纯Python实现
-            )
-            return connection
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-            return None
-
-    @staticmethod
-    def execute_sql(sql: str, params=None):
-        """安全执行 SQL 语句"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(buffered=True)
-                cursor.execute(sql, params)
-                connection.commit()
-                cursor.close()
-            except Error as e:
-                print(f"Error while executing SQL: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
-
-    @staticmethod
-    def table_exists(table_name):
-        """检查数据表是否存在"""
-        connection = DBManager.get_new_connection()
-        if connection:
-            try:
-                cursor = connection.cursor()
-                cursor.execute(f"SHOW TABLES LIKE '{table_name}'")
-                result = cursor.fetchone()
-                return result is not None
-            except Error as e:
-                print(f"Error while checking table existence: {e}")
-            finally:
-                if connection.is_connected():
-                    cursor.close()
-                    connection.close()
-        return False
+from instock.lib.database import DBManager, executemany_upsert
+from instock.lib.write_behind import WriteBehind
 
 
 def create_temp_table(source_table: str, temp_table: str):
@@ -136,6 +83,10 @@ def create_temp_table(source_table: str, temp_table: str):
             conn.close()
 
 
+# 目标表每个写库任务的行数
+WRITE_CHUNK_ROWS = 20000
+
+
 def process_3day_data(source_table: str, target_table: str, sample_code: int):
     """
     处理三日指标数据并写入目标表
@@ -227,12 +178,16 @@ def process_3day_data(source_table: str, target_table: str, sample_code: int):
         print(f"从 {source_table} 获取到 {len(df)} 条三日指标数据")
 
         if not df.empty:
-            # 第三步：写入目标表
-            sql_batches = sql语句生成器(target_table, df)
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                futures = [executor.submit(DBManager.execute_sql, sql) for sql in sql_batches]
-                for future in tqdm(as_completed(futures), total=len(futures), desc="写入进度"):
-                    future.result()
+            # 第三步：写入目标表，按 code_int 排序后分块交给写库线程并行写入（各块主键不重叠）
+            if 'code' in df.columns and 'code_int' not in df.columns:
+                df.insert(0, 'code_int', df['code'].astype(int))
+            df = df.sort_values(by=['code_int', 'date_int'])
+            writer = WriteBehind(name=f'{target_table}_writer')
+            for start in range(0, len(df), WRITE_CHUNK_ROWS):
+                writer.submit(executemany_upsert, target_table, df.iloc[start:start + WRITE_CHUNK_ROWS],
+                              unique_keys=['date_int', 'code_int'])
+            if not writer.close():
+                raise Error(f"{target_table} 部分数据写入失败")
             print(f"{target_table} 数据更新完成，新增 {len(df)} 条记录")
         else:
             print(f"未从 {source_table} 获取到有效数据")
@@ -285,62 +240,6 @@ def create_3day_table(table_name: str):
                 DBManager.execute_sql(statement)
 
 
-def sql语句生成器(table_name, data, batch_size=5000):
-    # 预处理code_int字段
-    if 'code' in data.columns and 'code_int' not in data.columns:
-        data.insert(0, 'code_int', data['code'].astype(int))
-
-    # 增加数据排序
-    data = data.sort_values(by=['code_int', 'date_int'])
-
-    # SQL模板（批量版本）
-    sql_template = """INSERT INTO `{table_name}` ({columns}) 
-        VALUES {values}
-        ON DUPLICATE KEY UPDATE {update_clause};"""
-
-    # 定义字段和更新子句
-    columns = ', '.join([f"`{col}`" for col in data.columns])
-    unique_keys = ['date_int', 'code_int']
-    update_clause = ', '.join(
-        [f"`{col}`=VALUES(`{col}`)"
-         for col in data.columns if col not in unique_keys]
-    )
-
-    # 分批次处理数据
-    batches = []
-    for i in range(0, len(data), batch_size):
-        batch = data.iloc[i:i + batch_size]
-        value_rows = []
-
-        for row in batch.itertuples(index=False):
-            values = []
-            for item in row:
-                # 处理空值和特殊字符
-                if pd.isna(item) or item in ['-', '']:
-                    values.append("NULL")
-                elif isinstance(item, (datetime.date, datetime.datetime)):
-                    values.append(f"'{item.strftime('%Y-%m-%d')}'")
-                elif isinstance(item, (int, float)):
-                    values.append(str(item))
-                else:
-                    cleaned = str(item).replace("'", "''").replace("\\", "\\\\")
-                    values.append(f"'{cleaned}'")
-            value_rows.append(f"({', '.join(values)})")
-
-        # 合并为单个VALUES子句
-        values_str = ',\n'.join(value_rows)
-        batches.append(
-            sql_template.format(
-                table_name=table_name,
-                columns=columns,
-                values=values_str,
-                update_clause=update_clause
-            )
-        )
-
-    return batches
-
-
 def main():
     # 时区设置
     tz = pytz.timezone('Asia/Shanghai')
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+import instock.lib.http_session as http_session
+from instock.lib.rate_control import endpoint_key, get_controller
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 异步分页抓取：一个进程内用 asyncio 调度各数据源的分页请求，
+# 每个站点有独立的并发上限（信号量），请求间隔由 rate_control 的自适应速率决定，取代逐页串行 + 固定 sleep。
+# 请求本身由 http_session 的共用会话在线程池中执行（事件循环只做调度，连接复用），解析也在线程池中完成。
+#
+#   pages = crawl(lambda crawler: crawler.fetch_all(url, params_list, parse=parse_json, desc="获取数据"))
+
+crawler_workers = 16  # 执行请求的线程数，所有站点共用
+_crawler_workers = os.environ.get('crawler_workers')
+if _crawler_workers is not None:
+    crawler_workers = int(_crawler_workers)
+
+crawler_concurrency = 4  # 每个站点同时在途的请求数
+_crawler_concurrency = os.environ.get('crawler_concurrency')
+if _crawler_concurrency is not None:
+    crawler_concurrency = int(_crawler_concurrency)
+
+# 单独配置并发数的站点（rate_control.endpoint_key 的结果）；同一域名下的子域名（如 82.push2.eastmoney.com）共用
+HOST_CONCURRENCY = {}
+
+crawler_retries = 2  # 单个请求失败后的重试次数
+crawler_timeout = 10  # 单个请求超时（秒）
+
+
+def parse_json(response):
+    return response.json()
+
+
+def parse_text(response):
+    return response.text
+
+
+class HostLimiter:
+    """一个站点的并发上限 + 限速：async with 进入时占一个并发名额，并等到 controller 预约的请求时刻"""
+
+    def __init__(self, concurrency, controller):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.controller = controller
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        try:
+            delay = self.controller.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+
+
+def _get(url, params, headers, timeout, parse):
+    response = http_session.get(url, params=params, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return parse(response)
+
+
+class AsyncCrawler:
+    """在一个事件循环内使用；fetch/fetch_all 失败的请求重试后返回 None，不抛出异常"""
+
+    def __init__(self, workers=None, concurrency=None):
+        self.concurrency = HOST_CONCURRENCY if concurrency is None else concurrency
+        self._executor = ThreadPoolExecutor(max_workers=workers or crawler_workers, thread_name_prefix='crawler')
+        self._limiters = {}
+
+    def _limiter(self, url):
+        key = endpoint_key(url)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = HostLimiter(self.concurrency.get(key, crawler_concurrency), get_controller(key))
+            self._limiters[key] = limiter
+        return limiter
+
+    async def fetch(self, url, params=None, headers=None, parse=parse_json, timeout=None, retries=None):
+        """
+        请求一页并用 parse(response) 解析，返回解析结果；重试后仍失败返回 None。
+        parse 抛出 rate_control.EmptyPayload 表示空数据，与 HTTP 403/429、超时一样使该站点降速。
+        """
+        loop = asyncio.get_running_loop()
+        limiter = self._limiter(url)
+        retries = crawler_retries if retries is None else retries
+        call = functools.partial(_get, url, params, headers, timeout or crawler_timeout, parse)
+        for attempt in range(retries + 1):
+            async with limiter:
+                try:
+                    result = await loop.run_in_executor(self._executor, call)
+                    limiter.controller.record()
+                    return result
+                except Exception as e:
+                    limiter.controller.record(e)
+                    error = e
+            if attempt < retries:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        print(f"请求失败：{url} {params or ''} {error}")
+        return None
+
+    async def fetch_all(self, url, params_list, headers=None, parse=parse_json, desc=None, **kwargs):
+        """同一 url 的多页并发请求，结果按 params_list 的顺序返回；desc 不为空时显示进度条"""
+        progress = tqdm(total=len(params_list), desc=desc) if desc else None
+
+        async def one(params):
+            result = await self.fetch(url, params=params, headers=headers, parse=parse, **kwargs)
+            if progress is not None:
+                progress.update(1)
+            return result
+
+        try:
+            return await asyncio.gather(*(one(params) for params in params_list))
+        finally:
+            if progress is not None:
+                progress.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def crawl(main, **kwargs):
+    """新建事件循环和 AsyncCrawler 运行 main(crawler)（协程函数），返回其结果；供同步代码调用"""
+
+    async def runner():
+        crawler = AsyncCrawler(**kwargs)
+        try:
+            return await main(crawler)
+        finally:
+            crawler.close()
+
+    return asyncio.run(runner())
@@ -3,10 +3,16 @@
 
 import logging
 import os
+import queue
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
 import pymysql
 from sqlalchemy import create_engine
 from sqlalchemy.types import NVARCHAR
-from sqlalchemy import inspect
+from sqlalchemy import inspect, MetaData, Table
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -35,6 +41,14 @@ _db_port = os.environ.get('db_port')
 if _db_port is not None:
     db_port = int(_db_port)
 
+db_pool_size = 16  # 每个进程连接池最大连接数
+db_pool_timeout = 60  # 连接池耗尽时等待空闲连接的秒数
+db_pool_recycle = 3600  # 连接最长复用秒数，超过后重建
+db_pool_ping_interval = 30  # 空闲超过该秒数的连接借出前做一次健康检查
+_db_pool_size = os.environ.get('db_pool_size')
+if _db_pool_size is not None:
+    db_pool_size = int(_db_pool_size)
+
 MYSQL_CONN_URL = "mysql+pymysql://%s:%s@%s:%s/%s?charset=%s" % (
     db_user, db_password, db_host, db_port, db_database, db_charset)
 logging.info(f"数据库链接信息：{ MYSQL_CONN_URL}")
@@ -46,14 +60,72 @@ MYSQL_CONN_TORNDB = {'host': f'{db_host}:{str(db_port)}', 'user': db_user, 'pass
                      'database': db_database, 'charset': db_charset, 'max_idle_time': 3600, 'connect_timeout': 1000}
 
 
+MYSQL_CONN_CONNECTOR = {'host': db_host, 'user': db_user, 'password': db_password, 'database': db_database,
+                        'charset': db_charset, 'port': db_port, 'use_pure': True, 'allow_local_infile': True}
+
+
+db_engine_pool_size = 8  # SQLAlchemy engine 连接池常驻连接数
+db_engine_max_overflow = 8  # SQLAlchemy engine 连接池允许的临时溢出连接数
+db_reflect_ttl = 600  # 表结构反射（主键、Table对象）缓存秒数
+
+_engines = {}
+_engines_lock = threading.Lock()
+_reflections = {}
+
+
+# 按连接串缓存 engine，同一进程内复用，fork 出的子进程各自重建
+def get_engine(url=None):
+    url = url or MYSQL_CONN_URL
+    key = (os.getpid(), url)
+    _engine = _engines.get(key)
+    if _engine is None:
+        with _engines_lock:
+            _engine = _engines.get(key)
+            if _engine is None:
+                _engine = create_engine(url, pool_size=db_engine_pool_size, max_overflow=db_engine_max_overflow,
+                                        pool_recycle=db_pool_recycle, pool_pre_ping=True)
+                _engines[key] = _engine
+    return _engine
+
+
 # 通过数据库链接 engine
 def engine():
-    return create_engine(MYSQL_CONN_URL)
+    return get_engine(MYSQL_CONN_URL)
 
 
 def engine_to_db(to_db):
-    _engine = create_engine(MYSQL_CONN_URL.replace(f'/{db_database}?', f'/{to_db}?'))
-    return _engine
+    return get_engine(MYSQL_CONN_URL.replace(f'/{db_database}?', f'/{to_db}?'))
+
+
+# 表结构反射结果带过期时间缓存，重复写同一张表时不再每次查询 INFORMATION_SCHEMA
+def _reflect_cached(kind, _engine, table_name, loader):
+    key = (kind, str(_engine.url), table_name)
+    cached = _reflections.get(key)
+    if cached is not None and time.time() - cached[0] < db_reflect_ttl:
+        return cached[1]
+    value = loader()
+    _reflections[key] = (time.time(), value)
+    return value
+
+
+def invalidate_reflection(table_name=None):
+    for key in list(_reflections):
+        if table_name is None or key[2] == table_name:
+            _reflections.pop(key, None)
+
+
+# 表的主键列
+def get_pk_columns(table_name, _engine=None):
+    _engine = _engine or engine()
+    return _reflect_cached('pk', _engine, table_name,
+                           lambda: inspect(_engine).get_pk_constraint(table_name)['constrained_columns'])
+
+
+# 反射得到的 sqlalchemy Table 对象
+def reflect_table(table_name, _engine=None):
+    _engine = _engine or engine()
+    return _reflect_cached('table', _engine, table_name,
+                           lambda: Table(table_name, MetaData(), autoload_with=_engine))
 
 
 # DB Api -数据库连接对象connection
@@ -78,9 +150,6 @@ def insert_other_db_from_df(to_db, data, table_name, cols_type, write_index, pri
         engine_mysql = engine()
     else:
         engine_mysql = engine_to_db(to_db)
-    # 使用 http://docs.sqlalchemy.org/en/latest/core/reflection.html
-    # 使用检查检查数据库表是否有主键。
-    ipt = inspect(engine_mysql)
     col_name_list = data.columns.tolist()
     # 如果有索引，把索引增加到varchar上面。
     if write_index:
@@ -99,8 +168,8 @@ def insert_other_db_from_df(to_db, data, table_name, cols_type, write_index, pri
     except Exception as e:
         logging.error(f"database.insert_other_db_from_df处理异常：{table_name}表{e}")
 
-    # 判断是否存在主键
-    if not ipt.get_pk_constraint(table_name)['constrained_columns']:
+    # 判断是否存在主键（使用 http://docs.sqlalchemy.org/en/latest/core/reflection.html ，结果缓存）
+    if not get_pk_columns(table_name, engine_mysql):
         try:
             # 执行数据库插入数据。
             with get_connection() as conn:
@@ -111,47 +180,42 @@ def insert_other_db_from_df(to_db, data, table_name, cols_type, write_index, pri
                             db.execute(f'ALTER TABLE `{table_name}` ADD INDEX IN{k}({indexs[k]});')
         except Exception as e:
             logging.error(f"database.insert_other_db_from_df处理异常：{table_name}表{e}")
+        finally:
+            invalidate_reflection(table_name)
+
 
+# 更新数据：整批写入带索引的临时表，再按批执行一条 UPDATE ... JOIN ... USING (where列)，避免逐行拼接和往返
+def update_db_from_df(data, table_name, where, batch_size=5000):
+    if data is None or data.empty:
+        return True
+    keys = [col for col in data.columns if col in where]
+    cols = [col for col in data.columns if col not in where]
+    if not keys or not cols:
+        logging.error(f"database.update_db_from_df处理异常：{table_name}表缺少条件列或更新列{where}")
+        return False
 
-# 更新数据
-def update_db_from_df(data, table_name, where):
-    data = data.where(data.notnull(), None)
-    update_string = f'UPDATE `{table_name}` set '
-    where_string = ' where '
-    cols = tuple(data.columns)
+    stage_table = f'_update_{table_name}'
+    columns = ', '.join([f"`{col}`" for col in data.columns])
+    key_columns = ', '.join([f"`{col}`" for col in keys])
+    insert_sql = f"INSERT INTO `{stage_table}` ({columns}) VALUES ({', '.join(['%s'] * len(data.columns))})"
+    set_clause = ', '.join([f"t.`{col}` = s.`{col}`" for col in cols])
+    update_sql = f"UPDATE `{table_name}` t JOIN `{stage_table}` s USING ({key_columns}) SET {set_clause}"
+    rows = dataframe_to_params(data, null_tokens=())
     with get_connection() as conn:
         with conn.cursor() as db:
             try:
-                for row in data.values:
-                    sql = update_string
-                    sql_where = where_string
-                    for index, col in enumerate(cols):
-                        if col in where:
-                            if len(sql_where) == len(where_string):
-                                if type(row[index]) == str:
-                                    sql_where = f'''{sql_where}`{col}` = '{row[index]}' '''
-                                else:
-                                    sql_where = f'''{sql_where}`{col}` = {row[index]} '''
-                            else:
-                                if type(row[index]) == str:
-                                    sql_where = f'''{sql_where} and `{col}` = '{row[index]}' '''
-                                else:
-                                    sql_where = f'''{sql_where} and `{col}` = {row[index]} '''
-                        else:
-                            if type(row[index]) == str:
-                                if row[index] is None or row[index] != row[index]:
-                                    sql = f'''{sql}`{col}` = NULL, '''
-                                else:
-                                    sql = f'''{sql}`{col}` = '{row[index]}', '''
-                            else:
-                                if row[index] is None or row[index] != row[index]:
-                                    sql = f'''{sql}`{col}` = NULL, '''
-                                else:
-                                    sql = f'''{sql}`{col}` = {row[index]}, '''
-                    sql = f'{sql[:-2]}{sql_where}'
-                    db.execute(sql)
+                db.execute(f"DROP TEMPORARY TABLE IF EXISTS `{stage_table}`")
+                db.execute(f"CREATE TEMPORARY TABLE `{stage_table}` (INDEX ({key_columns})) "
+                           f"SELECT {columns} FROM `{table_name}` LIMIT 0")
+                for i in range(0, len(rows), batch_size):
+                    db.execute(f"DELETE FROM `{stage_table}`")
+                    db.executemany(insert_sql, rows[i:i + batch_size])
+                    db.execute(update_sql)
+                db.execute(f"DROP TEMPORARY TABLE IF EXISTS `{stage_table}`")
+                return True
             except Exception as e:
-                logging.error(f"database.update_db_from_df处理异常：{sql}{e}")
+                logging.error(f"database.update_db_from_df处理异常：{update_sql}{e}")
+    return False
 
 
 # 检查表是否存在
@@ -204,3 +268,451 @@ def executeSqlCount(sql, params=()):
             except Exception as e:
                 logging.error(f"database.select_count计算数量处理异常：{e}")
     return 0
+
+
+class _PooledConnection:
+    """连接池借出的连接，close() 时归还连接池而不是断开，其余属性透传给 mysql.connector 连接"""
+
+    def __init__(self, pool, conn, created_at):
+        self._pool = pool
+        self._conn = conn
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise AttributeError(f"连接已归还连接池，不能再调用 {name}")
+        return getattr(self._conn, name)
+
+    def is_connected(self):
+        # 只要还未归还就视为可用，保证各作业 `if conn.is_connected(): conn.close()` 的写法一定会归还连接，
+        # 真正的存活检查由连接池借出前完成
+        return self._conn is not None
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn, self._created_at)
+
+    def __del__(self):
+        # 忘记 close() 的连接在回收时归还，避免占住连接池名额
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ConnectionPool:
+    """进程内共享的 mysql.connector 连接池：容量有上限、借出前健康检查、跨线程跨批次复用"""
+
+    def __init__(self, config, size=db_pool_size, timeout=db_pool_timeout, recycle=db_pool_recycle,
+                 ping_interval=db_pool_ping_interval):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self._idle = queue.LifoQueue()  # (conn, 创建时间, 最近归还时间)
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        import mysql.connector
+        return _PooledConnection(self, mysql.connector.connect(**self.config), time.time())
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, created_at, idle_since):
+        now = time.time()
+        if now - created_at > self.recycle:
+            return False
+        if now - idle_since < self.ping_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"database.ConnectionPool等待空闲连接超时：{self.timeout}秒")
+        try:
+            while True:
+                try:
+                    conn, created_at, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if self._healthy(conn, created_at, idle_since):
+                    return _PooledConnection(self, conn, created_at)
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, created_at):
+        try:
+            # 回滚未提交事务并读掉残留结果集，避免污染下一个使用者
+            conn.rollback()
+            self._idle.put((conn, created_at, time.time()))
+        except Exception:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# 获取当前进程的共享连接池，fork 出的子进程各自重建，不共用父进程的套接字
+def get_pool(to_db=None):
+    key = (os.getpid(), to_db)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                config = dict(MYSQL_CONN_CONNECTOR)
+                if to_db is not None:
+                    config['database'] = to_db
+                pool = ConnectionPool(config)
+                _pools[key] = pool
+    return pool
+
+
+# 从共享连接池借出连接，用完 close() 即归还
+def get_pooled_connection(to_db=None):
+    try:
+        return get_pool(to_db).acquire()
+    except Exception as e:
+        logging.error(f"database.get_pooled_connection处理异常：{db_host}:{db_port}/{to_db or db_database}{e}")
+    return None
+
+
+class DBManager:
+    """各作业共用的数据库访问入口，连接全部来自进程内共享连接池"""
+
+    @staticmethod
+    def get_new_connection():
+        """从连接池借出一个连接，close() 后归还连接池"""
+        connection = get_pooled_connection()
+        if connection is None:
+            print(f"Error while connecting to MySQL: {db_host}:{db_port}/{db_database}")
+        return connection
+
+    @staticmethod
+    def execute_sql(sql: str, params=None):
+        """安全执行 SQL 语句"""
+        connection = DBManager.get_new_connection()
+        if connection:
+            try:
+                cursor = connection.cursor(buffered=True)
+                cursor.execute(sql, params)
+                connection.commit()
+                cursor.close()
+            except Exception as e:
+                print(f"Error while executing SQL: {e}")
+            finally:
+                connection.close()
+
+    @staticmethod
+    def query_sql(sql: str, params=None):
+        """执行查询SQL并返回DataFrame"""
+        connection = DBManager.get_new_connection()
+        if connection:
+            try:
+                return pd.read_sql(sql, connection, params=params)
+            except Exception as e:
+                print(f"Error while querying SQL: {e}")
+                return pd.DataFrame()
+            finally:
+                connection.close()
+        else:
+            return pd.DataFrame()
+
+    @staticmethod
+    def table_exists(table_name):
+        """检查数据表是否存在"""
+        connection = DBManager.get_new_connection()
+        if connection:
+            try:
+                cursor = connection.cursor(buffered=True)
+                cursor.execute(f"SHOW TABLES LIKE '{table_name}'")
+                result = cursor.fetchone()
+                cursor.close()
+                return result is not None
+            except Exception as e:
+                print(f"Error while checking table existence: {e}")
+            finally:
+                connection.close()
+        return False
+
+
+# 进程内缓存每张表已知的字段，避免每个批次、每只股票都查询 INFORMATION_SCHEMA
+_table_columns = {}
+_table_columns_lock = threading.Lock()
+
+
+def _fetch_table_columns(conn, table_name):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
+                       "WHERE TABLE_NAME = %s AND TABLE_SCHEMA = DATABASE()", (table_name,))
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def get_table_columns(table_name, conn=None, refresh=False):
+    """返回表的现有字段集合；表不存在时返回空集合且不缓存"""
+    if not refresh and table_name in _table_columns:
+        return _table_columns[table_name]
+    own_conn = conn is None
+    if own_conn:
+        conn = DBManager.get_new_connection()
+        if conn is None:
+            return set()
+    try:
+        columns = _fetch_table_columns(conn, table_name)
+    finally:
+        if own_conn:
+            conn.close()
+    with _table_columns_lock:
+        if columns:
+            _table_columns[table_name] = columns
+        else:
+            _table_columns.pop(table_name, None)
+    return columns
+
+
+def forget_table_columns(table_name=None):
+    """表被外部删除或重建后清除字段缓存"""
+    with _table_columns_lock:
+        if table_name is None:
+            _table_columns.clear()
+        else:
+            _table_columns.pop(table_name, None)
+
+
+def add_missing_columns(table_name, columns, conn=None):
+    """
+    columns 为 {字段名: SQL类型}，缺失字段用一条 ALTER TABLE 一次性添加，
+    大表只重建一次。返回实际添加的字段列表，失败返回 None。
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = DBManager.get_new_connection()
+        if conn is None:
+            return None
+    try:
+        existing = get_table_columns(table_name, conn)
+        for attempt in range(2):
+            missing = [col for col in columns if col not in existing]
+            if not missing:
+                return []
+            alter_sql = f"ALTER TABLE `{table_name}` " + ", ".join(
+                f"ADD COLUMN `{col}` {columns[col]}" for col in missing)
+            cursor = conn.cursor()
+            try:
+                print(f"[EXECUTE] 执行SQL：{alter_sql}")
+                cursor.execute(alter_sql)
+                conn.commit()
+                with _table_columns_lock:
+                    _table_columns[table_name] = set(existing) | set(missing)
+                return missing
+            except Exception as e:
+                # 其他进程可能已抢先添加了部分字段（1060 重复字段），刷新后重试一次
+                conn.rollback()
+                if attempt:
+                    print(f"[ERROR] 表 {table_name} 添加字段失败：{e}")
+                    return None
+                existing = get_table_columns(table_name, conn, refresh=True)
+            finally:
+                cursor.close()
+    finally:
+        if own_conn:
+            conn.close()
+
+
+# 各作业 sql_batch_generator 视为 NULL 的取值
+NULL_TOKENS = ['-', '']
+
+
+# 各列只判断一次的 NULL 掩码：NaN/None/inf，以及 '-'、'' 这类占位符
+def _null_mask(col, null_tokens=NULL_TOKENS):
+    if pd.api.types.is_bool_dtype(col):
+        return pd.Series(False, index=col.index)
+    if pd.api.types.is_numeric_dtype(col):
+        return col.isna() | np.isinf(col.astype(float))
+    return col.isna() | col.isin(null_tokens)
+
+
+def _is_date_column(col):
+    return pd.api.types.is_datetime64_any_dtype(col) or \
+        pd.api.types.infer_dtype(col, skipna=True) in ('date', 'datetime', 'datetime64')
+
+
+def _date_strings(col, null_mask):
+    return pd.to_datetime(col.mask(null_mask)).dt.strftime('%Y-%m-%d')
+
+
+# 按列向量化生成 LOAD DATA 文本：NULL写成\N，日期格式化为YYYY-MM-DD，字符串转义反斜杠、制表符和换行
+def _tsv_column(col):
+    null_mask = _null_mask(col)
+    if pd.api.types.is_bool_dtype(col):
+        text = col.astype(int).astype(str)
+    elif pd.api.types.is_numeric_dtype(col):
+        text = col.astype(str)
+    elif _is_date_column(col):
+        text = _date_strings(col, null_mask)
+    else:
+        text = col.astype(str).str.replace('\\', '\\\\', regex=False).str.replace(
+            '\t', '\\t', regex=False).str.replace('\n', '\\n', regex=False).str.replace('\r', '\\r', regex=False)
+    return text.mask(null_mask, r'\N')
+
+
+def dataframe_to_tsv(data):
+    columns = [_tsv_column(data[col]) for col in data.columns]
+    lines = columns[0].str.cat(columns[1:], sep='\t') if len(columns) > 1 else columns[0]
+    return '\n'.join(lines.tolist()) + '\n'
+
+
+# 按列向量化生成绑定参数：NULL为None，数值转为Python原生类型，日期格式化为YYYY-MM-DD，字符串交给驱动转义
+def _param_column(col, null_tokens=NULL_TOKENS):
+    null_mask = _null_mask(col, null_tokens)
+    if pd.api.types.is_bool_dtype(col):
+        values = col.astype(int).to_numpy(dtype=object)
+    elif pd.api.types.is_numeric_dtype(col):
+        values = col.to_numpy(dtype=object)
+    elif _is_date_column(col):
+        values = _date_strings(col, null_mask).to_numpy(dtype=object)
+    else:
+        values = col.astype(str).to_numpy(dtype=object)
+    values[null_mask.to_numpy()] = None
+    return values
+
+
+def dataframe_to_params(data, null_tokens=NULL_TOKENS):
+    return list(zip(*[_param_column(data[col], null_tokens) for col in data.columns]))
+
+
+def _update_clause(columns, unique_keys, coalesce):
+    if coalesce:
+        return ', '.join([f"`{col}` = COALESCE(VALUES(`{col}`), `{col}`)" for col in columns if col not in unique_keys])
+    return ', '.join([f"`{col}`=VALUES(`{col}`)" for col in columns if col not in unique_keys])
+
+
+# LOAD DATA LOCAL INFILE 写入临时表，再用一条 INSERT ... SELECT ... ON DUPLICATE KEY UPDATE 合并到目标表
+# coalesce=True 时只有新值不为NULL才覆盖旧值（与 kline 作业一致）
+# 服务器未开启 local_infile 等原因失败时返回 False，由调用方回退到 executemany_upsert 写入
+def load_data_upsert(table_name, data, unique_keys=('date', 'code'), coalesce=False, chunk_size=200000,
+                     conn=None):
+    if data is None or data.empty:
+        return True
+    own_conn = conn is None
+    if own_conn:
+        conn = get_pooled_connection()
+    if conn is None:
+        return False
+
+    stage_table = f'_stage_{table_name}'
+    columns = ', '.join([f"`{col}`" for col in data.columns])
+    update_clause = _update_clause(data.columns, unique_keys, coalesce)
+    merge_sql = f"INSERT INTO `{table_name}` ({columns}) SELECT {columns} FROM `{stage_table}`"
+    if update_clause:
+        merge_sql = f"{merge_sql} ON DUPLICATE KEY UPDATE {update_clause}"
+
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{stage_table}`")
+        cursor.execute(f"CREATE TEMPORARY TABLE `{stage_table}` SELECT {columns} FROM `{table_name}` LIMIT 0")
+        for i in range(0, len(data), chunk_size):
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='\n', suffix='.tsv',
+                                             delete=False) as f:
+                f.write(dataframe_to_tsv(data.iloc[i:i + chunk_size]))
+            try:
+                cursor.execute(f"DELETE FROM `{stage_table}`")
+                cursor.execute(f"LOAD DATA LOCAL INFILE '{f.name.replace(os.sep, '/')}' "
+                               f"INTO TABLE `{stage_table}` CHARACTER SET utf8mb4 ({columns})")
+                cursor.execute(merge_sql)
+                conn.commit()
+            finally:
+                os.remove(f.name)
+        return True
+    except Exception as e:
+        logging.error(f"database.load_data_upsert处理异常：{table_name}表{e}")
+        print(f"[WARNING] {table_name} LOAD DATA 写入失败: {e}")
+        conn.rollback()
+        return False
+    finally:
+        try:
+            cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{stage_table}`")
+        except Exception:
+            pass
+        cursor.close()
+        if own_conn:
+            conn.close()
+
+
+# 参数化批量写入：INSERT ... VALUES (%s, ...) ON DUPLICATE KEY UPDATE，由驱动 executemany 合并为多行插入
+# 取值的 NULL 判断、日期格式化按列一次完成，字符串转义交给驱动，不再手工拼接
+def executemany_upsert(table_name, data, unique_keys=('date', 'code'), coalesce=False, batch_size=5000,
+                       conn=None, max_retries=3):
+    if data is None or data.empty:
+        return True
+    own_conn = conn is None
+    if own_conn:
+        conn = get_pooled_connection()
+    if conn is None:
+        return False
+
+    columns = ', '.join([f"`{col}`" for col in data.columns])
+    placeholders = ', '.join(['%s'] * len(data.columns))
+    sql = f"INSERT INTO `{table_name}` ({columns}) VALUES ({placeholders})"
+    update_clause = _update_clause(data.columns, unique_keys, coalesce)
+    if update_clause:
+        sql = f"{sql} ON DUPLICATE KEY UPDATE {update_clause}"
+
+    cursor = conn.cursor()
+    try:
+        rows = dataframe_to_params(data)
+        for i in range(0, len(rows), batch_size):
+            attempt = 0
+            while True:
+                try:
+                    cursor.executemany(sql, rows[i:i + batch_size])
+                    conn.commit()
+                    break
+                except Exception as e:
+                    conn.rollback()
+                    attempt += 1
+                    print(f"{table_name} 第{attempt}次写入失败: {e}")
+                    if attempt >= max_retries:
+                        raise
+                    time.sleep(2 ** attempt)  # 指数退避
+        return True
+    except Exception as e:
+        logging.error(f"database.executemany_upsert处理异常：{table_name}表{e}")
+        return False
+    finally:
+        cursor.close()
+        if own_conn:
+            conn.close()
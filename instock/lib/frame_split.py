@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+
+def key_offsets(data, key='code_int'):
+    """
+    返回 (按 key 有序的 data, 各 key 值, 起始行, 结束行)。
+    已按 key 有序时不排序，否则稳定排序一次（保留组内日期顺序），再用 np.searchsorted 找各区间。
+    """
+    values = data[key].to_numpy()
+    if not data[key].is_monotonic_increasing:
+        order = np.argsort(values, kind='stable')
+        data = data.iloc[order]
+        values = values[order]
+    keys = np.unique(values)
+    starts = np.searchsorted(values, keys, side='left')
+    ends = np.searchsorted(values, keys, side='right')
+    return data, keys, starts, ends
+
+
+def split_by_key(data, key='code_int'):
+    """
+    把批次数据按 key 拆成 {key值: 子表}，子表是 iloc 切片，
+    不逐个代码做布尔过滤和复制。
+    """
+    if data is None or data.empty:
+        return {}
+    data, keys, starts, ends = key_offsets(data, key)
+    return {k: data.iloc[s:e] for k, s, e in zip(keys.tolist(), starts, ends)}
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from instock.lib.database import DBManager
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 历史K线增量抓取：一次查询取出各代码在表中的最后一根K线（日期、收盘价），
+# 之后每个代码只请求从这一天起的K线（最后一根K线已是 end 当天也照样请求比对，库中可能是盘中快照）。
+# 多请求的这一根与库中的比对：收盘价一致时丢弃它，只写入之后的新K线；
+# 不一致（库中存的是盘中实时快照等）时从这一天起全部写入覆盖——请求的是不复权数据（fqt=0），
+# 除权不会改写更早的K线，不必全量重抓；只有这一天在接口中已不存在时，该代码才全量重抓并覆盖。
+
+FULL_HISTORY_BEG = "0"  # 全量重抓时的起始日期参数
+CLOSE_RTOL = 1e-5  # 收盘价比对的相对误差（库中为单精度 FLOAT）
+
+
+def get_last_bars(table_name, conn=None):
+    """{代码: (最后一根K线的 date_int, 收盘价)}；表不存在或查询失败时返回空字典（全部按无历史处理）"""
+    query = f"""
+        SELECT t.code, t.date_int, t.close
+        FROM `{table_name}` t
+        JOIN (SELECT code, MAX(date_int) AS date_int FROM `{table_name}` GROUP BY code) m
+          ON t.code = m.code AND t.date_int = m.date_int
+    """
+    try:
+        if conn is not None:
+            rows = pd.read_sql(query, conn)
+        else:
+            with DBManager.get_new_connection() as conn:
+                rows = pd.read_sql(query, conn)
+    except Exception as e:
+        print(f"[Warning] 读取 {table_name} 最后K线失败，按全量处理：{e}")
+        return {}
+    return {code: (int(date_int), float(close))
+            for code, date_int, close in zip(rows['code'], rows['date_int'], rows['close'])}
+
+
+def incremental_beg(last, beg):
+    """有历史的代码从最后一根K线当天开始请求（多请求一根用于比对），否则沿用 beg"""
+    return str(last[0]) if last is not None else beg
+
+
+def is_up_to_date(last, end):
+    """最后一根K线已晚于 end（yyyymmdd）时不必请求；等于 end 时仍需请求比对（库中可能是盘中快照）"""
+    return last is not None and last[0] > int(end)
+
+
+def trim_overlap(df, last):
+    """
+    比对并去掉与库中重叠的那根K线，返回 (待写入的K线, 是否需要全量重抓)。
+    df 为按增量起始日请求到的K线（含 date_int、close 列）：收盘价一致时只保留之后的新K线，
+    不一致时原样返回（从库中最后一天起覆盖）；接口中没有这一天时返回需要全量重抓。
+    """
+    if last is None or df is None or df.empty:
+        return df, False
+    date_int = pd.to_numeric(df['date_int']).to_numpy(dtype=np.int64)
+    overlap = date_int == last[0]
+    if not overlap.any():
+        return df, True
+    close = float(pd.to_numeric(df['close']).to_numpy(dtype=np.float64)[overlap][0])
+    if not np.isclose(close, last[1], rtol=CLOSE_RTOL, atol=0.0):
+        print(f"[Warning] 库中 {last[0]} 的K线与接口不一致，从这一天起覆盖")
+        return df.loc[date_int >= last[0]].reset_index(drop=True), False
+    return df.loc[date_int > last[0]].reset_index(drop=True), False
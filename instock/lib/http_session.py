@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 各爬虫共用的 HTTP 会话：连接按主机放在连接池中保持长连接（keep-alive），
+# 同一主机的后续请求复用已建立的 TCP/TLS 连接，不再每页重新握手。
+# 统一设置默认请求头（含 gzip）和默认超时；调用方传入的 headers/timeout 优先。
+#
+#   import instock.lib.http_session as http_session
+#   r = http_session.get(url, params=params)
+
+http_pool_hosts = 32  # 连接池缓存的主机数
+_http_pool_hosts = os.environ.get('http_pool_hosts')
+if _http_pool_hosts is not None:
+    http_pool_hosts = int(_http_pool_hosts)
+
+http_pool_size = 32  # 每个主机保持的最大连接数，应不小于访问同一主机的并发线程数
+_http_pool_size = os.environ.get('http_pool_size')
+if _http_pool_size is not None:
+    http_pool_size = int(_http_pool_size)
+
+http_timeout = 15  # 默认超时（秒）
+_http_timeout = os.environ.get('http_timeout')
+if _http_timeout is not None:
+    http_timeout = float(_http_timeout)
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
+    "Accept": "*/*",
+    "Accept-Encoding": "gzip, deflate",
+    "Accept-Language": "zh-CN,zh;q=0.9",
+    "Connection": "keep-alive",
+}
+
+
+class _Session(requests.Session):
+    """未指定 timeout 的请求使用默认超时，避免个别请求无限等待"""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', http_timeout)
+        return super().request(method, url, **kwargs)
+
+
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+
+
+def new_session():
+    session = _Session()
+    adapter = HTTPAdapter(pool_connections=http_pool_hosts, pool_maxsize=http_pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def get_session():
+    """进程内共用的会话，多线程可同时使用；fork 出的子进程首次调用时新建，不复用父进程的连接"""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = new_session()
+                _session_pid = pid
+    return _session
+
+
+def get(url, params=None, **kwargs):
+    return get_session().get(url, params=params, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    return get_session().post(url, data=data, json=json, **kwargs)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import numpy as np
+import pandas as pd
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 东方财富 push2his K线接口（fields2=f51..f61）的 klines 解析：
+# 每根K线是 "日期,开盘,收盘,最高,最低,成交量,成交额,振幅,涨跌幅,涨跌额,换手率" 一行字符串，
+# 拼成一个缓冲区后由 pd.read_csv 的 C 解析器一次读入（数值列直接为 float64），
+# date_int 由日期按 年*10000+月*100+日 算出，不再逐行 split、逐列 to_numeric 和字符串替换。
+
+NA_VALUES = ['-', '']  # 接口中缺失数值的写法
+
+
+def kline_columns(table_columns):
+    """表结构 columns 配置 → klines 各字段对应的列名（按 'map' 的字段序号排列）"""
+    fields = {conf['map']: conf['en'] for conf in table_columns.values() if isinstance(conf.get('map'), int)}
+    return [fields[i] for i in range(len(fields))]
+
+
+def date_to_int(dates):
+    """datetime64 数组 → yyyymmdd 整数数组"""
+    days = np.asarray(dates, dtype='datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]')
+    return ((years.astype(np.int64) + 1970) * 10000
+            + (months.astype(np.int64) % 12 + 1) * 100
+            + (days - months).astype(np.int64) + 1)
+
+
+def parse_klines(klines, columns):
+    """
+    klines 字符串列表 → DataFrame：columns[0] 为日期（datetime64），其余为 float64（无法解析的值为 NaN），
+    另加 date_int（int64）。
+    """
+    if not klines:
+        frame = pd.DataFrame({col: pd.Series(dtype=np.float64) for col in columns})
+        frame[columns[0]] = pd.Series(dtype='datetime64[ns]')
+        frame['date_int'] = pd.Series(dtype=np.int64)
+        return frame
+
+    date_col = columns[0]
+    buffer = io.StringIO('\n'.join(klines))
+    try:
+        frame = pd.read_csv(buffer, header=None, names=columns, na_values=NA_VALUES, keep_default_na=False,
+                            dtype={col: np.float64 for col in columns[1:]} | {date_col: str}, engine='c')
+    except ValueError:
+        # 个别字段不是数字（接口格式异常）：按字符串读入后逐列转换，无法解析的值为 NaN
+        buffer.seek(0)
+        frame = pd.read_csv(buffer, header=None, names=columns, dtype=str, keep_default_na=False, engine='c')
+        frame[columns[1:]] = frame[columns[1:]].apply(pd.to_numeric, errors='coerce')
+
+    frame[date_col] = pd.to_datetime(frame[date_col], format='%Y-%m-%d')
+    frame['date_int'] = date_to_int(frame[date_col].to_numpy())
+    return frame
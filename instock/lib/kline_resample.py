@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 日线合成周线/月线：批次长表（各代码内按日期升序）一次找出 (代码, 周期) 的分段边界，
+# 用 ufunc.reduceat 按段聚合，不逐代码 groupby/resample。
+# 周线以自然周（周一至周日）内的交易日为一根，月线以自然月为一根；
+# 日期记为周期最后一天（周日/月末），未走完的周期每天重算时落在同一日期上。
+
+FREQS = ('weekly', 'monthly')
+
+
+def period_index(dates, freq):
+    """各日期所在周期的序号（周线：自 1970-01-05 周一起的周数；月线：自 1970-01 起的月数）"""
+    days = pd.to_datetime(dates).to_numpy().astype('datetime64[D]')
+    if freq == 'weekly':
+        # 1970-01-01 为周四，加 3 天后按 7 天取整即以周一为一周起点
+        return (days.astype(np.int64) + 3) // 7
+    if freq == 'monthly':
+        return days.astype('datetime64[M]').astype(np.int64)
+    raise ValueError(f"不支持的周期：{freq}")
+
+
+def period_end(index, freq):
+    """周期序号 → 周期最后一天（datetime64[D]）"""
+    index = np.asarray(index, dtype=np.int64)
+    if freq == 'weekly':
+        return (index * 7 + 3).astype('datetime64[D]')
+    if freq == 'monthly':
+        return (index + 1).astype('datetime64[M]').astype('datetime64[D]') - np.timedelta64(1, 'D')
+    raise ValueError(f"不支持的周期：{freq}")
+
+
+def resample_ohlcv(data, freq, key='code_int'):
+    """
+    把 data（各代码连续存放、代码内按日期升序）合成为周线或月线：
+    开盘取首日，收盘取末日，最高/最低取极值，成交量/成交额求和，其它列（代码、名称等）取末日的值。
+    返回的 date 为周期最后一天（datetime.date，与数据库读出的日线一致），存在 date_int 列时同步改写。
+    """
+    if data is None or data.empty:
+        return pd.DataFrame(columns=data.columns if data is not None else None)
+    size = len(data)
+    keys = data[key].to_numpy()
+    periods = period_index(data['date'], freq)
+    first = np.ones(size, dtype=bool)
+    first[1:] = (keys[1:] != keys[:-1]) | (periods[1:] != periods[:-1])
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], size) - 1
+
+    result = data.iloc[ends].reset_index(drop=True)
+    if 'open' in data.columns:
+        result['open'] = data['open'].to_numpy(dtype=np.float64)[starts]
+    if 'high' in data.columns:
+        result['high'] = np.maximum.reduceat(data['high'].to_numpy(dtype=np.float64), starts)
+    if 'low' in data.columns:
+        result['low'] = np.minimum.reduceat(data['low'].to_numpy(dtype=np.float64), starts)
+    for col in ('volume', 'amount'):
+        if col in data.columns:
+            result[col] = np.add.reduceat(data[col].to_numpy(dtype=np.float64), starts)
+
+    dates = pd.DatetimeIndex(period_end(periods[starts], freq))
+    result['date'] = dates.date
+    if 'date_int' in data.columns:
+        result['date_int'] = dates.strftime('%Y%m%d').astype(np.int64)
+    return result
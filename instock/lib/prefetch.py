@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 预读：当前批次在计算时，后台线程提前查询后面几个批次的数据，
+# 作业总耗时从 I/O + CPU 之和变为接近两者中的较大者。
+
+prefetch_depth = 1  # 提前查询的批次数，0 表示不预读
+_prefetch_depth = os.environ.get('prefetch_depth')
+if _prefetch_depth is not None:
+    prefetch_depth = int(_prefetch_depth)
+
+_END = object()  # args_list 已取完（参数本身可以是 None）
+
+
+def prefetch(fn, args_list, depth=None):
+    """
+    按 args_list 顺序依次产出 (args, fn(*args))，
+    产出当前结果时后面 depth 组参数已在后台线程执行。内存中最多同时持有 depth + 1 个结果
+    （调用方手中的当前结果 + depth 个预读）。
+    """
+    depth = prefetch_depth if depth is None else depth
+    if depth <= 0:
+        for args in args_list:
+            yield args, fn(*args)
+        return
+
+    args_iter = iter(args_list)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=depth, thread_name_prefix='prefetch') as executor:
+        try:
+            for args in args_iter:
+                pending.append((args, executor.submit(fn, *args)))
+                if len(pending) >= depth:
+                    break
+            while pending:
+                args, future = pending.popleft()
+                next_args = next(args_iter, _END)
+                if next_args is not _END:
+                    pending.append((next_args, executor.submit(fn, *next_args)))
+                yield args, future.result()
+        finally:
+            # 调用方提前结束时取消尚未开始的预读
+            for _, future in pending:
+                future.cancel()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 自适应限速（AIMD）：每个站点一个请求速率，响应正常时加性提高（约每秒 +increase 次/秒），
+# 遇到 HTTP 403/429、超时或空数据时乘性降低（×decrease），取代各爬虫里凭经验写死的 sleep。
+# 各站点学到的速率保存在 rate_state_path，下次运行从上次的速率开始，不必每次从保守值爬升。
+#
+#   controller = get_controller(url)
+#   with controller.pace():      # 等到下一个请求时刻；退出时按有无异常记录成功/受限
+#       r = requests.get(url, params=params, timeout=10)
+#       r.raise_for_status()
+
+rate_state_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache',
+                               'rate_control.json')
+_rate_state_path = os.environ.get('rate_state_path')
+if _rate_state_path is not None:
+    rate_state_path = _rate_state_path
+
+# 站点（域名后缀）→ (初始速率, 最低速率, 最高速率)，单位：次/秒；同一域名下的子域名共用一个速率
+ENDPOINTS = {
+    'eastmoney.com': (2.0, 0.5, 20.0),
+    'sina.com.cn': (1.0, 0.3, 10.0),
+    'finance.qq.com': (2.0, 0.5, 15.0),
+    'tenpay.com': (2.0, 0.5, 10.0),
+}
+DEFAULT_ENDPOINT = (1.0, 0.3, 10.0)  # 未配置的站点
+
+THROTTLE_STATUS = (403, 429)
+
+
+class EmptyPayload(Exception):
+    """接口返回成功但数据为空（常见于被限流），按受限处理"""
+
+
+def endpoint_key(url):
+    """url → 所属站点：命中 ENDPOINTS 的域名后缀，否则为主机名本身"""
+    host = urlsplit(url).hostname or url
+    for suffix in ENDPOINTS:
+        if host == suffix or host.endswith(f".{suffix}"):
+            return suffix
+    return host
+
+
+def is_throttled(error):
+    """异常是否说明请求过快：HTTP 403/429、超时、空数据"""
+    if isinstance(error, (EmptyPayload, requests.Timeout)):
+        return True
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) in THROTTLE_STATUS
+
+
+class RateController:
+    """一个站点的 AIMD 速率，线程安全；reserve() 预约下一个请求时刻，record() 反馈结果"""
+
+    def __init__(self, endpoint, rate=None, min_rate=None, max_rate=None, increase=1.0, decrease=0.5,
+                 cooldown=1.0):
+        initial, low, high = ENDPOINTS.get(endpoint, DEFAULT_ENDPOINT)
+        self.endpoint = endpoint
+        self.min_rate = low if min_rate is None else min_rate
+        self.max_rate = high if max_rate is None else max_rate
+        self.rate = min(max(initial if rate is None else rate, self.min_rate), self.max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown  # 两次降速的最小间隔（秒），同一波并发请求一起失败只降一次
+        self._lock = threading.Lock()
+        self._next = 0.0
+        self._last_decrease = float('-inf')
+
+    def reserve(self):
+        """预约下一个请求时刻，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + 1.0 / self.rate
+            return start - now
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def record(self, error=None):
+        """反馈一次请求的结果：error 为空时加速，受限类异常时降速，其它异常不调整"""
+        with self._lock:
+            if error is None:
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+            elif is_throttled(error):
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                    # 已预约的时刻按新速率顺延
+                    self._next = max(self._next, now + 1.0 / self.rate)
+
+    @contextmanager
+    def pace(self):
+        """等待请求时刻；with 块正常结束记为成功，抛出异常时按异常类型记录后继续抛出"""
+        self.wait()
+        try:
+            yield self
+        except Exception as e:
+            self.record(e)
+            raise
+        self.record()
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def _load_states():
+    try:
+        with open(rate_state_path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.warning(f"rate_control._load_states读取限速状态失败：{rate_state_path}{e}")
+        return {}
+
+
+def save_states():
+    """把各站点当前速率合并写入 rate_state_path（先写临时文件再替换）"""
+    with _controllers_lock:
+        if not _controllers:
+            return
+        states = _load_states()
+        for endpoint, controller in _controllers.items():
+            states[endpoint] = {'rate': round(controller.rate, 4), 'updated': int(time.time())}
+    tmp_path = f"{rate_state_path}.tmp.{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(rate_state_path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(states, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, rate_state_path)
+    except Exception as e:
+        logging.warning(f"rate_control.save_states保存限速状态失败：{rate_state_path}{e}")
+
+
+def get_controller(url_or_endpoint):
+    """进程内按站点共用的 RateController，初始速率取上次运行保存的值；进程退出时保存"""
+    endpoint = endpoint_key(url_or_endpoint)
+    with _controllers_lock:
+        controller = _controllers.get(endpoint)
+        if controller is None:
+            if not _controllers:
+                atexit.register(save_states)
+            state = _load_states().get(endpoint) or {}
+            controller = RateController(endpoint, rate=state.get('rate'))
+            _controllers[endpoint] = controller
+        return controller
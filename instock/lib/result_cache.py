@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 计算结果磁盘缓存：键为输入内容的指纹（代码、K线数组、指标集版本等），值为压缩 npz 数组，
+# 输入不变时直接读取结果，不再重算。按最近访问时间（文件 mtime）做 LRU 淘汰，总大小超过上限时删除最久未用的条目。
+# 多进程共用同一目录：写入先写临时文件再 os.replace，读到正在被淘汰的文件时按未命中处理。
+
+cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'results')
+_cache_dir = os.environ.get('result_cache_dir')
+if _cache_dir is not None:
+    cache_dir = _cache_dir
+
+cache_max_mb = 512  # 每个缓存目录的大小上限（MB）
+_cache_max_mb = os.environ.get('result_cache_max_mb')
+if _cache_max_mb is not None:
+    cache_max_mb = int(_cache_max_mb)
+
+_SUFFIX = '.npz'
+
+
+def fingerprint(*parts):
+    """输入内容的指纹：numpy 数组按 dtype、形状和字节计入，其它对象按 repr 计入"""
+    digest = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            array = np.ascontiguousarray(part)
+            digest.update(f"{array.dtype.str}{array.shape}".encode())
+            digest.update(array.tobytes() if array.dtype != object else repr(array.tolist()).encode())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def _pack(arrays):
+    """同 dtype、同形状的多个数组合并为一个矩阵保存（npz 每个成员单独解压，成员少读取快）"""
+    values = list(arrays.values())
+    if len(values) > 1 and all(v.dtype == values[0].dtype and v.shape == values[0].shape for v in values):
+        return {'_names': np.array(list(arrays)), '_stacked': np.stack(values)}
+    return arrays
+
+
+def _unpack(arrays):
+    if '_stacked' in arrays:
+        return dict(zip(arrays['_names'].tolist(), arrays['_stacked']))
+    return arrays
+
+
+class ResultCache:
+    """一个缓存目录：get/put 以指纹为键存取 {名称: 数组}"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = {}  # 文件名 → [大小, 最近访问时间]
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(_SUFFIX) and '.tmp' not in entry.name:
+                    stat = entry.stat()
+                    self._entries[entry.name] = [stat.st_size, stat.st_mtime]
+                    self._total += stat.st_size
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{_SUFFIX}")
+
+    def get(self, key):
+        """命中时返回 {名称: 数组} 并刷新访问时间，未命中返回 None"""
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = _unpack({name: data[name] for name in data.files})
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"result_cache.get读取缓存失败：{path}{e}")
+            return None
+        with self._lock:
+            entry = self._entries.get(f"{key}{_SUFFIX}")
+            if entry is not None:
+                entry[1] = time.time()
+        return arrays
+
+    def put(self, key, arrays):
+        """写入（覆盖同键条目），超过大小上限时按最近访问时间淘汰"""
+        name = f"{key}{_SUFFIX}"
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}{_SUFFIX}"
+        try:
+            np.savez_compressed(tmp_path, **_pack(arrays))
+            os.replace(tmp_path, path)
+            stat = os.stat(path)
+        except Exception as e:
+            logging.warning(f"result_cache.put写入缓存失败：{path}{e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            old = self._entries.get(name)
+            if old is not None:
+                self._total -= old[0]
+            self._entries[name] = [stat.st_size, stat.st_mtime]
+            self._total += stat.st_size
+            if self._total > self.max_bytes:
+                self._evict(self.max_bytes * 0.9)
+
+    def _evict(self, target):
+        """删除最久未访问的条目直到总大小不超过 target（调用方持有锁）"""
+        for name, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._total <= target:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.warning(f"result_cache._evict删除缓存失败：{name}{e}")
+                continue
+            del self._entries[name]
+            self._total -= size
+
+    def clear(self):
+        with self._lock:
+            self._evict(0)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, max_mb=None):
+    """进程内按名称共用的缓存实例，目录为 cache_dir/name，大小上限默认 cache_max_mb"""
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = ResultCache(os.path.join(cache_dir, name), (max_mb or cache_max_mb) * 1024 ** 2)
+            _caches[name] = cache
+        return cache
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 进程池共享行情：主进程把批次的数值列（OHLCV 等）按列连续存放到一块共享内存，
+# 子进程只收到 (共享内存名, 列名, 行数) 和各代码的行偏移量，按偏移量读取，
+# 不再为每个代码 pickle 一个 DataFrame。
+
+
+class SharedFrame:
+    """批次数值列的共享内存副本，形状为 (列数, 行数) 的 float64，主进程负责释放"""
+
+    def __init__(self, data, columns):
+        self.columns = tuple(columns)
+        self.n_rows = len(data)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(8 * len(self.columns) * self.n_rows, 8))
+        array = np.ndarray((len(self.columns), self.n_rows), dtype=np.float64, buffer=self._shm.buf)
+        for i, col in enumerate(self.columns):
+            array[i] = data[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        del array
+
+    @property
+    def handle(self):
+        """传给子进程的描述信息"""
+        return self._shm.name, self.columns, self.n_rows
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_shared_rows(handle, start, end):
+    """子进程：读取共享内存中 [start, end) 行，返回各列为 float64 的 DataFrame"""
+    name, columns, n_rows = handle
+    # 进程池子进程与主进程共用资源跟踪器，共享内存统一由主进程 unlink
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        array = np.ndarray((len(columns), n_rows), dtype=np.float64, buffer=shm.buf)
+        block = np.array(array[:, start:end].T)
+        del array
+    finally:
+        shm.close()
+    return pd.DataFrame(block, columns=list(columns))
+
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import traceback
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 异步写库（write-behind）：计算线程把写库任务放入有界队列后立即返回，
+# 由专门的写库线程执行，计算第 N+1 批时第 N 批在后台落库。
+
+write_behind_workers = 2  # 写库线程数
+write_behind_max_pending = 4  # 队列中最多积压的写库任务数，队列满时提交方阻塞（反压）
+_write_behind_workers = os.environ.get('write_behind_workers')
+if _write_behind_workers is not None:
+    write_behind_workers = int(_write_behind_workers)
+_write_behind_max_pending = os.environ.get('write_behind_max_pending')
+if _write_behind_max_pending is not None:
+    write_behind_max_pending = int(_write_behind_max_pending)
+
+_STOP = object()
+
+
+class WriteBehind:
+    """有界队列 + 写库线程；flush() 等待已提交任务全部完成并报告期间的错误"""
+
+    def __init__(self, workers=None, max_pending=None, name='write_behind'):
+        self.workers = workers or write_behind_workers
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_pending or write_behind_max_pending)
+        self._threads = []
+        self._errors = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is _STOP:
+                    return
+                fn, args, kwargs = task
+                try:
+                    # 约定返回 False 的写库函数（如 executemany_upsert）视为失败
+                    if fn(*args, **kwargs) is False:
+                        raise RuntimeError("写库函数返回 False")
+                except Exception as e:
+                    logging.error(f"{self.name} 写库任务 {getattr(fn, '__name__', fn)} 失败：{e}\n"
+                                  f"{traceback.format_exc()}")
+                    with self._lock:
+                        self._errors.append((getattr(fn, '__name__', repr(fn)), e))
+            finally:
+                self._queue.task_done()
+
+    def submit(self, fn, *args, **kwargs):
+        """提交写库任务；队列已满时阻塞，直到写库线程腾出位置"""
+        if self._closed:
+            raise RuntimeError(f"{self.name} 已关闭")
+        self._start()
+        self._queue.put((fn, args, kwargs))
+
+    def flush(self):
+        """等待所有已提交任务完成，无错误返回 True，否则打印并清空错误后返回 False"""
+        if self._threads:
+            self._queue.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        for fn_name, e in errors:
+            print(f"❌ 异步写库失败 {fn_name}: {e}")
+        return not errors
+
+    def close(self):
+        if self._closed:
+            return True
+        ok = self.flush()
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        return ok
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(name='write_behind'):
+    """进程内共享的写库管道，按进程区分，进程退出时自动 flush"""
+    key = (os.getpid(), name)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None or writer._closed:
+            writer = WriteBehind(name=name)
+            _writers[key] = writer
+    return writer
+
+
+def submit(fn, *args, **kwargs):
+    get_writer().submit(fn, *args, **kwargs)
+
+
+def flush():
+    return get_writer().flush()
+
+
+@atexit.register
+def _close_all():
+    pid = os.getpid()
+    for (writer_pid, _), writer in list(_writers.items()):
+        if writer_pid == pid:
+            writer.close()
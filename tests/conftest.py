@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 在项目运行时，临时将项目路径添加到环境变量
+import os.path
+import sys
+cpath = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.append(cpath)
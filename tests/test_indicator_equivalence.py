@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+import talib as tl
+import instock.core.indicator.calculate_indicator as idr
+from instock.core.indicator.kernels import supertrend
+from instock.benchmark.synthetic import generate_ohlcv
+import indicator_baseline
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# kernels.supertrend 与 get_indicators 对照改写前的逐根循环实现（indicator_baseline）：
+# 固定种子的合成行情，覆盖正常走势、一字板/停滞（开高低收相同）、含 NaN 和K线很少的情况。
+
+
+def supertrend_loop(close, band_ub, band_lb):
+    """改写前 get_indicators 中的 Supertrend 循环（逐根 .iloc 读取），初值为 NaN"""
+    close, band_ub, band_lb = pd.Series(close), pd.Series(band_ub), pd.Series(band_lb)
+    size = len(close)
+    ub = np.empty(size, dtype=np.float64)
+    lb = np.empty(size, dtype=np.float64)
+    st = np.full(size, np.nan)
+    for i in range(size):
+        if i == 0:
+            ub[i] = band_ub.iloc[i]
+            lb[i] = band_lb.iloc[i]
+            st[i] = ub[i] if close.iloc[i] <= ub[i] else lb[i]
+            continue
+        last_close = close.iloc[i - 1]
+        last_ub, last_lb, last_st = ub[i - 1], lb[i - 1], st[i - 1]
+        ub[i] = band_ub.iloc[i] if band_ub.iloc[i] < last_ub or last_close > last_ub else last_ub
+        lb[i] = band_lb.iloc[i] if band_lb.iloc[i] > last_lb or last_close < last_lb else last_lb
+        if last_st == last_ub:
+            st[i] = ub[i] if close.iloc[i] <= ub[i] else lb[i]
+        elif last_st == last_lb:
+            st[i] = lb[i] if close.iloc[i] > lb[i] else ub[i]
+    return ub, lb, st
+
+
+def ohlcv(n_days, seed=0):
+    """单个代码的合成行情（不停牌）"""
+    return generate_ohlcv(1, n_days, seed=seed, suspend_prob=0.0).reset_index(drop=True)
+
+
+def with_flat(data, start=80, length=40):
+    """中间一段价格不动：开高低收相同、成交量为 0"""
+    data = data.copy()
+    end = start + length
+    price = data['close'].iloc[start - 1]
+    data.loc[start:end - 1, ['open', 'high', 'low', 'close']] = price
+    data.loc[start:end - 1, ['volume', 'amount', 'p_change']] = 0.0
+    return data
+
+
+def with_nan(data, rows=(5, 60, 61, 150)):
+    """个别K线的价格、成交量缺失"""
+    data = data.copy()
+    data.loc[list(rows), ['high', 'low', 'close', 'volume']] = np.nan
+    return data
+
+
+FRAMES = {
+    'normal': lambda: ohlcv(250),
+    'flat': lambda: with_flat(ohlcv(250, seed=1)),
+    'all_flat': lambda: with_flat(ohlcv(60, seed=2), start=1, length=59),
+    'nan': lambda: with_nan(ohlcv(250, seed=3)),
+    'short_40': lambda: ohlcv(40, seed=4),
+    'short_1': lambda: ohlcv(1, seed=5),
+}
+
+
+def bands(data):
+    atr = tl.ATR(data['high'].to_numpy(dtype=np.float64), data['low'].to_numpy(dtype=np.float64),
+                 data['close'].to_numpy(dtype=np.float64), timeperiod=14) * 3
+    hl_avg = (data['high'].to_numpy(dtype=np.float64) + data['low'].to_numpy(dtype=np.float64)) / 2.0
+    return data['close'].to_numpy(dtype=np.float64), hl_avg + atr, hl_avg - atr
+
+
+@pytest.mark.parametrize('name', sorted(FRAMES))
+def test_supertrend_kernel_matches_loop(name):
+    close, band_ub, band_lb = bands(FRAMES[name]())
+    for result, expected in zip(supertrend(close, band_ub, band_lb), supertrend_loop(close, band_ub, band_lb)):
+        np.testing.assert_array_equal(result, expected)
+
+
+def test_supertrend_kernel_empty():
+    empty = np.empty(0, dtype=np.float64)
+    for result in supertrend(empty, empty, empty):
+        assert result.shape == (0,)
+
+
+@pytest.mark.parametrize('name', sorted(FRAMES))
+@pytest.mark.parametrize('threshold', [None, 10])
+def test_get_indicators_matches_baseline(name, threshold):
+    data = FRAMES[name]()
+    result = idr.get_indicators(data.copy(), threshold=threshold)
+    expected = indicator_baseline.get_indicators(data.copy(), threshold=threshold)
+
+    assert result is not None and expected is not None
+    assert list(result.index) == list(expected.index)
+    for col in data.columns:
+        pd.testing.assert_series_equal(result[col], expected[col])
+    for col in idr.OUTPUT_COLUMNS:
+        np.testing.assert_allclose(result[col].to_numpy(dtype=np.float64),
+                                   expected[col].to_numpy(dtype=np.float64),
+                                   rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=col)
+
+
+def test_get_indicators_column_selection():
+    data = FRAMES['normal']()
+    columns = ('macd', 'supertrend', 'ma200')
+    result = idr.get_indicators(data.copy(), threshold=None, columns=columns)
+    expected = indicator_baseline.get_indicators(data.copy(), threshold=None)
+    assert list(result.columns) == list(data.columns) + list(columns)
+    for col in columns:
+        np.testing.assert_allclose(result[col].to_numpy(), expected[col].to_numpy(), rtol=1e-9, equal_nan=True)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+import pandas as pd
+import pytest
+from instock.lib.write_behind import WriteBehind
+from instock.core.indicator.incremental_indicator import IndicatorEngine
+from instock.benchmark.synthetic import generate_ohlcv
+
+daily = pytest.importorskip('instock.job.indicators_data_daily')
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 增量模式只在本类型全部写库成功后保存指标状态：写库失败（executemany_upsert 返回 False）时
+# 状态不能领先于数据库，否则下次只计算状态之后的K线，写失败的行再也补不回来。
+
+
+def recent_market(n_codes=3, n_days=80):
+    """最后一根K线为最近交易日的合成行情（不会被“最新数据过旧”过滤）"""
+    start = pd.bdate_range(end=datetime.date.today(), periods=n_days)[0]
+    return generate_ohlcv(n_codes, n_days, seed=11, start=start, suspend_prob=0.0)
+
+
+@pytest.fixture
+def no_state(monkeypatch):
+    """没有指标状态、所有代码全量回放；记录 save_indicator_state 的调用"""
+    market = recent_market()
+    saved = []
+    monkeypatch.setattr(daily, 'load_indicator_state', lambda data_type: ({}, {}, IndicatorEngine(0)))
+    monkeypatch.setattr(daily, 'get_incremental_batch',
+                        lambda batch_codes, data_type, known: ([], pd.DataFrame(),
+                                                               market[market['code_int'].isin(batch_codes)]))
+    monkeypatch.setattr(daily, 'save_indicator_state', lambda data_type, parts: saved.append((data_type, parts)))
+    return sorted(market['code_int'].unique().tolist()), saved
+
+
+@pytest.mark.parametrize('write_ok', [True, False])
+def test_state_saved_only_after_writes_succeed(monkeypatch, no_state, write_ok):
+    codes, saved = no_state
+    written = []
+
+    def upsert(table_name, data, unique_keys=None, conn=None):
+        written.append(len(data))
+        return write_ok
+
+    monkeypatch.setattr(daily, 'executemany_upsert', upsert)
+    writer = WriteBehind(name='test_writer')
+    try:
+        total = daily.run_incremental('stock', codes, batch_size=2, writer=writer)
+    finally:
+        writer.close()
+
+    assert len(written) == 2 and total == sum(written)
+    if write_ok:
+        assert len(saved) == 1 and saved[0][0] == 'stock'
+    else:
+        assert saved == []
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+import talib as tl
+from instock.core.indicator.incremental_indicator import IndicatorEngine
+from instock.core.indicator.cross_section import calculate_panel
+from instock.benchmark.synthetic import generate_ohlcv
+
+__author__ = 'myh '
+__date__ = '2023/3/10 '
+
+# 最高+最低+收盘之和不变、各价格每天不同的K线：按实数算典型价 (最高+最低+收盘)/3 持平，
+# 按浮点算差值为 1e-15 量级的误差。TA-Lib 的 MFI 用 TA_IS_ZERO 把这种差值视为持平（不计入正负资金流），
+# 截面计算和增量引擎也应如此，否则 MFI/MFISMA 在这些天之后与 TA-Lib 不同。
+
+
+def flat_day_market(n_days=120, flat=range(40, 70), base=7.21, seed=7):
+    """单个代码的 (开, 高, 低, 收, 量)；flat 中的交易日最高+最低+收盘（两位小数）都等于 3 * base"""
+    data = generate_ohlcv(1, n_days, seed=seed, suspend_prob=0.0)
+    o, h, l, c, v = (data[col].to_numpy(dtype=np.float64).copy() for col in ('open', 'high', 'low', 'close', 'volume'))
+    rng = np.random.default_rng(seed)
+    for day in flat:
+        up = np.round(rng.uniform(0.0, 0.1), 2)
+        width = np.round(rng.uniform(0.1, 0.3), 2)
+        c[day] = np.round(base + up, 2)
+        o[day] = c[day]
+        h[day] = np.round(c[day] + width, 2)
+        l[day] = np.round(3 * base - h[day] - c[day], 2)
+    return o, h, l, c, v
+
+
+def talib_mfi(h, l, c, v):
+    mfi = tl.MFI(h, l, c, v, timeperiod=14)
+    return mfi, tl.SMA(mfi, timeperiod=30)
+
+
+def test_market_has_float_noise_flat_days():
+    _, h, l, c, _ = flat_day_market()
+    tp = (h + l + c) / 3
+    diff = np.diff(tp)[40:69]  # flat 内相邻两天的典型价之差
+    assert np.all(np.abs(diff) < 1e-9)
+    assert np.any(diff != 0.0)
+
+
+@pytest.mark.parametrize('engine', ['cross_section', 'incremental_replay', 'incremental_step'])
+def test_mfi_matches_talib_on_flat_days(engine):
+    o, h, l, c, v = flat_day_market()
+    panels = [x[np.newaxis, :] for x in (o, h, l, c, v)]
+    if engine == 'cross_section':
+        values = calculate_panel(*panels)
+        mfi, mfisma = values['mfi'][0], values['mfisma'][0]
+    elif engine == 'incremental_replay':
+        values = IndicatorEngine(1).replay(*panels)
+        mfi, mfisma = values['mfi'][0], values['mfisma'][0]
+    else:
+        state = IndicatorEngine(1)
+        mask = np.ones(1, dtype=bool)
+        steps = [state.step(*(panel[:, day] for panel in panels), mask) for day in range(len(c))]
+        mfi = np.array([step['mfi'][0] for step in steps])
+        mfisma = np.array([step['mfisma'][0] for step in steps])
+
+    expected_mfi, expected_mfisma = talib_mfi(h, l, c, v)
+    np.testing.assert_allclose(mfi, expected_mfi, rtol=1e-9, atol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(mfisma, expected_mfisma, rtol=1e-9, atol=1e-9, equal_nan=True)